@@ -84,29 +84,32 @@ GORROS_FALTANTES = [
     }
 ]
 
-def create_product(product_data):
-    """Crear un nuevo producto"""
+def create_products(products_data):
+    """Crear varios productos en una sola solicitud; devuelve un resultado por producto"""
     try:
-        full_product_data = {
-            **product_data,
-            "categoria": "Gorros",
-            "stock": 50,
-            "precio_mayorista": product_data['precio'] * 0.8,  # 20% descuento mayorista
-            "minimo_mayorista": 5,
-            "activo": True
-        }
+        full_products_data = [
+            {
+                **product_data,
+                "categoria": "Gorros",
+                "stock": 50,
+                "precio_mayorista": product_data['precio'] * 0.8,  # 20% descuento mayorista
+                "minimo_mayorista": 5,
+                "activo": True
+            }
+            for product_data in products_data
+        ]
         
-        response = requests.post(f"{API_URL}/productos", json=full_product_data)
+        response = requests.post(f"{API_URL}/productos/bulk", json=full_products_data)
         response.raise_for_status()
-        return response.json()
+        return response.json()['resultados']
     except Exception as e:
-        print(f"Error creando producto: {e}")
-        return None
+        print(f"Error creando productos: {e}")
+        return [{"ok": False, "error": str(e)} for _ in products_data]
 
 def get_current_products():
     """Obtener productos actuales"""
     try:
-        response = requests.get(f"{API_URL}/productos")
+        response = requests.get(f"{API_URL}/productos", params={"todos": "true"})
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -133,13 +136,12 @@ def main():
     print(f"\n🎨 Agregando {len(GORROS_FALTANTES)} gorros con imágenes válidas...")
     created_count = 0
     
-    for gorro in GORROS_FALTANTES:
-        result = create_product(gorro)
-        if result:
+    for gorro, result in zip(GORROS_FALTANTES, create_products(GORROS_FALTANTES)):
+        if result['ok']:
             print(f"✅ Creado: {gorro['nombre']} (ID: {result['id']}) - ${gorro['precio']}")
             created_count += 1
         else:
-            print(f"❌ Error creando: {gorro['nombre']}")
+            print(f"❌ Error creando: {gorro['nombre']} - {result['error']}")
     
     print(f"\n🎉 Proceso completado!")
     print(f"📊 Gorros agregados: {created_count}")
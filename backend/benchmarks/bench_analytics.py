@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark de GET /pedidos/analytics contra armar las métricas desde GET /pedidos.
+
+Agrega pedidos repartidos en 90 días (con una a tres líneas cada uno y estados al
+azar), recalcula los resúmenes diarios como `manage.py backfill-rollups` y mide
+la latencia de /pedidos/analytics para el rango por defecto (30 días) y para los
+90 días. El costo depende de las filas de los resúmenes en el rango (días x
+productos x estados), no de la cantidad de pedidos. Como referencia mide lo que
+se hacía antes: traer todos los pedidos con GET /pedidos?todos=true (y agregarlos
+en una planilla). Las solicitudes pasan por la app completa con el transporte
+ASGI de httpx. Usa SQLite en un archivo temporal, o la base de BENCH_DATABASE_URL
+si está definida. Los pedidos agregados quedan en la base y el recálculo reemplaza
+todos los resúmenes diarios: BENCH_DATABASE_URL debe apuntar a una base
+descartable, nunca a la de la tienda.
+
+Uso (desde backend/):
+    python benchmarks/bench_analytics.py [--pedidos 100000]
+    BENCH_DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_analytics.py
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Base de datos temporal salvo BENCH_DATABASE_URL: debe configurarse antes de importar main.
+# DATABASE_URL se ignora a propósito, porque el benchmark agrega pedidos y recalcula los resúmenes
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+# Los resúmenes se recalculan antes de medir; el traspaso en segundo plano no hace falta
+os.environ["ROLLUP_FOLD_INTERVAL"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+
+import httpx
+
+import main
+import migrations
+from main import PedidoDB, PedidoItemDB, ProductoDB
+
+DIAS = 90
+
+def poblar(total: int):
+    azar = random.Random(42)
+    productos = ProductoDB.__table__
+    pedidos = PedidoDB.__table__
+    lineas = PedidoItemDB.__table__
+    sufijo = time.time_ns()
+    with main.engine.begin() as conexion:
+        ids_productos = conexion.execute(
+            productos.insert().returning(productos.c.id, sort_by_parameter_order=True),
+            [
+                {"nombre": f"Producto {i} {sufijo}", "precio": 1000.0 + i, "categoria": f"Categoría {i % 8}", "stock": None}
+                for i in range(200)
+            ],
+        ).scalars().all()
+        fin = datetime.now()
+        for desde in range(0, total, 10_000):
+            filas, lineas_por_pedido = [], []
+            for n in range(desde, min(desde + 10_000, total)):
+                elegidos = azar.sample(ids_productos, azar.randint(1, 3))
+                cantidades = [azar.randint(1, 50) for _ in elegidos]
+                filas.append({
+                    "nombre": f"Cliente {n}", "email": f"cliente{n}@bench.local", "telefono": "1155550000",
+                    "producto_nombre": f"Producto {elegidos[0]}", "cantidad": sum(cantidades),
+                    "fecha_pedido": fin - timedelta(seconds=azar.randint(0, DIAS * 86400 - 1)),
+                    "estado": azar.choice(main.ESTADOS_PEDIDO),
+                })
+                lineas_por_pedido.append(zip(elegidos, cantidades))
+            ids = conexion.execute(pedidos.insert().returning(pedidos.c.id, sort_by_parameter_order=True), filas).scalars().all()
+            conexion.execute(lineas.insert(), [
+                {"pedido_id": pedido_id, "producto_id": producto_id, "producto_nombre": f"Producto {producto_id}",
+                 "cantidad": cantidad, "precio_unitario": 1000.0}
+                for pedido_id, items in zip(ids, lineas_por_pedido)
+                for producto_id, cantidad in items
+            ])
+
+async def medir(repeticiones: int):
+    transporte = httpx.ASGITransport(app=main.app)
+    rangos = {
+        f"{main.ANALYTICS_DIAS} días": {},
+        f"{DIAS} días": {"desde": (datetime.now() - timedelta(days=DIAS - 1)).date().isoformat()},
+    }
+    latencias = {}
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=600) as http:
+        for rango, parametros in rangos.items():
+            latencias[rango] = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                (await http.get("/pedidos/analytics", params=parametros)).raise_for_status()
+                latencias[rango].append((time.perf_counter() - inicio) * 1000)
+        inicio = time.perf_counter()
+        respuesta = await http.get("/pedidos", params={"todos": True})
+        respuesta.raise_for_status()
+        todos = (time.perf_counter() - inicio) * 1000
+    await main.async_engine.dispose()
+    return latencias, todos, len(respuesta.content)
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pedidos", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+    # Importar main no aplica las migraciones (lo hace el arranque de la app): se aplican acá
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+    poblar(args.pedidos)
+    inicio = time.perf_counter()
+    with main.engine.begin() as conexion:
+        filas_dia, filas_producto = migrations.reconstruir_resumen_pedidos(conexion, main.Base.metadata)
+    backfill = time.perf_counter() - inicio
+
+    latencias, todos, tamanio = asyncio.run(medir(args.repeticiones))
+    print(f"Motor: {main.engine.dialect.name}, {args.pedidos} pedidos en {DIAS} días")
+    print(f"Backfill de los resúmenes: {backfill:.2f} s ({filas_dia} filas por día, {filas_producto} por producto)")
+    for rango, valores in latencias.items():
+        print(f"GET /pedidos/analytics ({rango}): p50 {statistics.median(valores):.1f} ms, máx {max(valores):.1f} ms")
+    print(f"GET /pedidos?todos=true:            {todos:.0f} ms ({tamanio / 2**20:.1f} MiB, sin agregar)")
+
+if __name__ == "__main__":
+    main_bench()
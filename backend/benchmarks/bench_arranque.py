@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque en frío: del proceso nuevo a la primera respuesta.
+
+Mide en procesos nuevos, como en cada worker o cada arranque en Railway:
+
+- el tiempo de `import main`;
+- el tiempo desde lanzar `uvicorn main:app` hasta el primer 200 de GET /health,
+  con una base nueva (se aplican todas las migraciones), con el esquema al día
+  y con DB_MIGRATE_ON_STARTUP=false (migraciones con `manage.py migrate`).
+
+Usa SQLite en un archivo temporal, o la base de BENCH_DATABASE_URL si está
+definida (en ese caso se omite el escenario de base nueva). DATABASE_URL se
+ignora, igual que en los demás benchmarks: la app arranca con las migraciones
+sobre esa base, así que debe ser una descartable.
+
+Uso (desde backend/):
+    python benchmarks/bench_arranque.py [--repeticiones 5]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def entorno(database_url: str, **extra) -> dict:
+    return {**os.environ, "DATABASE_URL": database_url, "PYTHONDONTWRITEBYTECODE": "1", **extra}
+
+def tiempo_import(database_url: str) -> float:
+    codigo = "import time; inicio = time.perf_counter(); import main; print(time.perf_counter() - inicio)"
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=BACKEND, env=entorno(database_url),
+        capture_output=True, text=True, check=True,
+    )
+    return float(salida.stdout.strip().splitlines()[-1]) * 1000
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def primera_respuesta(database_url: str, **extra) -> float:
+    """Milisegundos desde lanzar uvicorn hasta el primer 200 de /health"""
+    puerto = puerto_libre()
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto)],
+        cwd=BACKEND, env=entorno(database_url, **extra), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=1) as http:
+            while True:
+                if proceso.poll() is not None:
+                    raise RuntimeError(f"uvicorn terminó con código {proceso.returncode}")
+                try:
+                    if http.get(f"http://127.0.0.1:{puerto}/health").status_code == 200:
+                        return (time.perf_counter() - inicio) * 1000
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=60)
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    database_url = os.getenv("BENCH_DATABASE_URL")
+    temporal = tempfile.mkdtemp()
+    escenarios = {}
+    if not database_url:
+        database_url = f"sqlite:///{temporal}/bench.db"
+        nuevas = iter(range(args.repeticiones))
+        escenarios["base nueva"] = lambda: primera_respuesta(f"sqlite:///{temporal}/nueva{next(nuevas)}.db")
+    # Deja el esquema al día antes de los demás escenarios
+    primera_respuesta(database_url)
+    escenarios["esquema al día"] = lambda: primera_respuesta(database_url)
+    escenarios["DB_MIGRATE_ON_STARTUP=false"] = lambda: primera_respuesta(database_url, DB_MIGRATE_ON_STARTUP="false")
+
+    print(f"Base: {database_url.split(':', 1)[0]}, {args.repeticiones} repeticiones (mediana, máx en ms)")
+    valores = [tiempo_import(database_url) for _ in range(args.repeticiones)]
+    print(f"{'import main':<46}{statistics.median(valores):>8.0f}{max(valores):>8.0f}")
+    for nombre, medir in escenarios.items():
+        valores = [medir() for _ in range(args.repeticiones)]
+        print(f"{'primera respuesta, ' + nombre:<46}{statistics.median(valores):>8.0f}{max(valores):>8.0f}")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark de GET /productos/buscar.
+
+Carga catálogos de distinto tamaño y mide la latencia de la primera página de
+resultados para búsquedas con distinta selectividad. Usa SQLite (FTS5) en un
+archivo temporal, o Postgres (tsvector + GIN) si BENCH_DATABASE_URL está definida.
+Cada tamaño reemplaza todos los productos de la base: BENCH_DATABASE_URL debe
+apuntar a una base descartable, nunca a la de la tienda.
+
+Uso (desde backend/):
+    python benchmarks/bench_busqueda.py [--tamanios 1000 10000 100000] [--repeticiones 20]
+    BENCH_DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_busqueda.py
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Base de datos temporal salvo BENCH_DATABASE_URL: debe configurarse antes de importar main.
+# DATABASE_URL se ignora a propósito, porque el benchmark vacía la tabla de productos
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import migrations
+from main import ProductoDB
+
+TIPOS = ["Gorro", "Bufanda", "Guantes", "Medias", "Campera"]
+COLORES = [
+    "Verde", "Azul", "Rojo", "Negro", "Blanco", "Gris", "Rosa", "Amarillo", "Naranja", "Violeta",
+    "Turquesa", "Marrón", "Beige", "Burdeos", "Fucsia", "Coral", "Lavanda", "Menta", "Salmón", "Oliva",
+]
+ADJETIVOS = ["Premium", "Clásico", "Elegante", "Invernal", "Urbano", "Suave", "Moderno", "Natural", "Fresco", "Cálido"]
+
+BUSQUEDAS = [
+    ("amplia (1/5 del catálogo)", "gorro"),
+    ("color (1/20)", "marron"),
+    ("tres términos (1/1000)", "bufanda salmón cálido"),
+    ("casi única", "lavanda 4711"),
+]
+
+def poblar(total: int):
+    db = main.SessionLocal()
+    try:
+        db.query(ProductoDB).delete()
+        filas = []
+        for i in range(total):
+            tipo = TIPOS[i % len(TIPOS)]
+            color = COLORES[(i // len(TIPOS)) % len(COLORES)]
+            adjetivo = ADJETIVOS[(i // (len(TIPOS) * len(COLORES))) % len(ADJETIVOS)]
+            filas.append({
+                "nombre": f"{tipo} {color} {adjetivo} {i}",
+                "precio": 2000.0 + (i % 500),
+                "descripcion": f"{tipo} de color {color.lower()}, tejido a mano. Ideal para el invierno.",
+                "imagen_url": f"https://res.cloudinary.com/demo/image/upload/v1/gorros/producto_{i}.jpg",
+                "categoria": tipo,
+                "stock": 50,
+                "activo": True,
+            })
+        db.execute(ProductoDB.__table__.insert(), filas)
+        db.commit()
+        if main.engine.dialect.name == "postgresql":
+            db.execute(main.text("ANALYZE productos"))
+            db.commit()
+    finally:
+        db.close()
+
+async def medir(q: str, repeticiones: int) -> float:
+    """Mediana en ms de la primera página de resultados"""
+    terminos = main.terminos_busqueda(q)
+    tiempos = []
+    async with main.AsyncSessionLocal() as db:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            await main.consultar_busqueda(db, terminos, 21, 0)
+            tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000
+
+async def medir_todas(repeticiones: int):
+    tiempos = [await medir(q, repeticiones) for _, q in BUSQUEDAS]
+    # Cada asyncio.run usa un event loop nuevo: las conexiones del pool no pueden reutilizarse
+    await main.async_engine.dispose()
+    return tiempos
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanios", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+    # Importar main no aplica las migraciones (lo hace el arranque de la app): se aplican acá
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+    print(f"Motor: {main.engine.dialect.name}")
+    print(f"{'búsqueda':<28}" + "".join(f"{total:>12}" for total in args.tamanios) + "   (mediana, ms)")
+    resultados = []
+    for total in args.tamanios:
+        poblar(total)
+        resultados.append(asyncio.run(medir_todas(args.repeticiones)))
+    for i, (nombre, q) in enumerate(BUSQUEDAS):
+        print(f"{nombre:<28}" + "".join(f"{fila[i]:>12.2f}" for fila in resultados))
+
+if __name__ == "__main__":
+    main_bench()
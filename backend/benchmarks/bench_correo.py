@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los emails de pedidos contra un servidor SMTP local.
+
+Crea una ráfaga de pedidos por POST /pedidos (transporte ASGI de httpx), espera a
+que la bandeja de salida los envíe y cuenta cuántos mensajes y cuántas conexiones
+recibió el servidor. Como referencia mide el envío anterior: una conexión nueva
+por email. El servidor es un SMTP mínimo en memoria, sin TLS:
+cada conexión equivale a un handshake TLS en producción. Usa SQLite en un
+archivo temporal, o la base de BENCH_DATABASE_URL si está definida, que debe ser
+una base descartable: los pedidos y sus emails quedan en ella.
+
+Uso (desde backend/):
+    python benchmarks/bench_correo.py [--pedidos 500]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Configuración antes de importar main: base temporal salvo BENCH_DATABASE_URL y email al
+# SMTP local sin credenciales. Ni la base ni el email de la tienda se toman del entorno: los
+# pedidos y los emails que queden en la bandeja de salida no deben llegar a producción
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ["MAIL_SERVER"] = "127.0.0.1"
+os.environ["MAIL_FROM"] = "pedidos@bench.local"
+os.environ["DEFAULT_EMAIL_RECIPIENT"] = "ventas@bench.local"
+for variable in ("MAIL_USERNAME", "MAIL_PASSWORD"):
+    os.environ.pop(variable, None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import correo
+import main
+import migrations
+
+class ServidorSMTP:
+    """SMTP mínimo que acepta todo y cuenta conexiones y mensajes"""
+
+    def __init__(self):
+        self.conexiones = 0
+        self.mensajes = 0
+        self.recibido = asyncio.Event()
+        self.esperados = 0
+
+    async def _atender(self, lector: asyncio.StreamReader, escritor: asyncio.StreamWriter):
+        self.conexiones += 1
+        escritor.write(b"220 bench ESMTP\r\n")
+        while linea := await lector.readline():
+            comando = linea.strip().upper()
+            if comando.startswith((b"EHLO", b"HELO")):
+                escritor.write(b"250-bench\r\n250 8BITMIME\r\n")
+            elif comando == b"DATA":
+                escritor.write(b"354 Fin con <CRLF>.<CRLF>\r\n")
+                await escritor.drain()
+                while (await lector.readline()) != b".\r\n":
+                    pass
+                self.mensajes += 1
+                if self.mensajes >= self.esperados:
+                    self.recibido.set()
+                escritor.write(b"250 OK\r\n")
+            elif comando == b"QUIT":
+                escritor.write(b"221 Adios\r\n")
+                await escritor.drain()
+                break
+            else:
+                escritor.write(b"250 OK\r\n")
+            await escritor.drain()
+        escritor.close()
+
+    async def iniciar(self) -> int:
+        self.servidor = await asyncio.start_server(self._atender, "127.0.0.1", 0)
+        return self.servidor.sockets[0].getsockname()[1]
+
+    def reiniciar(self, esperados: int):
+        self.conexiones = self.mensajes = 0
+        self.esperados = esperados
+        self.recibido.clear()
+
+def crear_producto() -> int:
+    """Producto sin límite de stock para los pedidos del benchmark"""
+    tabla = main.ProductoDB.__table__
+    with main.engine.begin() as conexion:
+        return conexion.execute(
+            tabla.insert().returning(tabla.c.id),
+            {"nombre": f"Gorro Bench {time.time_ns()}", "precio": 2500.0, "categoria": "Gorros", "stock": None},
+        ).scalar_one()
+
+def pedido(i: int, producto_id: int = 1) -> dict:
+    return {
+        "nombre": f"Cliente {i}",
+        "email": f"cliente{i}@bench.local",
+        "telefono": "1155550000",
+        "producto_id": producto_id,
+        "cantidad": 12,
+        "comentarios": "Entrega por la mañana",
+    }
+
+async def medir(total: int):
+    servidor = ServidorSMTP()
+    puerto = await servidor.iniciar()
+    fabrica = lambda: correo.EmisorSMTP("127.0.0.1", puerto, start_tls=False)
+
+    # Envío anterior: una conexión por email
+    servidor.reiniciar(total)
+    emisor = fabrica()
+    inicio = time.perf_counter()
+    for i in range(total):
+        items = [{"producto_nombre": "Gorro Modelo 1", "cantidad": 12}]
+        asunto, html = correo.email_pedido(main.PedidoRequest(**pedido(i)), i, items)
+        await emisor.enviar(main.MAIL_FROM, "ventas@bench.local", asunto, html)
+        await emisor.cerrar()
+    anterior = (time.perf_counter() - inicio, servidor.conexiones, servidor.mensajes)
+
+    # Bandeja de salida: pedidos por la API y envío por una conexión reutilizada
+    servidor.reiniciar(total)
+    producto_id = crear_producto()
+    main.bandeja = main.BandejaSalida(fabrica)
+    main.bandeja.iniciar()
+    transporte = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            inicio = time.perf_counter()
+            for i in range(total):
+                (await cliente.post("/pedidos", json=pedido(i, producto_id))).raise_for_status()
+            pedidos = time.perf_counter() - inicio
+            await asyncio.wait_for(servidor.recibido.wait(), timeout=120)
+            bandeja = (time.perf_counter() - inicio, servidor.conexiones, servidor.mensajes)
+    finally:
+        await main.bandeja.detener()
+        # Los hilos de aiosqlite impiden terminar el proceso si quedan conexiones abiertas
+        await main.async_engine.dispose()
+    return anterior, pedidos, bandeja
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pedidos", type=int, default=500)
+    args = parser.parse_args()
+    # Importar main no aplica las migraciones (lo hace el arranque de la app): se aplican acá
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+    anterior, pedidos, bandeja = asyncio.run(medir(args.pedidos))
+    print(f"Motor: {main.engine.dialect.name}")
+    print(f"{'':<28}{'emails':>8}{'conexiones':>12}{'segundos':>10}")
+    print(f"{'una conexión por email':<28}{anterior[2]:>8}{anterior[1]:>12}{anterior[0]:>10.2f}")
+    print(f"{'bandeja de salida':<28}{bandeja[2]:>8}{bandeja[1]:>12}{bandeja[0]:>10.2f}")
+    print(f"({args.pedidos} pedidos registrados en {pedidos:.2f} s)")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memoria de GET /pedidos/export.
+
+Agrega lotes de pedidos de distinto tamaño (con dos líneas por pedido), cada uno
+con fechas de un año distinto, y mide el pico de memoria de Python (tracemalloc)
+y el tiempo de exportar en NDJSON y CSV los pedidos de ese año, consumiendo el
+generador de la respuesta igual que lo hace StreamingResponse. Como referencia
+mide GET /pedidos?todos=true, que arma en memoria todos los pedidos de la base.
+Usa SQLite en un archivo temporal, o la base de BENCH_DATABASE_URL si está
+definida. No se borra ningún pedido, pero los agregados quedan en la base:
+BENCH_DATABASE_URL debe apuntar a una base descartable, nunca a la de la tienda.
+
+Uso (desde backend/):
+    python benchmarks/bench_export.py [--tamanios 1000 100000]
+    BENCH_DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_export.py
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Base de datos temporal salvo BENCH_DATABASE_URL: debe configurarse antes de importar main.
+# DATABASE_URL se ignora a propósito, porque el benchmark agrega hasta cientos de miles de pedidos
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+
+import main
+import migrations
+from main import PedidoDB, PedidoItemDB
+
+def poblar(total: int, anio: int):
+    pedidos = PedidoDB.__table__
+    lineas = PedidoItemDB.__table__
+    inicio = datetime(anio, 1, 1)
+    with main.engine.begin() as conexion:
+        for desde in range(0, total, 10_000):
+            numeros = range(desde, min(desde + 10_000, total))
+            ids = conexion.execute(pedidos.insert().returning(pedidos.c.id, sort_by_parameter_order=True), [
+                {
+                    "nombre": f"Cliente {n}", "email": f"cliente{n}@bench.local", "telefono": "1155550000",
+                    "producto_nombre": "Gorro Modelo 1 y 1 productos más", "cantidad": 15,
+                    "comentarios": "Entrega por la mañana", "fecha_pedido": inicio + timedelta(seconds=n),
+                    "estado": "pendiente",
+                }
+                for n in numeros
+            ]).scalars().all()
+            conexion.execute(lineas.insert(), [
+                {"pedido_id": i, "producto_id": p, "producto_nombre": f"Gorro Modelo {p}", "cantidad": 5 * p, "precio_unitario": 2500.0}
+                for i in ids
+                for p in (1, 2)
+            ])
+
+async def consumir(generador) -> int:
+    total = 0
+    async for bloque in generador:
+        total += len(bloque)
+    return total
+
+async def todos_en_memoria() -> int:
+    async with main.AsyncSessionLocal() as db:
+        respuesta = await main.get_pedidos(limit=main.DEFAULT_PAGE_SIZE, cursor=None, todos=True, db=db)
+    return len(respuesta["pedidos"])
+
+async def medir(anio: int):
+    desde, hasta = datetime(anio, 1, 1), datetime(anio + 1, 1, 1)
+    resultados = []
+    for nombre, funcion in (
+        ("export ndjson", lambda: consumir(main.exportar_ndjson(desde, hasta))),
+        ("export csv", lambda: consumir(main.exportar_csv(desde, hasta))),
+        ("/pedidos?todos=true", todos_en_memoria),
+    ):
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        await funcion()
+        duracion = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados.append((nombre, pico / 2**20, duracion))
+    # Cada asyncio.run usa un event loop nuevo: las conexiones del pool no pueden reutilizarse
+    await main.async_engine.dispose()
+    return resultados
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanios", type=int, nargs="+", default=[1_000, 100_000])
+    args = parser.parse_args()
+    # Importar main no aplica las migraciones (lo hace el arranque de la app): se aplican acá
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+    print(f"Motor: {main.engine.dialect.name}")
+    print(f"{'pedidos':>9}  {'':<22}{'pico MiB':>10}{'segundos':>10}")
+    for anio, total in enumerate(args.tamanios, start=1990):
+        poblar(total, anio)
+        for nombre, pico, duracion in asyncio.run(medir(anio)):
+            print(f"{total:>9}  {nombre:<22}{pico:>10.1f}{duracion:>10.2f}")
+
+if __name__ == "__main__":
+    main_bench()
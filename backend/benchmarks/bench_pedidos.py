@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark de POST /pedidos: commit por solicitud contra group commit.
+
+Lanza una ráfaga de pedidos desde clientes concurrentes y mide pedidos por
+segundo y latencia (p50/p99) con cada modo de escritura: el habitual, un commit
+por pedido, y PEDIDOS_GROUP_COMMIT, que junta los pedidos de unos milisegundos en
+un INSERT de varias filas y un solo commit. Los pedidos son de productos sin
+límite de stock. Las solicitudes pasan por la app completa con el transporte ASGI
+de httpx. Usa SQLite en un archivo temporal, o la base de BENCH_DATABASE_URL si
+está definida. Los productos y pedidos creados quedan en la base:
+BENCH_DATABASE_URL debe apuntar a una base descartable, nunca a la de la tienda.
+
+Uso (desde backend/):
+    python benchmarks/bench_pedidos.py [--pedidos 2000] [--clientes 100] [--ventana-ms 5]
+    BENCH_DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_pedidos.py
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Base de datos temporal salvo BENCH_DATABASE_URL: debe configurarse antes de importar main.
+# DATABASE_URL se ignora a propósito, porque el benchmark agrega productos y pedidos
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import main
+import migrations
+from main import ProductoDB
+
+def crear_productos(total: int) -> list:
+    tabla = ProductoDB.__table__
+    sufijo = time.time_ns()
+    filas = [
+        {"nombre": f"Producto {i} {sufijo}", "precio": 1000.0, "categoria": "Bench", "stock": None}
+        for i in range(total)
+    ]
+    with main.engine.begin() as conexion:
+        return conexion.execute(tabla.insert().returning(tabla.c.id, sort_by_parameter_order=True), filas).scalars().all()
+
+async def rafaga(total: int, clientes: int, productos: list):
+    """Pedidos/s y latencias (ms) de `total` pedidos repartidos entre `clientes`"""
+    latencias = []
+    pendientes = iter(range(total))
+
+    async def cliente(http: httpx.AsyncClient):
+        for n in pendientes:
+            cuerpo = {
+                "nombre": f"Cliente {n}", "email": f"cliente{n}@bench.local", "telefono": "1155550000",
+                "producto_id": productos[n % len(productos)], "cantidad": 1 + n % 5,
+            }
+            inicio = time.perf_counter()
+            respuesta = await http.post("/pedidos", json=cuerpo)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            respuesta.raise_for_status()
+
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60) as http:
+        inicio = time.perf_counter()
+        await asyncio.gather(*[cliente(http) for _ in range(clientes)])
+        duracion = time.perf_counter() - inicio
+    await main.ingesta_pedidos.detener()
+    # Cada asyncio.run usa un event loop nuevo: las conexiones del pool no pueden reutilizarse
+    await main.async_engine.dispose()
+    latencias.sort()
+    return total / duracion, statistics.median(latencias), latencias[int(len(latencias) * 0.99) - 1]
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pedidos", type=int, default=2000)
+    parser.add_argument("--clientes", type=int, default=100)
+    parser.add_argument("--ventana-ms", type=float, default=main.PEDIDOS_GROUP_COMMIT_MS)
+    args = parser.parse_args()
+    # Importar main no aplica las migraciones (lo hace el arranque de la app): se aplican acá
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+    productos = crear_productos(50)
+    main.PEDIDOS_GROUP_COMMIT_MS = args.ventana_ms
+    print(f"Motor: {main.engine.dialect.name}, {args.pedidos} pedidos, {args.clientes} clientes concurrentes")
+    print(f"{'modo':<32}{'pedidos/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for modo, group_commit in (("commit por solicitud", False), (f"group commit ({args.ventana_ms:g} ms)", True)):
+        main.PEDIDOS_GROUP_COMMIT = group_commit
+        por_segundo, p50, p99 = asyncio.run(rafaga(args.pedidos, args.clientes, productos))
+        print(f"{modo:<32}{por_segundo:>10.0f}{p50:>9.1f}{p99:>9.1f}")
+
+if __name__ == "__main__":
+    main_bench()
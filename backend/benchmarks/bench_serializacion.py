@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serialización del listado de productos.
+
+Compara el camino anterior (una instancia ORM y un modelo Producto por fila, y
+luego la validación de response_model + JSONResponse) con el camino rápido de
+get_productos (tuplas de columnas codificadas directo a JSON). Verifica además
+que ambos produzcan exactamente los mismos bytes.
+
+Uso (desde backend/):
+    python benchmarks/bench_serializacion.py [--tamanios 10000 100000] [--repeticiones 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+# Base de datos temporal: debe configurarse antes de importar main
+_tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/bench.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import main
+import migrations
+from main import ProductoDB, Producto, COLUMNAS_PRODUCTO
+
+def poblar(total: int):
+    """Dejar exactamente `total` productos activos en la base"""
+    db = main.SessionLocal()
+    try:
+        db.query(ProductoDB).delete()
+        filas = [
+            {
+                "nombre": f"Gorro de prueba {i}",
+                "precio": 2000.0 + (i % 500),
+                "descripcion": f"Gorro tejido número {i}. Material premium, muy cómodo.",
+                "imagen_url": f"https://res.cloudinary.com/demo/image/upload/v1/gorros/producto_{i}.jpg",
+                "categoria": "Gorros" if i % 3 else "Bufandas",
+                "stock": i % 50,
+                "precio_mayorista": 1600.0 + (i % 500),
+                "minimo_mayorista": 5,
+                "activo": True,
+            }
+            for i in range(total)
+        ]
+        db.execute(ProductoDB.__table__.insert(), filas)
+        db.commit()
+    finally:
+        db.close()
+
+adaptador = TypeAdapter(List[Producto])
+
+def camino_anterior() -> bytes:
+    db = main.SessionLocal()
+    try:
+        productos_db = db.query(ProductoDB).filter(ProductoDB.activo == True).order_by(ProductoDB.id.desc()).all()
+        productos = [
+            Producto(
+                id=p.id,
+                nombre=p.nombre,
+                precio=p.precio,
+                descripcion=p.descripcion,
+                imagen_url=p.imagen_url,
+                categoria=p.categoria,
+                stock=p.stock,
+                precio_mayorista=p.precio_mayorista,
+                minimo_mayorista=p.minimo_mayorista or 1,
+                activo=p.activo,
+            )
+            for p in productos_db
+        ]
+        # Lo que hacía FastAPI con response_model=List[Producto]
+        validados = adaptador.validate_python(productos)
+        return main.JSONResponse(content=jsonable_encoder(validados)).body
+    finally:
+        db.close()
+
+def camino_rapido() -> bytes:
+    db = main.SessionLocal()
+    try:
+        filas = db.query(*COLUMNAS_PRODUCTO).filter(ProductoDB.activo == True).order_by(ProductoDB.id.desc()).all()
+        return main.encode_json([main.producto_a_dict(fila) for fila in filas])
+    finally:
+        db.close()
+
+def medir(funcion, repeticiones: int) -> float:
+    """Mejor tiempo en segundos de varias repeticiones"""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanios", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+    # Importar main no aplica las migraciones (lo hace el arranque de la app): se aplican acá
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+    print(f"Codificador JSON: {'orjson' if main.orjson is not None else 'json'}")
+    print(f"{'productos':>10} {'anterior (ms)':>14} {'rápido (ms)':>12} {'aceleración':>12}")
+    for total in args.tamanios:
+        poblar(total)
+        if camino_anterior() != camino_rapido():
+            print(f"❌ Las respuestas difieren con {total} productos")
+            sys.exit(1)
+        anterior = medir(camino_anterior, args.repeticiones)
+        rapido = medir(camino_rapido, args.repeticiones)
+        print(f"{total:>10} {anterior * 1000:>14.1f} {rapido * 1000:>12.1f} {anterior / rapido:>11.1f}x")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark de concurrencia de la reserva de stock en POST /pedidos.
+
+Muchos clientes concurrentes piden el mismo producto (un SKU "caliente" con stock
+limitado) hasta agotarlo. La mitad de los pedidos son carritos que además llevan
+otros productos, enviados en orden aleatorio, para ejercitar el orden fijo de los
+bloqueos. Al final verifica que no hubo sobreventa (unidades vendidas + stock
+final == stock inicial, stock final >= 0) ni errores que no sean 409 por falta de
+stock, y muestra el throughput en ventanas de medio segundo.
+
+Las solicitudes pasan por la app completa con el transporte ASGI de httpx. Usa
+SQLite en un archivo temporal, o la base de BENCH_DATABASE_URL si está definida (en
+Postgres la contención es por bloqueo de fila; en SQLite, por la base entera).
+Los productos y pedidos creados quedan en la base: BENCH_DATABASE_URL debe apuntar
+a una base descartable, nunca a la de la tienda.
+
+Uso (desde backend/):
+    python benchmarks/bench_stock.py [--clientes 50] [--stock 2000]
+    BENCH_DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_stock.py
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Base de datos temporal salvo BENCH_DATABASE_URL: debe configurarse antes de importar main.
+# DATABASE_URL se ignora a propósito, porque el benchmark agrega productos, descuenta su stock y crea pedidos
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import func, select
+
+import main
+import migrations
+from main import PedidoItemDB, ProductoDB
+
+VENTANA = 0.5  # Segundos por ventana de throughput
+
+def crear_productos(stock: int, otros: int):
+    """SKU caliente con `stock` unidades y `otros` productos sin límite de stock"""
+    tabla = ProductoDB.__table__
+    sufijo = time.time_ns()
+    filas = [{"nombre": f"SKU caliente {sufijo}", "precio": 1000.0, "categoria": "Bench", "stock": stock}]
+    filas += [
+        {"nombre": f"SKU {i} {sufijo}", "precio": 500.0, "categoria": "Bench", "stock": None}
+        for i in range(otros)
+    ]
+    with main.engine.begin() as conexion:
+        ids = conexion.execute(tabla.insert().returning(tabla.c.id, sort_by_parameter_order=True), filas).scalars().all()
+    return ids[0], ids[1:]
+
+def vendidos(caliente: int):
+    with main.engine.connect() as conexion:
+        stock = conexion.execute(select(ProductoDB.stock).where(ProductoDB.id == caliente)).scalar_one()
+        unidades = conexion.execute(
+            select(func.coalesce(func.sum(PedidoItemDB.cantidad), 0)).where(PedidoItemDB.producto_id == caliente)
+        ).scalar_one()
+    return stock, unidades
+
+async def cliente(http: httpx.AsyncClient, n: int, caliente: int, otros: list, azar: random.Random, registro: dict):
+    while True:
+        items = [{"producto_id": caliente, "cantidad": azar.randint(1, 3)}]
+        if azar.random() < 0.5:
+            items += [{"producto_id": p, "cantidad": azar.randint(1, 10)} for p in azar.sample(otros, 2)]
+            azar.shuffle(items)
+        respuesta = await http.post("/pedidos", json={
+            "nombre": f"Cliente {n}", "email": f"cliente{n}@bench.local", "telefono": "1155550000", "items": items,
+        })
+        if respuesta.status_code == 200:
+            registro["aceptados"].append(time.perf_counter())
+        elif respuesta.status_code == 409:
+            registro["sin_stock"] += 1
+            # Agotado: el cliente deja de pedir; con stock parcial reintenta con otra cantidad
+            if respuesta.json()["detail"]["disponible"] == 0:
+                return
+        else:
+            registro["errores"].append(f"{respuesta.status_code} {respuesta.text[:200]}")
+            return
+
+async def medir(clientes: int, stock: int):
+    caliente, otros = crear_productos(stock, 20)
+    registro = {"aceptados": [], "sin_stock": 0, "errores": []}
+    azar = random.Random(42)
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60) as http:
+        inicio = time.perf_counter()
+        await asyncio.gather(*[
+            cliente(http, n, caliente, otros, random.Random(azar.random()), registro) for n in range(clientes)
+        ])
+        duracion = time.perf_counter() - inicio
+    await main.async_engine.dispose()
+    return caliente, inicio, duracion, registro
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=2000)
+    args = parser.parse_args()
+    # Importar main no aplica las migraciones (lo hace el arranque de la app): se aplican acá
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+    caliente, inicio, duracion, registro = asyncio.run(medir(args.clientes, args.stock))
+    stock_final, unidades = vendidos(caliente)
+
+    ventanas = [0] * (int(duracion / VENTANA) + 1)
+    for instante in registro["aceptados"]:
+        ventanas[int((instante - inicio) / VENTANA)] += 1
+    completas = [total / VENTANA for total in ventanas[:-1]] or [len(registro["aceptados"]) / duracion]
+
+    print(f"Motor: {main.engine.dialect.name}, {args.clientes} clientes, stock inicial {args.stock}")
+    print(f"Pedidos aceptados:     {len(registro['aceptados'])} en {duracion:.2f} s")
+    print(f"Rechazos sin stock:    {registro['sin_stock']}")
+    print(f"Otros errores:         {len(registro['errores'])}")
+    for error in registro["errores"][:5]:
+        print(f"   {error}")
+    print(f"Unidades vendidas:     {unidades}, stock final {stock_final}")
+    print(f"Throughput (pedidos/s por ventana de {VENTANA} s): "
+          f"mediana {statistics.median(completas):.0f}, mín {min(completas):.0f}, máx {max(completas):.0f}")
+    sin_sobreventa = stock_final >= 0 and unidades + stock_final == args.stock
+    print(f"Sin sobreventa:        {'sí' if sin_sobreventa else 'NO'}")
+    if not sin_sobreventa or registro["errores"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_bench()
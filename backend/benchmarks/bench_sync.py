@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark de POST /productos/sync.
+
+Carga catálogos de distinto tamaño y mide la resincronización completa del
+mismo catálogo (sin cambios) y un plan con dry_run donde cambia el 1% de los
+productos. La solicitud pasa por la app completa (parseo del JSON, validación
+y diff) mediante el transporte ASGI de httpx. Usa SQLite en un archivo
+temporal, o la base de BENCH_DATABASE_URL si está definida. Cada tamaño reemplaza
+todos los productos y la sincronización completa da de baja los que no están en
+el catálogo: BENCH_DATABASE_URL debe apuntar a una base descartable, nunca a la
+de la tienda.
+
+Uso (desde backend/):
+    python benchmarks/bench_sync.py [--tamanios 1000 10000] [--repeticiones 5]
+    BENCH_DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_sync.py
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Base de datos temporal salvo BENCH_DATABASE_URL: debe configurarse antes de importar main.
+# DATABASE_URL se ignora a propósito, porque el benchmark vacía la tabla de productos
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import main
+import migrations
+from main import ProductoDB
+
+TIPOS = ["Gorro", "Bufanda", "Guantes", "Medias", "Campera"]
+
+def catalogo(total: int) -> list:
+    return [
+        {
+            "nombre": f"{TIPOS[i % len(TIPOS)]} Modelo {i}",
+            "precio": 2000.0 + (i % 500),
+            "descripcion": "Tejido a mano. Ideal para el invierno.",
+            "imagen_url": f"https://res.cloudinary.com/demo/image/upload/v1/gorros/producto_{i}.jpg",
+            "categoria": TIPOS[i % len(TIPOS)],
+            "stock": 50,
+            "activo": True,
+        }
+        for i in range(total)
+    ]
+
+def poblar(productos: list):
+    db = main.SessionLocal()
+    try:
+        db.query(ProductoDB).delete()
+        db.execute(ProductoDB.__table__.insert(), productos)
+        db.commit()
+    finally:
+        db.close()
+
+async def medir(productos: list, repeticiones: int):
+    """Mediana en ms de la resincronización sin cambios y del dry_run con 1% de cambios"""
+    modificados = [
+        {**producto, "precio": producto["precio"] + 1} if i % 100 == 0 else producto
+        for i, producto in enumerate(productos)
+    ]
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        resultados = []
+        for cuerpo, params in (({"productos": productos}, {}), ({"productos": modificados}, {"dry_run": "true"})):
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                respuesta = await cliente.post("/productos/sync", json=cuerpo, params=params)
+                tiempos.append(time.perf_counter() - inicio)
+                respuesta.raise_for_status()
+            resultados.append(statistics.median(tiempos) * 1000)
+    # Cada asyncio.run usa un event loop nuevo: las conexiones del pool no pueden reutilizarse
+    await main.async_engine.dispose()
+    return resultados
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanios", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+    # Importar main no aplica las migraciones (lo hace el arranque de la app): se aplican acá
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+    print(f"Motor: {main.engine.dialect.name}")
+    print(f"{'productos':>10}{'sin cambios':>14}{'dry_run 1%':>14}   (mediana, ms)")
+    for total in args.tamanios:
+        productos = catalogo(total)
+        poblar(productos)
+        sin_cambios, plan = asyncio.run(medir(productos, args.repeticiones))
+        print(f"{total:>10}{sin_cambios:>14.1f}{plan:>14.1f}")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,164 @@
+"""
+Emails de pedidos.
+
+La plantilla se compila una sola vez al importar el módulo. EmisorSMTP mantiene
+una conexión SMTP autenticada y la reutiliza entre mensajes: una ráfaga de
+pedidos se envía con un solo handshake TLS. Si el servidor cerró la conexión
+(por inactividad o por límite de mensajes), se reconecta y se reintenta el envío
+una vez antes de informar el error.
+"""
+
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import List, Optional, Tuple
+
+import aiosmtplib
+from jinja2 import Template
+
+PLANTILLA_PEDIDO = Template("""
+        <html>
+        <body style="font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px;">
+            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+                <div style="text-align: center; margin-bottom: 30px;">
+                    <h1 style="color: #f97316; margin: 0;">🛒 Nuevo Pedido - Distribuidora Alegría</h1>
+                    <p style="color: #666; margin: 10px 0;">🌈 Mayorista de Juguetes 🎨</p>
+                </div>
+
+                <div style="background: linear-gradient(135deg, #fed7aa 0%, #fef3c7 100%); padding: 20px; border-radius: 8px; margin-bottom: 20px;">
+                    <h2 style="color: #1f2937; margin: 0 0 15px 0;">📦 Detalles del Pedido #{{ pedido_id }}</h2>
+                    <p style="margin: 5px 0;"><strong>📅 Fecha:</strong> {{ fecha }}</p>
+                </div>
+
+                <div style="background-color: #f0fdf4; border-left: 4px solid #22c55e; padding: 20px; margin-bottom: 20px;">
+                    <h3 style="color: #15803d; margin: 0 0 15px 0;">👤 Información del Cliente</h3>
+                    <p style="margin: 5px 0;"><strong>Nombre:</strong> {{ nombre }}</p>
+                    <p style="margin: 5px 0;"><strong>Email:</strong> {{ email }}</p>
+                    <p style="margin: 5px 0;"><strong>Teléfono:</strong> {{ telefono }}</p>
+                </div>
+
+                <div style="background-color: #eff6ff; border-left: 4px solid #3b82f6; padding: 20px; margin-bottom: 20px;">
+                    {% if items|length == 1 %}
+                    <h3 style="color: #1d4ed8; margin: 0 0 15px 0;">🎁 Producto Solicitado</h3>
+                    <p style="margin: 5px 0;"><strong>Producto:</strong> {{ items[0].producto_nombre }}</p>
+                    <p style="margin: 5px 0;"><strong>Cantidad:</strong> {{ items[0].cantidad }} unidades</p>
+                    {% else %}
+                    <h3 style="color: #1d4ed8; margin: 0 0 15px 0;">🎁 Productos Solicitados ({{ items|length }})</h3>
+                    {% for item in items %}
+                    <p style="margin: 5px 0;"><strong>{{ item.producto_nombre }}:</strong> {{ item.cantidad }} unidades</p>
+                    {% endfor %}
+                    {% endif %}
+                    {% if comentarios %}
+                    <p style="margin: 15px 0 5px 0;"><strong>Comentarios:</strong></p>
+                    <p style="background-color: #f8fafc; padding: 10px; border-radius: 5px; margin: 5px 0;">{{ comentarios }}</p>
+                    {% endif %}
+                </div>
+
+                <div style="background-color: #fef3c7; border: 1px solid #f59e0b; padding: 15px; border-radius: 8px; margin: 20px 0;">
+                    <p style="margin: 0; color: #92400e; font-weight: bold;">⚡ Acción requerida:</p>
+                    <p style="margin: 5px 0; color: #92400e;">Contactar al cliente lo antes posible para confirmar disponibilidad y coordinar entrega.</p>
+                </div>
+
+                <div style="text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb;">
+                    <p style="color: #6b7280; font-size: 14px; margin: 0;">Distribuidora Alegría - Mayorista de Juguetes</p>
+                    <p style="color: #6b7280; font-size: 12px; margin: 5px 0 0 0;">Este email fue generado automáticamente desde el sistema de pedidos</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """)
+
+def email_pedido(pedido, pedido_id: int, items: List[dict], fecha: Optional[datetime] = None) -> Tuple[str, str]:
+    """Asunto y cuerpo HTML del aviso de un pedido nuevo; `items` son las líneas reservadas"""
+    html = PLANTILLA_PEDIDO.render(
+        pedido_id=pedido_id,
+        fecha=(fecha or datetime.now()).strftime("%d/%m/%Y %H:%M"),
+        nombre=pedido.nombre,
+        email=pedido.email,
+        telefono=pedido.telefono,
+        items=items,
+        comentarios=pedido.comentarios,
+    )
+    if len(items) == 1:
+        return f"🛒 Nuevo Pedido #{pedido_id} - {items[0]['producto_nombre']}", html
+    return f"🛒 Nuevo Pedido #{pedido_id} - {len(items)} productos", html
+
+def es_rechazo_definitivo(error: Exception) -> bool:
+    """Errores que no se resuelven reintentando: el servidor rechazó al destinatario"""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code in (550, 551, 553)
+
+class EmisorSMTP:
+    """Envío de mensajes por una conexión SMTP que se abre al primer envío y se reutiliza"""
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        start_tls: bool = True,
+        use_tls: bool = False,
+        timeout: float = 30.0,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.smtp: Optional[aiosmtplib.SMTP] = None
+        self.conexiones = 0  # Conexiones abiertas desde el inicio (handshakes)
+
+    def conectado(self) -> bool:
+        return self.smtp is not None and self.smtp.is_connected
+
+    async def _conectar(self):
+        await self.cerrar()
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls,
+            timeout=self.timeout,
+        )
+        await smtp.connect()
+        try:
+            if self.username:
+                await smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self.smtp = smtp
+        self.conexiones += 1
+
+    async def enviar(self, remitente: str, destinatario: str, asunto: str, html: str):
+        mensaje = MIMEMultipart("alternative")
+        mensaje["Subject"] = asunto
+        mensaje["From"] = remitente
+        mensaje["To"] = destinatario
+        mensaje.attach(MIMEText(html, "html"))
+
+        reconectado = not self.conectado()
+        if reconectado:
+            await self._conectar()
+        try:
+            await self.smtp.send_message(mensaje)
+        except aiosmtplib.SMTPServerDisconnected:
+            # La conexión reutilizada estaba cerrada del lado del servidor
+            if reconectado:
+                raise
+            await self._conectar()
+            await self.smtp.send_message(mensaje)
+
+    async def cerrar(self):
+        """Cerrar la conexión (QUIT); el próximo envío abre otra"""
+        smtp, self.smtp = self.smtp, None
+        if smtp is None or not smtp.is_connected:
+            return
+        try:
+            await smtp.quit()
+        except Exception:
+            smtp.close()
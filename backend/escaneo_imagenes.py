@@ -0,0 +1,173 @@
+"""
+Verificación de las URLs de imagen de los productos.
+
+Un verificador recibe una URL y devuelve un ResultadoVerificacion con el status,
+el tamaño y el tipo de contenido del recurso. escanear() recorre muchas URLs con
+concurrencia acotada y entrega los resultados a medida que llegan.
+
+Los verificadores son intercambiables: VerificadorHTTP hace HEAD (con una sola
+conexión reutilizada por host gracias al pool de httpx) y acepta un transporte
+propio, de modo que puede apuntarse a un servidor local o a una app ASGI de
+prueba; VerificadorLocal resuelve en disco las imágenes del almacenamiento local
+y delega el resto.
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+import httpx
+
+@dataclass
+class ResultadoVerificacion:
+    ok: bool
+    status: Optional[int] = None
+    bytes: Optional[int] = None
+    tipo_contenido: Optional[str] = None
+    error: Optional[str] = None
+
+class Verificador:
+    """Interfaz: `verificar(url)` devuelve el estado de una imagen sin descargarla"""
+
+    async def verificar(self, url: str) -> ResultadoVerificacion:
+        raise NotImplementedError
+
+    async def cerrar(self):
+        pass
+
+def resultado_http(respuesta: httpx.Response) -> ResultadoVerificacion:
+    tipo = respuesta.headers.get("content-type", "").split(";")[0].strip() or None
+    tamanio = respuesta.headers.get("content-length")
+    rango = respuesta.headers.get("content-range")
+    if rango and "/" in rango:
+        # Respuesta 206 a un GET con Range: el tamaño total va después de la barra
+        tamanio = rango.rsplit("/", 1)[1]
+    resultado = ResultadoVerificacion(
+        ok=False,
+        status=respuesta.status_code,
+        bytes=int(tamanio) if tamanio and tamanio.isdigit() else None,
+        tipo_contenido=tipo,
+    )
+    if not respuesta.is_success:
+        resultado.error = f"HTTP {respuesta.status_code}"
+    elif tipo and not tipo.startswith("image/"):
+        # Páginas de error servidas con 200
+        resultado.error = f"No es una imagen ({tipo})"
+    elif resultado.bytes == 0:
+        resultado.error = "Imagen vacía"
+    else:
+        resultado.ok = True
+    return resultado
+
+class VerificadorHTTP(Verificador):
+    """HEAD a cada URL con un cliente httpx compartido.
+
+    Los servidores que no implementan HEAD (405/501) se consultan con un GET del
+    primer byte. Los errores de red se reintentan una vez.
+    """
+
+    def __init__(
+        self,
+        concurrencia: int = 20,
+        timeout: float = 10.0,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.cliente = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia),
+            timeout=httpx.Timeout(timeout),
+            follow_redirects=True,
+            transport=transport,
+            headers={"User-Agent": "ecommerce-escaneo-imagenes"},
+        )
+
+    async def _pedir(self, url: str) -> httpx.Response:
+        respuesta = await self.cliente.head(url)
+        if respuesta.status_code in (405, 501):
+            respuesta = await self.cliente.get(url, headers={"Range": "bytes=0-0"})
+        return respuesta
+
+    async def verificar(self, url: str) -> ResultadoVerificacion:
+        if url.startswith("/"):
+            if not self.base_url:
+                return ResultadoVerificacion(ok=False, error="URL relativa y no hay IMAGE_SCAN_BASE_URL configurada")
+            url = self.base_url + url
+        elif not url.startswith(("http://", "https://")):
+            return ResultadoVerificacion(ok=False, error="URL inválida")
+
+        for intento in range(2):
+            try:
+                return resultado_http(await self._pedir(url))
+            except httpx.TransportError as e:
+                if intento == 1:
+                    return ResultadoVerificacion(ok=False, error=f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+            except httpx.HTTPError as e:
+                return ResultadoVerificacion(ok=False, error=f"{type(e).__name__}: {e}")
+
+    async def cerrar(self):
+        await self.cliente.aclose()
+
+class VerificadorLocal(Verificador):
+    """Imágenes de LocalStorage: se comprueba el archivo en disco; las demás URLs se delegan"""
+
+    def __init__(self, storage, respaldo: Verificador):
+        self.storage = storage
+        self.prefijo = storage.url_base + "/"
+        self.respaldo = respaldo
+
+    async def verificar(self, url: str) -> ResultadoVerificacion:
+        if not url.startswith(self.prefijo):
+            return await self.respaldo.verificar(url)
+        ruta = self.storage.resolver(url[len(self.prefijo):])
+        if ruta is None:
+            return ResultadoVerificacion(ok=False, status=404, error="HTTP 404")
+        tamanio = os.path.getsize(ruta)
+        return ResultadoVerificacion(ok=tamanio > 0, status=200, bytes=tamanio, error=None if tamanio else "Imagen vacía")
+
+    async def cerrar(self):
+        await self.respaldo.cerrar()
+
+async def escanear(
+    verificador: Verificador,
+    productos: Iterable[Tuple[int, Optional[str]]],
+    concurrencia: int,
+) -> AsyncIterator[Tuple[int, Optional[str], ResultadoVerificacion]]:
+    """Verificar (producto_id, url) con a lo sumo `concurrencia` solicitudes en curso.
+
+    Los resultados se entregan en orden de llegada. Cada URL se verifica una sola
+    vez aunque la compartan varios productos.
+    """
+    pendientes = {}  # url -> [producto_id]
+    for producto_id, url in productos:
+        if not url:
+            yield producto_id, url, ResultadoVerificacion(ok=False, error="Sin imagen")
+            continue
+        pendientes.setdefault(url, []).append(producto_id)
+
+    urls = iter(pendientes)
+    en_curso = {}
+
+    def lanzar():
+        for url in urls:
+            en_curso[asyncio.ensure_future(verificador.verificar(url))] = url
+            if len(en_curso) >= concurrencia:
+                return
+
+    lanzar()
+    try:
+        while en_curso:
+            listas, _ = await asyncio.wait(en_curso, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in listas:
+                url = en_curso.pop(tarea)
+                try:
+                    resultado = tarea.result()
+                except Exception as e:
+                    resultado = ResultadoVerificacion(ok=False, error=f"{type(e).__name__}: {e}")
+                for producto_id in pendientes[url]:
+                    yield producto_id, url, resultado
+            lanzar()
+    finally:
+        for tarea in en_curso:
+            tarea.cancel()
@@ -0,0 +1,159 @@
+"""
+Preprocesamiento de imágenes de productos antes de subirlas al almacenamiento.
+
+Las fotos llegan tal cual salen del teléfono: varios MB, orientación en EXIF y
+metadatos (GPS, modelo de cámara). Cada imagen se endereza, se le quitan los
+metadatos, se reduce a IMAGE_MAX_DIMENSION y se recodifica a WebP (o AVIF), con
+una copia JPEG de respaldo y variantes de menor ancho para imágenes responsive.
+
+El trabajo es CPU puro, así que corre en un pool de procesos y no compite por
+el GIL con el event loop de la API. Pillow es opcional: sin él las imágenes se
+suben sin procesar.
+"""
+
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError, features
+except ImportError:
+    Image = None
+
+# Configuración del procesamiento
+IMAGE_PROCESSING = os.getenv("IMAGE_PROCESSING", "true").lower() in ("1", "true", "yes")
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1600"))
+# Anchos de las variantes; solo se generan los menores que la imagen principal
+IMAGE_VARIANT_WIDTHS = tuple(
+    int(ancho) for ancho in os.getenv("IMAGE_VARIANT_WIDTHS", "400,800").split(",") if ancho.strip()
+)
+# Formato principal: webp o avif (si Pillow no lo soporta se usa JPEG)
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+EXTENSIONES = {"WEBP": "webp", "AVIF": "avif", "JPEG": "jpg"}
+
+class ImagenInvalida(ValueError):
+    """El archivo no es una imagen que Pillow pueda decodificar"""
+
+_pool = None
+
+def disponible() -> bool:
+    return IMAGE_PROCESSING and Image is not None
+
+def formato_principal() -> str:
+    if IMAGE_FORMAT in ("webp", "avif") and features.check(IMAGE_FORMAT):
+        return IMAGE_FORMAT.upper()
+    return "JPEG"
+
+def pool() -> ProcessPoolExecutor:
+    """Pool de procesos, creado en el primer uso.
+
+    Se usa "spawn": el proceso de la API tiene hilos (executor de subidas, drivers de
+    la base de datos) y hacer fork de un proceso con hilos puede dejar locks tomados.
+    Los procesos hijos solo importan este módulo.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def descartar(roto: ProcessPoolExecutor):
+    """Descartar un pool roto (BrokenProcessPool: un worker murió) para que el próximo uso cree otro.
+
+    Solo se olvida si sigue siendo el pool actual: otra solicitud pudo haberlo
+    reemplazado ya.
+    """
+    global _pool
+    if _pool is roto:
+        _pool = None
+    roto.shutdown(wait=False, cancel_futures=True)
+
+def cerrar():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def hash_archivo(ruta: str) -> str:
+    """SHA-256 del contenido de un archivo, leído por bloques"""
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        while bloque := archivo.read(1024 * 1024):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+def _guardar(imagen, formato: str, ruta: str, icc) -> dict:
+    if formato == "JPEG":
+        imagen.save(ruta, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True, icc_profile=icc)
+    else:
+        imagen.save(ruta, formato, quality=IMAGE_QUALITY, icc_profile=icc)
+    return {"ruta": ruta, "bytes": os.path.getsize(ruta), "ancho": imagen.width, "alto": imagen.height}
+
+def _sin_transparencia(imagen):
+    """JPEG no admite canal alfa: componer sobre fondo blanco"""
+    if imagen.mode == "RGB":
+        return imagen
+    fondo = Image.new("RGB", imagen.size, (255, 255, 255))
+    fondo.paste(imagen, mask=imagen.getchannel("A"))
+    return fondo
+
+def procesar_imagen(ruta_origen: str, directorio: str) -> dict:
+    """Procesar una imagen y escribir los resultados en `directorio` (corre en el pool de procesos).
+
+    Devuelve las rutas y tamaños de la imagen principal, del respaldo JPEG y de
+    cada variante, junto con el tamaño del archivo original y el hash de la imagen
+    principal. Ese hash identifica la imagen normalizada: dos archivos con los mismos
+    píxeles y distintos metadatos producen la misma imagen principal.
+    """
+    bytes_originales = os.path.getsize(ruta_origen)
+    try:
+        with Image.open(ruta_origen) as original:
+            # Decodificar JPEG ya reducido por DCT cuando es mucho más grande que el máximo
+            original.draft("RGB", (IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+            imagen = ImageOps.exif_transpose(original)
+            imagen.load()
+    except Image.DecompressionBombError:
+        raise ImagenInvalida("La imagen tiene demasiados píxeles")
+    except (UnidentifiedImageError, OSError):
+        raise ImagenInvalida("El archivo no es una imagen válida")
+
+    con_alfa = imagen.mode in ("RGBA", "LA", "PA") or "transparency" in imagen.info
+    imagen = imagen.convert("RGBA" if con_alfa else "RGB")
+    # Descartar EXIF, XMP y comentarios; se conserva solo el perfil de color
+    icc = imagen.info.get("icc_profile")
+    imagen.info = {}
+
+    imagen.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+
+    formato = formato_principal()
+    extension = EXTENSIONES[formato]
+    principal = _guardar(
+        imagen if formato != "JPEG" else _sin_transparencia(imagen),
+        formato, os.path.join(directorio, f"principal.{extension}"), icc,
+    )
+    respaldo = None
+    if formato != "JPEG":
+        respaldo = _guardar(_sin_transparencia(imagen), "JPEG", os.path.join(directorio, "respaldo.jpg"), icc)
+
+    variantes = []
+    for ancho in sorted(set(IMAGE_VARIANT_WIDTHS)):
+        if ancho >= imagen.width:
+            continue
+        alto = max(1, round(imagen.height * ancho / imagen.width))
+        variante = imagen.resize((ancho, alto), Image.LANCZOS)
+        if formato == "JPEG":
+            variante = _sin_transparencia(variante)
+        variantes.append(_guardar(variante, formato, os.path.join(directorio, f"w{ancho}.{extension}"), icc))
+
+    return {
+        "bytes_originales": bytes_originales,
+        "hash": hash_archivo(principal["ruta"]),
+        "formato": formato,
+        "principal": principal,
+        "respaldo": respaldo,
+        "variantes": variantes,
+    }
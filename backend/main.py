@@ -1,73 +1,277 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, BackgroundTasks
+from fastapi import APIRouter, FastAPI, HTTPException, UploadFile, File, Depends, Header, Query, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import anyio
+from pydantic import BaseModel, ValidationError
 try:
     from pydantic import EmailStr
 except ImportError:
     EmailStr = str
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from sqlalchemy import exc as sa_exc
+from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, Date, DateTime, Text, and_, bindparam, or_, select, text, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.sql import func
-import cloudinary
-import cloudinary.uploader
+import asyncio
+import base64
+import binascii
+import csv
+import hashlib
+import io
 import json
-from typing import List, Optional
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
 import os
-from datetime import datetime
-import aiosmtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from jinja2 import Template
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
 
-app = FastAPI(title="E-commerce Mayorista API", version="3.0.0")
+import correo
+import imagenes
+from storage import ArchivoResponse, CloudinaryStorage, LocalStorage, rango_solicitado, tipo_de_contenido
+from migrations import aplicar_migraciones, normalizar_nombre, normalizar_texto, reconstruir_resumen_categorias
+
+# Las rutas se registran en el router; crear_app() arma la aplicación (ver al final del archivo)
+router = APIRouter()
 
 # Configuración de PostgreSQL
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    print("Warning: DATABASE_URL not found, using SQLite fallback")
-    DATABASE_URL = "sqlite:///./ecommerce.db"
-else:
-    print(f"DATABASE_URL configured: {DATABASE_URL is not None}")
-    print(f"DATABASE_URL starts with: {DATABASE_URL[:20]}...")
-
-# Usar driver psycopg2 estándar
-# No necesitamos modificar la URL para psycopg2
-
-engine = create_engine(DATABASE_URL)
+DATABASE_URL_CONFIGURADA = os.getenv("DATABASE_URL")
+DATABASE_URL = DATABASE_URL_CONFIGURADA or "sqlite:///./ecommerce.db"
+# Aplicar las migraciones pendientes al arrancar; con varias réplicas conviene desactivarlo
+# y correr `python manage.py migrate` una sola vez antes de desplegar
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+def async_database_url(url: str):
+    """Traducir DATABASE_URL al driver async equivalente (asyncpg / aiosqlite)"""
+    url = make_url(url)
+    if url.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        query = dict(url.query)
+        # asyncpg no entiende sslmode; su equivalente es ssl
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    if url.drivername in ("sqlite", "sqlite+pysqlite"):
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+# Configuración del pool de conexiones (engine async)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Reciclar conexiones antes de que el servidor o el proxy de Railway las corten
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Verificar cada conexión al sacarla del pool; evita errores tras un reinicio de Postgres
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+class EstadisticasPool:
+    """Métricas de uso del pool: checkouts, timeouts y tiempo de espera por checkout"""
+
+    def __init__(self, muestras: int = 1000):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self._esperas = deque(maxlen=muestras)  # últimas esperas, para percentiles
+
+    def registrar(self, espera: float, timeout: bool = False):
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+            self._esperas.append(espera)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            esperas = sorted(self._esperas)
+            checkouts, timeouts = self.checkouts, self.timeouts
+            promedio = self.espera_total / checkouts if checkouts else 0.0
+            maxima = self.espera_maxima
+
+        def percentil(p):
+            return esperas[min(len(esperas) - 1, int(len(esperas) * p))] if esperas else 0.0
+
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "espera_ms": {
+                "promedio": round(promedio * 1000, 3),
+                "p50": round(percentil(0.50) * 1000, 3),
+                "p95": round(percentil(0.95) * 1000, 3),
+                "p99": round(percentil(0.99) * 1000, 3),
+                "max": round(maxima * 1000, 3),
+            },
+        }
+
+pool_stats = EstadisticasPool()
+
+class PoolInstrumentado(AsyncAdaptedQueuePool):
+    """QueuePool async que mide cuánto espera cada checkout (incluye pre-ping y conexión nueva)"""
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super().connect()
+        except sa_exc.TimeoutError:
+            pool_stats.registrar(time.perf_counter() - inicio, timeout=True)
+            raise
+        pool_stats.registrar(time.perf_counter() - inicio)
+        return conexion
+
+# El engine síncrono (psycopg2) solo se usa para migraciones y comandos de manage.py;
+# los endpoints usan el engine async para no bloquear el event loop. Crear los engines
+# no abre conexiones: la primera se abre al arrancar o con la primera solicitud
+engine = create_engine(DATABASE_URL, pool_pre_ping=DB_POOL_PRE_PING)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(
+    async_database_url(DATABASE_URL),
+    poolclass=PoolInstrumentado,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
-# Configuración de Cloudinary
-cloudinary_name = os.getenv("CLOUDINARY_CLOUD_NAME")
-cloudinary_key = os.getenv("CLOUDINARY_API_KEY")
-cloudinary_secret = os.getenv("CLOUDINARY_API_SECRET")
+# Subidas de imágenes: el SDK de Cloudinary es bloqueante, así que corre en un pool de hilos acotado
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+# Archivos que /upload-images sube en paralelo dentro de una misma solicitud
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "50"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+# Tamaño de cada parte enviada a Cloudinary (mínimo 5 MB salvo la última)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(6 * 1024 * 1024)))
 
-if not all([cloudinary_name, cloudinary_key, cloudinary_secret]):
-    print("Warning: Cloudinary not configured, image uploads will be disabled")
-    cloudinary_name = None
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
 
-print(f"Cloudinary configured: name={cloudinary_name is not None}, key={cloudinary_key is not None}, secret={cloudinary_secret is not None}")
+# Almacenamiento de imágenes: cloudinary o local (ver storage.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary").lower()
+# Directorio de las imágenes y URL pública de /media cuando STORAGE_BACKEND=local
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "uploads")
+STORAGE_LOCAL_URL = os.getenv("STORAGE_LOCAL_URL", "/media")
+# Los nombres derivan del contenido, así que un archivo servido nunca cambia
+MEDIA_MAX_AGE = 365 * 24 * 3600
 
-if cloudinary_name:
-    cloudinary.config(
-        cloud_name=cloudinary_name,
-        api_key=cloudinary_key,
-        api_secret=cloudinary_secret
-    )
+_storage = None
+
+def obtener_storage():
+    """Almacenamiento configurado, creado en el primer uso (al arrancar o con la primera solicitud)"""
+    global _storage
+    if _storage is not None:
+        return _storage
+    if STORAGE_BACKEND == "local":
+        _storage = LocalStorage(STORAGE_LOCAL_DIR, STORAGE_LOCAL_URL)
+        print(f"Storage: local en {_storage.directorio}, servido en {STORAGE_LOCAL_URL}")
+        return _storage
+
+    # Configuración de Cloudinary
+    cloudinary_name = os.getenv("CLOUDINARY_CLOUD_NAME")
+    cloudinary_key = os.getenv("CLOUDINARY_API_KEY")
+    cloudinary_secret = os.getenv("CLOUDINARY_API_SECRET")
+
+    if not all([cloudinary_name, cloudinary_key, cloudinary_secret]):
+        print("Warning: Cloudinary not configured, image uploads will be disabled")
+        cloudinary_name = None
+
+    print(f"Cloudinary configured: name={cloudinary_name is not None}, key={cloudinary_key is not None}, secret={cloudinary_secret is not None}")
+    _storage = CloudinaryStorage(cloudinary_name, cloudinary_key, cloudinary_secret, chunk_size=UPLOAD_CHUNK_SIZE)
+    return _storage
+
+# Escaneo de las URLs de imagen de los productos (ver escaneo_imagenes.py)
+IMAGE_SCAN_CONCURRENCY = int(os.getenv("IMAGE_SCAN_CONCURRENCY", "20"))
+IMAGE_SCAN_TIMEOUT = float(os.getenv("IMAGE_SCAN_TIMEOUT", "10"))
+# Base con la que se verifican las URLs relativas que no están en el disco de este proceso
+IMAGE_SCAN_BASE_URL = os.getenv("IMAGE_SCAN_BASE_URL")
+# Segundos entre escaneos automáticos; 0 los desactiva
+IMAGE_SCAN_INTERVAL = int(os.getenv("IMAGE_SCAN_INTERVAL", "0"))
+# Filas de resultados que se guardan por transacción durante un escaneo
+IMAGE_SCAN_BATCH_SIZE = 500
 
 # Configuración de Email
 MAIL_USERNAME = os.getenv("MAIL_USERNAME")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
 MAIL_FROM = os.getenv("MAIL_FROM")
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "true").lower() in ("1", "true", "yes")
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "false").lower() in ("1", "true", "yes")
+MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", "30"))
+
+# Sin credenciales solo se envía a un servidor indicado explícitamente (p. ej. un SMTP local)
+MAIL_ENABLED = bool(MAIL_FROM and ((MAIL_USERNAME and MAIL_PASSWORD) or os.getenv("MAIL_SERVER")))
+
+# Bandeja de salida (email_outbox)
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "8"))
+# Espera antes del primer reintento; se duplica en cada intento hasta MAIL_RETRY_MAX
+MAIL_RETRY_DELAY = float(os.getenv("MAIL_RETRY_DELAY", "30"))
+MAIL_RETRY_MAX = float(os.getenv("MAIL_RETRY_MAX", "3600"))
+# Segundos sin envíos tras los que se cierra la conexión SMTP
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "60"))
+# Revisión periódica de la bandeja (reintentos, emails de otros procesos)
+MAIL_POLL_INTERVAL = float(os.getenv("MAIL_POLL_INTERVAL", "15"))
+# Emails que se toman por vuelta, y cuánto tiempo quedan reservados para este proceso
+MAIL_BATCH_SIZE = 50
+MAIL_LEASE_SECONDS = 300
+
+# Configuración del cache del catálogo
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "512"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+# Segundos que navegadores y CDN pueden reutilizar una respuesta del catálogo sin revalidarla
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "30"))
+
+# Máximo de líneas por pedido
+PEDIDO_MAX_ITEMS = int(os.getenv("PEDIDO_MAX_ITEMS", "200"))
 
-if not all([MAIL_USERNAME, MAIL_PASSWORD, MAIL_FROM]):
-    print("Warning: Email not configured, email notifications will be disabled")
-    MAIL_USERNAME = None
+# Estados de un pedido (PATCH /pedidos/{id}); los convertidos cuentan como venta en /pedidos/analytics
+ESTADOS_PEDIDO = ("pendiente", "confirmado", "enviado", "entregado", "cancelado")
+ESTADOS_CONVERTIDOS = ("confirmado", "enviado", "entregado")
+# Días que abarca /pedidos/analytics si no se indica desde
+ANALYTICS_DIAS = 30
+# Traspaso de los deltas de los pedidos a los resúmenes diarios: cada cuántos segundos
+# (0 lo desactiva; /pedidos/analytics sigue siendo exacto) y cuántos deltas por transacción
+ROLLUP_FOLD_INTERVAL = float(os.getenv("ROLLUP_FOLD_INTERVAL", "5"))
+ROLLUP_FOLD_BATCH = int(os.getenv("ROLLUP_FOLD_BATCH", "5000"))
 
-MAIL_SERVER = "smtp.gmail.com"
-MAIL_PORT = 587
+# Group commit de POST /pedidos: los pedidos que llegan en PEDIDOS_GROUP_COMMIT_MS
+# se insertan juntos y se confirman con un solo commit
+PEDIDOS_GROUP_COMMIT = os.getenv("PEDIDOS_GROUP_COMMIT", "false").lower() in ("1", "true", "yes")
+PEDIDOS_GROUP_COMMIT_MS = float(os.getenv("PEDIDOS_GROUP_COMMIT_MS", "5"))
+PEDIDOS_GROUP_COMMIT_MAX = int(os.getenv("PEDIDOS_GROUP_COMMIT_MAX", "100"))
+
+# Claves de idempotencia de POST /pedidos (en memoria, por proceso)
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+
+# Paginación por cursor
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Filas que /pedidos/export lee del cursor del servidor por vuelta
+EXPORT_BATCH_SIZE = 1000
+
+# Operaciones masivas sobre productos
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+# Tamaño de cada lote de ids en los DELETE ... WHERE id IN (...), por el límite de parámetros del driver
+BULK_CHUNK_SIZE = 1000
 
 # Modelo de la base de datos
 class ProductoDB(Base):
@@ -84,6 +288,12 @@ class ProductoDB(Base):
     minimo_mayorista = Column(Integer, default=1)
     activo = Column(Boolean, default=True)
     fecha_creacion = Column(DateTime, default=func.now())
+    # Clave de duplicados, única entre los productos activos (ver migrations.normalizar_nombre).
+    # Se calcula al insertar; las actualizaciones del nombre la recalculan explícitamente
+    nombre_normalizado = Column(
+        String,
+        default=lambda contexto: normalizar_nombre(contexto.get_current_parameters()["nombre"]),
+    )
 
 class PedidoDB(Base):
     __tablename__ = "pedidos"
@@ -96,28 +306,175 @@ class PedidoDB(Base):
     producto_nombre = Column(String)
     cantidad = Column(Integer)
     comentarios = Column(Text)
-    fecha_pedido = Column(DateTime, default=func.now())
+    # En SQLite func.now() guarda segundos enteros; los parámetros deben tener el mismo formato
+    # para que las comparaciones del cursor de paginación sean exactas
+    fecha_pedido = Column(
+        DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite"),
+        default=func.now()
+    )
     estado = Column(String, default="pendiente")
 
-# Crear tablas
-Base.metadata.create_all(bind=engine)
+class PedidoItemDB(Base):
+    """Líneas de un pedido, con el nombre y el precio del producto al momento de pedirlo"""
+    __tablename__ = "pedido_items"
+    
+    id = Column(Integer, primary_key=True)
+    pedido_id = Column(Integer, nullable=False)
+    producto_id = Column(Integer, nullable=False)
+    producto_nombre = Column(String, nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    precio_unitario = Column(Float)
+
+class ResumenPedidosDiaDB(Base):
+    """Pedidos por día de creación y estado actual; se actualiza con los deltas de cada alta o cambio de estado"""
+    __tablename__ = "resumen_pedidos_dia"
+    # En SQLite la tabla se guarda ordenada por la clave: los rangos de días se leen sin saltar a otra estructura
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    dia = Column(Date, primary_key=True)
+    estado = Column(String, primary_key=True)
+    pedidos = Column(Integer, nullable=False, default=0)
+    unidades = Column(Integer, nullable=False, default=0)
+    importe = Column(Float, nullable=False, default=0)
+
+class ResumenProductosDiaDB(Base):
+    """Unidades pedidas por producto, día de creación del pedido y estado actual del pedido"""
+    __tablename__ = "resumen_productos_dia"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    dia = Column(Date, primary_key=True)
+    producto_id = Column(Integer, primary_key=True)
+    estado = Column(String, primary_key=True)
+    producto_nombre = Column(String)
+    categoria = Column(String)
+    pedidos = Column(Integer, nullable=False, default=0)  # Pedidos que incluyen el producto
+    unidades = Column(Integer, nullable=False, default=0)
+    importe = Column(Float, nullable=False, default=0)
+
+class ResumenPedidosDeltaDB(Base):
+    """Cambios de los resúmenes diarios aún no traspasados, uno por pedido nuevo o cambio de estado.
+
+    Con producto_id NULL la fila corresponde a resumen_pedidos_dia; si no, a resumen_productos_dia.
+    """
+    __tablename__ = "resumen_pedidos_deltas"
+    
+    id = Column(Integer, primary_key=True)
+    dia = Column(Date, nullable=False)
+    producto_id = Column(Integer)
+    estado = Column(String, nullable=False)
+    producto_nombre = Column(String)
+    categoria = Column(String)
+    pedidos = Column(Integer, nullable=False)
+    unidades = Column(Integer, nullable=False)
+    importe = Column(Float, nullable=False)
+
+class EmailOutboxDB(Base):
+    """Emails pendientes de envío; se escriben en la misma transacción que el pedido"""
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True)
+    pedido_id = Column(Integer)
+    destinatario = Column(String, nullable=False)
+    asunto = Column(String, nullable=False)
+    html = Column(Text, nullable=False)
+    estado = Column(String, nullable=False, default="pendiente")  # pendiente, enviado o fallido
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime, nullable=False, default=func.now())
+    ultimo_error = Column(Text)
+    creado_en = Column(DateTime, default=func.now())
+    enviado_en = Column(DateTime)
+
+class CategoriaResumenDB(Base):
+    """Resumen por categoría de los productos activos, mantenido en cada escritura de productos"""
+    __tablename__ = "categorias_resumen"
+    
+    categoria = Column(String, primary_key=True)
+    productos_activos = Column(Integer, nullable=False, default=0)
+    precio_min = Column(Float)
+    precio_max = Column(Float)
+    precio_mayorista_min = Column(Float)
+
+class ImagenDB(Base):
+    """Imágenes ya subidas, indexadas por el SHA-256 de su contenido (original o normalizado)"""
+    __tablename__ = "imagenes"
+    
+    hash = Column(String(64), primary_key=True)
+    public_id = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    fallback_url = Column(String)
+    variantes = Column(Text)  # JSON {ancho: url}
+    bytes_originales = Column(Integer)
+    bytes_procesados = Column(Integer)
+    fecha_creacion = Column(DateTime, default=func.now())
+
+class ImagenEstadoDB(Base):
+    """Resultado de la última verificación de la imagen de cada producto"""
+    __tablename__ = "imagenes_estado"
+    
+    producto_id = Column(Integer, primary_key=True)
+    url = Column(String)  # URL verificada; si el producto cambió de imagen, el estado ya no aplica
+    ok = Column(Boolean, nullable=False)
+    status = Column(Integer)
+    bytes = Column(Integer)
+    tipo_contenido = Column(String)
+    error = Column(String)
+    verificada_en = Column(DateTime, nullable=False)
+
+def insert_upsert(tabla):
+    """INSERT con soporte de ON CONFLICT para el dialecto en uso (Postgres o SQLite)"""
+    if async_engine.dialect.name == "postgresql":
+        return postgresql.insert(tabla)
+    return sqlite.insert(tabla)
+
+async def refrescar_resumen_categorias(db: AsyncSession, categorias):
+    """Recalcular, dentro de la transacción en curso, el resumen de las categorías afectadas.
+
+    Solo se leen los productos activos de cada categoría (índice activo, categoria),
+    nunca la tabla completa. La fila del resumen se bloquea antes de recalcular para
+    que dos escrituras concurrentes sobre la misma categoría no se pisen.
+    """
+    tabla = CategoriaResumenDB.__table__
+    # Orden fijo para que dos transacciones no se bloqueen mutuamente
+    for categoria in sorted({categoria for categoria in categorias if categoria}):
+        await db.execute(
+            insert_upsert(tabla).values(categoria=categoria, productos_activos=0).on_conflict_do_nothing()
+        )
+        if async_engine.dialect.name == "postgresql":
+            await db.execute(select(tabla.c.categoria).where(tabla.c.categoria == categoria).with_for_update())
+
+        total, precio_min, precio_max, precio_mayorista_min = (await db.execute(
+            select(
+                func.count(ProductoDB.id),
+                func.min(ProductoDB.precio),
+                func.max(ProductoDB.precio),
+                func.min(ProductoDB.precio_mayorista),
+            ).where(ProductoDB.activo == True, ProductoDB.categoria == categoria)
+        )).one()
+
+        if total:
+            await db.execute(tabla.update().where(tabla.c.categoria == categoria).values(
+                productos_activos=total,
+                precio_min=precio_min,
+                precio_max=precio_max,
+                precio_mayorista_min=precio_mayorista_min,
+            ))
+        else:
+            await db.execute(tabla.delete().where(tabla.c.categoria == categoria))
 
 # Dependency para obtener la sesión de la base de datos
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-# Configurar CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=os.getenv("ALLOWED_ORIGINS", "").split(",") if os.getenv("ALLOWED_ORIGINS") else ["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def cerrar_conexiones():
+    # Cerrar las conexiones del pool; los hilos de aiosqlite impiden terminar el proceso si quedan abiertas
+    await escaneo.detener()
+    await ingesta_pedidos.detener()
+    await consolidacion.detener()
+    await bandeja.detener()
+    await async_engine.dispose()
+    upload_executor.shutdown(wait=False)
+    imagenes.cerrar()
 
 # Modelos Pydantic mejorados
 class Producto(BaseModel):
@@ -143,27 +500,299 @@ class ProductoCreate(BaseModel):
     minimo_mayorista: Optional[int] = 1
     activo: bool = True
 
+class ProductoBulkUpdate(BaseModel):
+    id: int
+    nombre: Optional[str] = None
+    precio: Optional[float] = None
+    descripcion: Optional[str] = None
+    imagen_url: Optional[str] = None
+    categoria: Optional[str] = None
+    stock: Optional[int] = None
+    precio_mayorista: Optional[float] = None
+    minimo_mayorista: Optional[int] = None
+    activo: Optional[bool] = None
+
+# Campos que una actualización masiva no puede dejar en null
+CAMPOS_OBLIGATORIOS = ("nombre", "precio", "descripcion", "imagen_url", "categoria", "activo")
+
+class CatalogoSync(BaseModel):
+    productos: List[Any]
+    # Eliminar los productos que no figuran en `productos`
+    eliminar: bool = True
+    # Limitar la sincronización a estas categorías; el resto del catálogo no se toca
+    categorias: Optional[List[str]] = None
+
+class FusionDuplicados(BaseModel):
+    # Nombres normalizados de los grupos a fusionar; por defecto, todos
+    grupos: Optional[List[str]] = None
+    # Eliminar los sobrantes; con false solo se dan de baja
+    eliminar: bool = True
+
+# Campos que el producto conservado de un grupo de duplicados toma de los sobrantes si los
+# tiene vacíos. El stock no: vacío significa sin límite
+CAMPOS_COMPLETABLES = ("descripcion", "imagen_url", "precio_mayorista")
+
+class ItemPedido(BaseModel):
+    producto_id: int
+    cantidad: int
+
 class PedidoRequest(BaseModel):
     nombre: str
     email: str  # No usamos EmailStr para evitar dependencias
     telefono: str
+    # Pedido de un solo producto (formulario del frontend); el nombre se toma de la base
+    producto_id: Optional[int] = None
+    producto_nombre: Optional[str] = None
+    cantidad: Optional[int] = None
+    # Carrito: varias líneas en un solo pedido (excluye producto_id/cantidad)
+    items: Optional[List[ItemPedido]] = None
+    comentarios: Optional[str] = ""
+    email_destino: Optional[str] = None  # Email adicional del frontend
+
+class ItemPedidoResponse(BaseModel):
     producto_id: int
     producto_nombre: str
     cantidad: int
-    comentarios: Optional[str] = ""
-    email_destino: Optional[str] = None  # Email adicional del frontend
+    precio_unitario: Optional[float] = None
 
 class PedidoResponse(BaseModel):
     id: int
     mensaje: str
+    items: List[ItemPedidoResponse] = []
+
+class EstadoPedidoUpdate(BaseModel):
+    estado: str
 
 class ImageUploadResponse(BaseModel):
     filename: str
     url: str
     message: str
+    # Resultado del preprocesamiento (None si la imagen se subió sin procesar)
+    original_bytes: Optional[int] = None
+    processed_bytes: Optional[int] = None
+    saved_bytes: Optional[int] = None
+    fallback_url: Optional[str] = None
+    variants: Optional[Dict[int, str]] = None
+    # La imagen ya estaba subida (mismo hash) y se devolvió la URL existente
+    reused: bool = False
+
+def encode_cursor(valores: dict) -> str:
+    """Codificar la posición de la última fila de una página como cursor opaco"""
+    return base64.urlsafe_b64encode(json.dumps(valores, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, campos: tuple) -> dict:
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(valores, dict) or set(valores) != set(campos):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return valores
+
+def entero_de_cursor(valor) -> int:
+    """Entero de un cursor decodificado; JSON admite cualquier tipo y bool es subclase de int"""
+    if not isinstance(valor, int) or isinstance(valor, bool):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return valor
+
+class CatalogoCache:
+    """Cache LRU con TTL de las respuestas del catálogo ya serializadas a JSON.
+
+    Guarda los bytes finales de la respuesta, de modo que un acierto no toca la
+    base de datos ni vuelve a validar modelos. Las escrituras invalidan solo las
+    claves afectadas; el TTL acota la desactualización frente a cambios hechos
+    desde otro proceso.
+    """
+
+    def __init__(self, max_entradas: int, ttl: float):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # clave -> (expira, (contenido, headers))
+        self._lock = threading.Lock()
+        self._generacion = 0
+
+    def generacion(self) -> int:
+        """Número de invalidaciones hechas; se toma antes de consultar la base de datos"""
+        return self._generacion
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            expira, contenido = entrada
+            if expira < time.monotonic():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return contenido
+
+    def set(self, clave, contenido, generacion: int):
+        """Guardar una respuesta, salvo que haya habido una escritura mientras se calculaba"""
+        if self.max_entradas <= 0:
+            return
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, contenido)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, predicado):
+        """Eliminar las entradas cuya clave cumpla el predicado"""
+        with self._lock:
+            self._generacion += 1
+            for clave in [clave for clave in self._entradas if predicado(clave)]:
+                del self._entradas[clave]
+
+    def limpiar(self):
+        self.invalidar(lambda clave: True)
+
+catalogo_cache = CatalogoCache(CATALOG_CACHE_MAX_ENTRIES, CATALOG_CACHE_TTL)
+
+def invalidar_catalogo(producto_id: int, categoria: Optional[str], activo: bool, cambia_categorias: bool = True):
+    """Invalidar las respuestas cacheadas que pueden contener a un producto"""
+    invalidar_catalogo_lote([(producto_id, categoria, activo)], cambia_categorias)
+
+def invalidar_catalogo_lote(productos, cambia_categorias: bool = True):
+    """Invalidar de una sola pasada las respuestas que pueden contener a alguno de los productos.
+
+    `productos` es una secuencia de tuplas (id, categoria, activo); un producto que
+    cambia de categoría o de estado debe aparecer con los valores viejos y los nuevos.
+    """
+    ids = {producto_id for producto_id, _, _ in productos}
+    listados = {(categoria, activo) for _, categoria, activo in productos}
+    estados = {activo for _, activo in listados}
+    hay_activos = True in estados
+
+    def afectada(clave):
+        if clave[0] == "producto":
+            return clave[1] in ids
+        if clave[0] == "productos":
+            if clave[1] is None:
+                return clave[2] in estados
+            return (clave[1], clave[2]) in listados
+        if clave[0] == "categorias":
+            return cambia_categorias and hay_activos
+        if clave[0] == "buscar":
+            # Cualquier cambio de un producto puede alterar resultados o su orden
+            return True
+        return False
+
+    catalogo_cache.invalidar(afectada)
+
+def errores_validacion(error: ValidationError) -> str:
+    """Resumir los errores de Pydantic de un ítem en una línea"""
+    return "; ".join(
+        f"{'.'.join(str(parte) for parte in detalle['loc']) or 'item'}: {detalle['msg']}"
+        for detalle in error.errors()
+    )
+
+def encode_json(contenido) -> bytes:
+    """Serializar igual que JSONResponse, para que las respuestas cacheadas sean idénticas.
+
+    orjson produce los mismos bytes (compacto, UTF-8 sin escapar) varias veces más rápido;
+    si no está instalado se usa json.
+    """
+    if orjson is not None:
+        return orjson.dumps(contenido)
+    return json.dumps(
+        contenido,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
 
-# Función para inicializar productos de ejemplo
-def init_sample_products():
+def cabeceras_catalogo(contenido: bytes, headers: dict) -> dict:
+    """Agregar ETag y Cache-Control a una respuesta del catálogo.
+
+    El ETag es un hash del contenido, así que identifica la versión del catálogo
+    que se sirvió y es estable entre reinicios y entre workers.
+    """
+    etag = '"' + hashlib.blake2b(contenido, digest_size=16).hexdigest() + '"'
+    return {**headers, "ETag": etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match usa comparación débil: se ignora el prefijo W/
+    candidatos = [valor.strip() for valor in if_none_match.split(",")]
+    return any(candidato.removeprefix("W/") == etag for candidato in candidatos)
+
+def respuesta_catalogo(request: Request, contenido: bytes, headers: dict) -> Response:
+    """Responder 304 si el cliente ya tiene esta versión, o el JSON completo si no"""
+    if etag_coincide(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=contenido, media_type="application/json", headers=headers)
+
+# Columnas que se leen para responder con el modelo Producto, en el orden de sus campos
+COLUMNAS_PRODUCTO = (
+    ProductoDB.id,
+    ProductoDB.nombre,
+    ProductoDB.precio,
+    ProductoDB.descripcion,
+    ProductoDB.imagen_url,
+    ProductoDB.categoria,
+    ProductoDB.stock,
+    ProductoDB.precio_mayorista,
+    ProductoDB.minimo_mayorista,
+    ProductoDB.activo,
+)
+
+def producto_a_dict(fila) -> dict:
+    """Convertir una fila de COLUMNAS_PRODUCTO al JSON de Producto sin construir el modelo"""
+    id, nombre, precio, descripcion, imagen_url, categoria, stock, precio_mayorista, minimo_mayorista, activo = fila
+    return {
+        "id": id,
+        "nombre": nombre,
+        "precio": precio,
+        "descripcion": descripcion,
+        "imagen_url": imagen_url,
+        "categoria": categoria,
+        "stock": stock,
+        "precio_mayorista": precio_mayorista,
+        "minimo_mayorista": minimo_mayorista or 1,
+        "activo": activo,
+    }
+
+def terminos_busqueda(q: str) -> List[str]:
+    """Palabras de la búsqueda, sin acentos ni signos que la sintaxis de búsqueda interprete"""
+    return re.findall(r"[^\W_]+", normalizar_texto(q))
+
+async def consultar_busqueda(db: AsyncSession, terminos: List[str], limit: int, offset: int):
+    """Productos activos que contienen todos los términos (como prefijo), del más relevante al menos.
+
+    En Postgres usa la columna tsvector `busqueda` con su índice GIN; en SQLite, la tabla
+    FTS5 `productos_fts`. En ambos casos el nombre pesa más que la descripción.
+    """
+    columnas = ", ".join(f"productos.{columna.key}" for columna in COLUMNAS_PRODUCTO)
+    if async_engine.dialect.name == "postgresql":
+        consulta = text(
+            f"SELECT {columnas} FROM productos, to_tsquery('spanish', :consulta) AS consulta "
+            "WHERE productos.activo AND productos.busqueda @@ consulta "
+            "ORDER BY ts_rank_cd(productos.busqueda, consulta) DESC, productos.id DESC "
+            "LIMIT :limit OFFSET :offset"
+        )
+        expresion = " & ".join(f"{termino}:*" for termino in terminos)
+    else:
+        consulta = text(
+            f"SELECT {columnas} FROM productos_fts JOIN productos ON productos.id = productos_fts.rowid "
+            "WHERE productos_fts MATCH :consulta AND productos.activo = 1 "
+            "ORDER BY bm25(productos_fts, 10.0, 1.0), productos.id DESC "
+            "LIMIT :limit OFFSET :offset"
+        )
+        expresion = " ".join(f'"{termino}"*' for termino in terminos)
+    # columns() tipa el resultado del SQL textual igual que un select() (p. ej. activo como bool)
+    consulta = consulta.columns(*COLUMNAS_PRODUCTO)
+    resultado = await db.execute(consulta, {"consulta": expresion, "limit": limit, "offset": offset})
+    return resultado.all()
+
+# Productos de ejemplo para una base vacía (`python manage.py seed`); devuelve cuántos se crearon
+def init_sample_products() -> int:
     db = SessionLocal()
     try:
         # Verificar si hay productos
@@ -196,106 +825,185 @@ def init_sample_products():
             
             for producto in productos_ejemplo:
                 db.add(producto)
+            db.flush()
+            reconstruir_resumen_categorias(db.connection(), Base.metadata)
             db.commit()
+            return len(productos_ejemplo)
+        return 0
     finally:
         db.close()
 
-# Inicializar productos de ejemplo al arrancar
-init_sample_products()
+def crear_emisor() -> correo.EmisorSMTP:
+    return correo.EmisorSMTP(
+        MAIL_SERVER,
+        MAIL_PORT,
+        username=MAIL_USERNAME,
+        password=MAIL_PASSWORD,
+        start_tls=MAIL_STARTTLS and not MAIL_SSL_TLS,
+        use_tls=MAIL_SSL_TLS,
+        timeout=MAIL_TIMEOUT,
+    )
+
+def email_pendiente(pedido: PedidoRequest, pedido_id: int, items: List[dict]) -> Optional[dict]:
+    """Fila de email_outbox con el aviso del pedido, o None si no hay destinatario"""
+    destinatario = pedido.email_destino or os.getenv("DEFAULT_EMAIL_RECIPIENT")
+    if not destinatario:
+        print(f"Pedido #{pedido_id} sin destinatario para el email (DEFAULT_EMAIL_RECIPIENT)")
+        return None
+    asunto, html = correo.email_pedido(pedido, pedido_id, items)
+    return {"pedido_id": pedido_id, "destinatario": destinatario, "asunto": asunto, "html": html}
 
-# Función para enviar email de notificación
-async def send_order_email(pedido: PedidoRequest, pedido_id: int):
-    """Enviar email de confirmación de pedido"""
-    try:
-        # Template para el email
-        email_template = """
-        <html>
-        <body style="font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <div style="text-align: center; margin-bottom: 30px;">
-                    <h1 style="color: #f97316; margin: 0;">🛒 Nuevo Pedido - Distribuidora Alegría</h1>
-                    <p style="color: #666; margin: 10px 0;">🌈 Mayorista de Juguetes 🎨</p>
-                </div>
-                
-                <div style="background: linear-gradient(135deg, #fed7aa 0%, #fef3c7 100%); padding: 20px; border-radius: 8px; margin-bottom: 20px;">
-                    <h2 style="color: #1f2937; margin: 0 0 15px 0;">📦 Detalles del Pedido #{{ pedido_id }}</h2>
-                    <p style="margin: 5px 0;"><strong>📅 Fecha:</strong> {{ fecha }}</p>
-                </div>
-                
-                <div style="background-color: #f0fdf4; border-left: 4px solid #22c55e; padding: 20px; margin-bottom: 20px;">
-                    <h3 style="color: #15803d; margin: 0 0 15px 0;">👤 Información del Cliente</h3>
-                    <p style="margin: 5px 0;"><strong>Nombre:</strong> {{ nombre }}</p>
-                    <p style="margin: 5px 0;"><strong>Email:</strong> {{ email }}</p>
-                    <p style="margin: 5px 0;"><strong>Teléfono:</strong> {{ telefono }}</p>
-                </div>
-                
-                <div style="background-color: #eff6ff; border-left: 4px solid #3b82f6; padding: 20px; margin-bottom: 20px;">
-                    <h3 style="color: #1d4ed8; margin: 0 0 15px 0;">🎁 Producto Solicitado</h3>
-                    <p style="margin: 5px 0;"><strong>Producto:</strong> {{ producto_nombre }}</p>
-                    <p style="margin: 5px 0;"><strong>Cantidad:</strong> {{ cantidad }} unidades</p>
-                    {% if comentarios %}
-                    <p style="margin: 15px 0 5px 0;"><strong>Comentarios:</strong></p>
-                    <p style="background-color: #f8fafc; padding: 10px; border-radius: 5px; margin: 5px 0;">{{ comentarios }}</p>
-                    {% endif %}
-                </div>
-                
-                <div style="background-color: #fef3c7; border: 1px solid #f59e0b; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                    <p style="margin: 0; color: #92400e; font-weight: bold;">⚡ Acción requerida:</p>
-                    <p style="margin: 5px 0; color: #92400e;">Contactar al cliente lo antes posible para confirmar disponibilidad y coordinar entrega.</p>
-                </div>
-                
-                <div style="text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb;">
-                    <p style="color: #6b7280; font-size: 14px; margin: 0;">Distribuidora Alegría - Mayorista de Juguetes</p>
-                    <p style="color: #6b7280; font-size: 12px; margin: 5px 0 0 0;">Este email fue generado automáticamente desde el sistema de pedidos</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Renderizar template
-        template = Template(email_template)
-        html_content = template.render(
-            pedido_id=pedido_id,
-            fecha=datetime.now().strftime("%d/%m/%Y %H:%M"),
-            nombre=pedido.nombre,
-            email=pedido.email,
-            telefono=pedido.telefono,
-            producto_nombre=pedido.producto_nombre,
-            cantidad=pedido.cantidad,
-            comentarios=pedido.comentarios
+class BandejaSalida:
+    """Envío en segundo plano de los emails de email_outbox (una tarea por proceso).
+
+    Cada vuelta reserva hasta MAIL_BATCH_SIZE emails vencidos con un solo UPDATE
+    (el lease evita que otro proceso los tome a la vez), los envía por la conexión
+    SMTP del emisor y guarda los resultados. Los fallos se reintentan con espera
+    exponencial; tras MAIL_MAX_ATTEMPTS, o si el servidor rechaza al destinatario,
+    el email queda como fallido. Un email enviado justo antes de una caída del
+    proceso puede reenviarse al vencer su lease.
+    """
+
+    def __init__(self, fabrica=crear_emisor):
+        self.fabrica = fabrica
+        self.emisor: Optional[correo.EmisorSMTP] = None
+        self.tarea: Optional[asyncio.Task] = None
+        self.activa = False
+        self.aviso = asyncio.Event()
+        self.enviados = 0
+        self.fallidos = 0
+
+    def avisar(self):
+        """Despertar la tarea tras confirmar un email nuevo"""
+        self.aviso.set()
+
+    def espera(self, intentos: int) -> timedelta:
+        return timedelta(seconds=min(MAIL_RETRY_DELAY * 2 ** (intentos - 1), MAIL_RETRY_MAX))
+
+    async def _reservar(self) -> list:
+        tabla = EmailOutboxDB.__table__
+        ahora = datetime.now()
+        vencidos = (
+            select(tabla.c.id)
+            .where(tabla.c.estado == "pendiente", tabla.c.proximo_intento <= ahora)
+            .order_by(tabla.c.id)
+            .limit(MAIL_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
         )
-        
-        # Determinar email de destino
-        email_destino = pedido.email_destino or os.getenv("DEFAULT_EMAIL_RECIPIENT")
-        
-        # Crear mensaje
-        message = MIMEMultipart("alternative")
-        message["Subject"] = f"🛒 Nuevo Pedido #{pedido_id} - {pedido.producto_nombre}"
-        message["From"] = MAIL_FROM
-        message["To"] = email_destino
-        
-        # Crear parte HTML
-        html_part = MIMEText(html_content, "html")
-        message.attach(html_part)
-        
-        # Enviar email
-        await aiosmtplib.send(
-            message,
-            hostname=MAIL_SERVER,
-            port=MAIL_PORT,
-            start_tls=True,
-            username=MAIL_USERNAME,
-            password=MAIL_PASSWORD,
+        consulta = (
+            tabla.update()
+            .where(tabla.c.id.in_(vencidos.scalar_subquery()), tabla.c.proximo_intento <= ahora)
+            .values(proximo_intento=ahora + timedelta(seconds=MAIL_LEASE_SECONDS))
+            .returning(tabla.c.id, tabla.c.destinatario, tabla.c.asunto, tabla.c.html, tabla.c.intentos)
         )
-        
-        print(f"Email enviado exitosamente para pedido #{pedido_id} a {email_destino}")
-        
-    except Exception as e:
-        print(f"Error al enviar email: {str(e)}")
-        # No lanzamos excepción para que el pedido se registre aunque falle el email
+        async with AsyncSessionLocal() as db:
+            filas = (await db.execute(consulta)).all()
+            await db.commit()
+        return sorted(filas, key=lambda fila: fila.id)
 
-@app.get("/")
+    async def procesar(self) -> int:
+        """Enviar una vuelta de emails vencidos; devuelve cuántos se reservaron"""
+        filas = await self._reservar()
+        if not filas:
+            return 0
+        resultados = []
+        for posicion, fila in enumerate(filas):
+            try:
+                await self.emisor.enviar(MAIL_FROM, fila.destinatario, fila.asunto, fila.html)
+            except Exception as e:
+                intentos = fila.intentos + 1
+                definitivo = correo.es_rechazo_definitivo(e) or intentos >= MAIL_MAX_ATTEMPTS
+                proximo = datetime.now() + self.espera(intentos)
+                resultados.append({
+                    "b_id": fila.id,
+                    "estado": "fallido" if definitivo else "pendiente",
+                    "intentos": intentos,
+                    "proximo_intento": proximo,
+                    "ultimo_error": f"{type(e).__name__}: {e}",
+                    "enviado_en": None,
+                })
+                print(f"Error al enviar email #{fila.id} a {fila.destinatario} (intento {intentos}): {e}")
+                self.fallidos += definitivo
+                if definitivo and correo.es_rechazo_definitivo(e):
+                    continue
+                # Sin conexión con el servidor: el resto de la vuelta se libera para el mismo momento
+                for pendiente in filas[posicion + 1:]:
+                    resultados.append({
+                        "b_id": pendiente.id,
+                        "estado": "pendiente",
+                        "intentos": pendiente.intentos,
+                        "proximo_intento": proximo,
+                        "ultimo_error": None,
+                        "enviado_en": None,
+                    })
+                await self.emisor.cerrar()
+                break
+            else:
+                resultados.append({
+                    "b_id": fila.id,
+                    "estado": "enviado",
+                    "intentos": fila.intentos + 1,
+                    "proximo_intento": datetime.now(),
+                    "ultimo_error": None,
+                    "enviado_en": datetime.now(),
+                })
+                self.enviados += 1
+        tabla = EmailOutboxDB.__table__
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                tabla.update().where(tabla.c.id == bindparam("b_id")).values(
+                    estado=bindparam("estado"),
+                    intentos=bindparam("intentos"),
+                    proximo_intento=bindparam("proximo_intento"),
+                    ultimo_error=bindparam("ultimo_error"),
+                    enviado_en=bindparam("enviado_en"),
+                ),
+                resultados,
+            )
+            await db.commit()
+        return len(filas)
+
+    async def _ciclo(self):
+        ultimo_envio = time.monotonic()
+        while self.activa:
+            # Antes de procesar: un aviso que llegue durante la vuelta no se pierde
+            self.aviso.clear()
+            try:
+                if await self.procesar():
+                    ultimo_envio = time.monotonic()
+                    continue
+            except Exception as e:
+                print(f"Error en la bandeja de salida de emails: {e}")
+            if self.emisor.conectado() and time.monotonic() - ultimo_envio >= MAIL_IDLE_TIMEOUT:
+                await self.emisor.cerrar()
+            espera = MAIL_POLL_INTERVAL
+            if self.emisor.conectado():
+                espera = min(espera, max(0.0, MAIL_IDLE_TIMEOUT - (time.monotonic() - ultimo_envio)))
+            try:
+                await asyncio.wait_for(self.aviso.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+
+    def iniciar(self):
+        self.emisor = self.fabrica()
+        self.activa = True
+        self.tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self):
+        """Terminar la vuelta en curso (sin cortar un envío a medias) y cerrar la conexión"""
+        self.activa = False
+        self.aviso.set()
+        if self.tarea is not None and not self.tarea.done():
+            try:
+                await asyncio.wait_for(self.tarea, timeout=MAIL_TIMEOUT)
+            except asyncio.TimeoutError:
+                print("La bandeja de salida no terminó a tiempo; los emails reservados se reintentarán")
+        if self.emisor is not None:
+            await self.emisor.cerrar()
+
+bandeja = BandejaSalida()
+
+@router.get("/")
 def read_root():
     return {
         "mensaje": "API E-commerce Mayorista v3.0 funcionando correctamente",
@@ -303,42 +1011,185 @@ def read_root():
         "endpoints": ["/productos", "/pedidos", "/upload-image", "/docs"]
     }
 
-@app.get("/health")
+@router.get("/health")
 def health_check():
-    return {"status": "healthy", "version": "3.0.0", "database": "PostgreSQL", "storage": "Cloudinary"}
+    return {"status": "healthy", "version": "3.0.0", "database": "PostgreSQL", "storage": obtener_storage().nombre}
+
+@router.get("/health/pool")
+def pool_status():
+    """Estado del pool de conexiones, para dimensionarlo según la cantidad de workers"""
+    pool = async_engine.pool
+    return {
+        "pool": {
+            "size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout": DB_POOL_TIMEOUT,
+            "recycle": DB_POOL_RECYCLE,
+            "pre_ping": DB_POOL_PRE_PING,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        },
+        **pool_stats.resumen(),
+    }
+
+def public_id_contenido(hash_contenido: str) -> str:
+    # Nombre derivado del contenido: subir otra vez la misma imagen sobrescribe el mismo
+    # asset en lugar de crear uno nuevo, aunque se pierda el índice local
+    return f"producto_{hash_contenido[:32]}"
+
+def extension_segura(filename: str) -> str:
+    """Extensión del archivo subido, solo si es de imagen; el almacenamiento local la usa para el Content-Type"""
+    extension = os.path.splitext(filename)[1].lower()
+    return extension if extension in (".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif") else ""
+
+def copiar_a_disco(origen, destino: str) -> str:
+    """Copiar por bloques el archivo recibido y devolver el SHA-256 de sus bytes.
+
+    La copia permite que el pool de procesos abra la imagen por ruta.
+    """
+    origen.seek(0)
+    sha = hashlib.sha256()
+    with open(destino, "wb") as salida:
+        while bloque := origen.read(1024 * 1024):
+            sha.update(bloque)
+            salida.write(bloque)
+    return sha.hexdigest()
+
+async def buscar_imagen(hash_contenido: str) -> Optional[dict]:
+    # Sesión propia y corta: no se retiene una conexión del pool durante la subida
+    async with AsyncSessionLocal() as db:
+        fila = (await db.execute(
+            select(ImagenDB.__table__).where(ImagenDB.hash == hash_contenido)
+        )).first()
+        return dict(fila._mapping) if fila else None
+
+async def registrar_imagen(hashes, datos: dict):
+    """Guardar la imagen subida bajo cada uno de sus hashes (original y normalizado)"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            insert_upsert(ImagenDB.__table__)
+            .values([{**datos, "hash": hash_contenido} for hash_contenido in sorted(set(hashes))])
+            .on_conflict_do_nothing()
+        )
+        await db.commit()
+
+def respuesta_imagen(datos: dict, message: str, reused: bool = False) -> ImageUploadResponse:
+    procesados = datos["bytes_procesados"]
+    return ImageUploadResponse(
+        filename=datos["public_id"],
+        url=datos["url"],
+        message=message,
+        original_bytes=datos["bytes_originales"] if procesados is not None else None,
+        processed_bytes=procesados,
+        saved_bytes=datos["bytes_originales"] - procesados if procesados is not None else None,
+        fallback_url=datos["fallback_url"],
+        variants=json.loads(datos["variantes"]) if datos["variantes"] else None,
+        reused=reused,
+    )
+
+async def procesar_en_pool(origen: str, directorio: str) -> dict:
+    """imagenes.procesar_imagen en el pool de procesos.
+
+    Si un worker murió (falta de memoria, un fallo de Pillow) el pool queda roto
+    para siempre: se descarta, se reintenta una vez en uno nuevo y, si vuelve a
+    romperse, se responde 503.
+    """
+    loop = asyncio.get_running_loop()
+    for intento in range(2):
+        pool = imagenes.pool()
+        try:
+            return await loop.run_in_executor(pool, imagenes.procesar_imagen, origen, directorio)
+        except BrokenProcessPool:
+            imagenes.descartar(pool)
+            print(f"El pool de procesamiento de imágenes se rompió (intento {intento + 1}); se crea uno nuevo")
+    raise HTTPException(status_code=503, detail="El procesamiento de imágenes no está disponible, reintentar más tarde")
+
+async def subir_imagen(file: UploadFile) -> ImageUploadResponse:
+    """Validar una imagen recibida, preprocesarla y subirla fuera del event loop.
+
+    Las imágenes se identifican por el SHA-256 de los bytes recibidos y por el de la
+    imagen ya normalizada (ver imagenes.py). Si alguno está en la tabla imagenes se
+    devuelve la URL existente sin tocar el almacenamiento.
+    """
+    # Validar tipo de archivo
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
+    
+    # Validar que el archivo tenga nombre
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="El archivo debe tener un nombre")
+    
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"La imagen supera el máximo de {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+    
+    loop = asyncio.get_running_loop()
+    directorio = tempfile.mkdtemp(prefix="imagen_")
+    try:
+        origen = os.path.join(directorio, "original" + extension_segura(file.filename))
+        hash_original = await loop.run_in_executor(upload_executor, copiar_a_disco, file.file, origen)
+        existente = await buscar_imagen(hash_original)
+        if existente:
+            return respuesta_imagen(existente, "Imagen ya subida anteriormente", reused=True)
 
-@app.post("/upload-image", response_model=ImageUploadResponse)
+        if imagenes.disponible():
+            try:
+                resultado = await procesar_en_pool(origen, directorio)
+            except imagenes.ImagenInvalida as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            tamanio = os.path.getsize(origen)
+            resultado = {
+                "bytes_originales": tamanio,
+                "hash": hash_original,
+                "principal": {"ruta": origen, "bytes": None},
+                "respaldo": None,
+                "variantes": [],
+            }
+
+        # Mismos píxeles con otros metadatos: ya está subida con su hash normalizado
+        hash_contenido = resultado["hash"]
+        existente = await buscar_imagen(hash_contenido) if hash_contenido != hash_original else None
+        if existente:
+            await registrar_imagen([hash_original], {k: v for k, v in existente.items() if k != "hash"})
+            return respuesta_imagen(existente, "Imagen ya subida anteriormente", reused=True)
+
+        public_id = public_id_contenido(hash_contenido)
+        archivos = [(public_id, resultado["principal"])]
+        if resultado["respaldo"]:
+            archivos.append((f"{public_id}_jpg", resultado["respaldo"]))
+        archivos += [(f"{public_id}_w{variante['ancho']}", variante) for variante in resultado["variantes"]]
+        subidas = await asyncio.gather(*(
+            loop.run_in_executor(upload_executor, obtener_storage().subir, archivo["ruta"], destino)
+            for destino, archivo in archivos
+        ))
+        urls = {destino: subida["url"] for (destino, _), subida in zip(archivos, subidas)}
+    finally:
+        await loop.run_in_executor(upload_executor, shutil.rmtree, directorio, True)
+
+    datos = {
+        "public_id": subidas[0]["public_id"],
+        "url": urls[public_id],
+        "fallback_url": urls.get(f"{public_id}_jpg"),
+        "variantes": json.dumps({
+            variante["ancho"]: urls[f"{public_id}_w{variante['ancho']}"] for variante in resultado["variantes"]
+        }) if resultado["variantes"] else None,
+        "bytes_originales": resultado["bytes_originales"],
+        "bytes_procesados": resultado["principal"]["bytes"],
+    }
+    await registrar_imagen([hash_original, hash_contenido], datos)
+    if datos["bytes_procesados"] is None:
+        return respuesta_imagen(datos, f"Imagen subida exitosamente a {obtener_storage().nombre}")
+    return respuesta_imagen(datos, f"Imagen procesada y subida exitosamente a {obtener_storage().nombre}")
+
+@router.post("/upload-image", response_model=ImageUploadResponse)
 async def upload_image(file: UploadFile = File(...)):
-    """Subir imagen de producto a Cloudinary"""
+    """Subir imagen de producto al almacenamiento configurado"""
     try:
-        if not cloudinary_name:
+        if not obtener_storage().configurado():
             raise HTTPException(status_code=503, detail="Image upload service not configured")
-            
-        # Validar tipo de archivo
-        if not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
-        
-        # Validar que el archivo tenga nombre
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="El archivo debe tener un nombre")
-        
-        # Leer el contenido del archivo
-        content = await file.read()
-        
-        # Subir a Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            content,
-            folder="gorros",
-            public_id=f"producto_{datetime.now().timestamp()}",
-            overwrite=True,
-            resource_type="image"
-        )
         
-        return ImageUploadResponse(
-            filename=upload_result["public_id"],
-            url=upload_result["secure_url"],
-            message="Imagen subida exitosamente a Cloudinary"
-        )
+        return await subir_imagen(file)
         
     except HTTPException:
         raise
@@ -347,146 +1198,1757 @@ async def upload_image(file: UploadFile = File(...)):
         error_detail = f"Error al subir imagen: {str(e)}. Traceback: {traceback.format_exc()}"
         raise HTTPException(status_code=500, detail=error_detail)
 
-@app.get("/productos", response_model=List[Producto])
-def get_productos(categoria: Optional[str] = None, activo: bool = True, db: Session = Depends(get_db)):
-    """Obtener productos con filtros opcionales"""
+@router.post("/upload-images")
+async def upload_images(files: List[UploadFile] = File(...)):
+    """Subir varias imágenes, hasta UPLOAD_CONCURRENCY a la vez, con un resultado por archivo"""
+    if not obtener_storage().configurado():
+        raise HTTPException(status_code=503, detail="Image upload service not configured")
+    if len(files) > UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Máximo {UPLOAD_MAX_FILES} archivos por solicitud")
+
+    semaforo = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def subir(indice: int, file: UploadFile) -> dict:
+        async with semaforo:
+            try:
+                subida = await subir_imagen(file)
+                return {"indice": indice, "archivo": file.filename, "ok": True, **subida.model_dump(exclude={"message"})}
+            except HTTPException as e:
+                return {"indice": indice, "archivo": file.filename, "ok": False, "error": e.detail}
+            except Exception as e:
+                return {"indice": indice, "archivo": file.filename, "ok": False, "error": f"Error al subir imagen: {str(e)}"}
+
+    resultados = await asyncio.gather(*(subir(indice, file) for indice, file in enumerate(files)))
+    subidas = sum(1 for resultado in resultados if resultado["ok"])
+    return {"subidas": subidas, "errores": len(resultados) - subidas, "resultados": resultados}
+
+@router.api_route("/media/{ruta:path}", methods=["GET", "HEAD"])
+async def servir_media(ruta: str, request: Request):
+    """Servir una imagen del almacenamiento local, con soporte de Range y cache de larga duración"""
+    storage = obtener_storage()
+    archivo = storage.resolver(ruta) if isinstance(storage, LocalStorage) else None
+    if archivo is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    info = await anyio.to_thread.run_sync(os.stat, archivo)
+    etag = f'"{info.st_size:x}-{info.st_mtime_ns:x}"'
+    headers = {
+        "Cache-Control": f"public, max-age={MEDIA_MAX_AGE}, immutable",
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+    }
+    if etag_coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    rango = None
+    if_range = request.headers.get("if-range")
+    # If-Range: el rango solo vale si el cliente tiene la misma versión del archivo
+    if if_range is None or if_range == etag:
+        try:
+            rango = rango_solicitado(request.headers.get("range"), info.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{info.st_size}"})
+
+    headers["Content-Type"] = tipo_de_contenido(archivo)
+    solo_cabeceras = request.method == "HEAD"
+    if rango is None:
+        return ArchivoResponse(archivo, 0, info.st_size, 200, headers, solo_cabeceras)
+    inicio, fin = rango
+    headers["Content-Range"] = f"bytes {inicio}-{fin}/{info.st_size}"
+    return ArchivoResponse(archivo, inicio, fin - inicio + 1, 206, headers, solo_cabeceras)
+
+def crear_verificador() -> "escaneo_imagenes.Verificador":
+    # Importación diferida: httpx solo hace falta al escanear y es de lo más caro de importar
+    import escaneo_imagenes
+    storage = obtener_storage()
+    verificador = escaneo_imagenes.VerificadorHTTP(IMAGE_SCAN_CONCURRENCY, IMAGE_SCAN_TIMEOUT, IMAGE_SCAN_BASE_URL)
+    if isinstance(storage, LocalStorage):
+        # Las imágenes propias se verifican en disco, sin pasar por HTTP
+        verificador = escaneo_imagenes.VerificadorLocal(storage, verificador)
+    return verificador
+
+class EscaneoImagenes:
+    """Escaneo en segundo plano de las imágenes de los productos (uno a la vez por proceso).
+
+    Verifica cada imagen_url con el verificador que entrega `fabrica` y guarda el
+    resultado en imagenes_estado por lotes, sin mantener una sesión abierta mientras
+    espera las respuestas HTTP.
+    """
+
+    def __init__(self, fabrica=crear_verificador):
+        self.fabrica = fabrica
+        self.tarea: Optional[asyncio.Task] = None
+        self.periodica: Optional[asyncio.Task] = None
+        self.total = 0
+        self.verificadas = 0
+        self.rotas = 0
+        self.iniciado_en: Optional[datetime] = None
+        self.terminado_en: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    def en_curso(self) -> bool:
+        return self.tarea is not None and not self.tarea.done()
+
+    def iniciar(self, antiguedad_minutos: Optional[int] = None) -> bool:
+        """Lanzar un escaneo; False si ya hay uno en curso"""
+        if self.en_curso():
+            return False
+        self.total = self.verificadas = self.rotas = 0
+        self.iniciado_en = datetime.now()
+        self.terminado_en = None
+        self.error = None
+        self.tarea = asyncio.create_task(self._ejecutar(antiguedad_minutos))
+        return True
+
+    def resumen(self) -> dict:
+        return {
+            "en_curso": self.en_curso(),
+            "total": self.total,
+            "verificadas": self.verificadas,
+            "rotas": self.rotas,
+            "iniciado_en": self.iniciado_en.isoformat() if self.iniciado_en else None,
+            "terminado_en": self.terminado_en.isoformat() if self.terminado_en else None,
+            "error": self.error,
+        }
+
+    async def _pendientes(self, antiguedad_minutos: Optional[int]):
+        productos = ProductoDB.__table__
+        estados = ImagenEstadoDB.__table__
+        async with AsyncSessionLocal() as db:
+            # Estados de productos que ya no existen
+            await db.execute(estados.delete().where(estados.c.producto_id.not_in(select(productos.c.id))))
+            await db.commit()
+            consulta = select(productos.c.id, productos.c.imagen_url).order_by(productos.c.id)
+            if antiguedad_minutos is not None:
+                limite = datetime.now() - timedelta(minutes=antiguedad_minutos)
+                consulta = (
+                    consulta.outerjoin(estados, estados.c.producto_id == productos.c.id)
+                    .where(or_(
+                        estados.c.verificada_en == None,
+                        estados.c.verificada_en < limite,
+                        estados.c.url.is_distinct_from(productos.c.imagen_url),
+                    ))
+                )
+            return (await db.execute(consulta)).all()
+
+    async def _guardar(self, filas: List[dict]):
+        tabla = ImagenEstadoDB.__table__
+        consulta = insert_upsert(tabla)
+        consulta = consulta.on_conflict_do_update(
+            index_elements=[tabla.c.producto_id],
+            set_={columna: consulta.excluded[columna] for columna in filas[0] if columna != "producto_id"},
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(consulta, filas)
+            await db.commit()
+
+    async def _ejecutar(self, antiguedad_minutos: Optional[int]):
+        import escaneo_imagenes
+        verificador = self.fabrica()
+        try:
+            productos = await self._pendientes(antiguedad_minutos)
+            self.total = len(productos)
+            lote = []
+            async for producto_id, url, resultado in escaneo_imagenes.escanear(verificador, productos, IMAGE_SCAN_CONCURRENCY):
+                self.verificadas += 1
+                self.rotas += not resultado.ok
+                lote.append({
+                    "producto_id": producto_id,
+                    "url": url,
+                    "ok": resultado.ok,
+                    "status": resultado.status,
+                    "bytes": resultado.bytes,
+                    "tipo_contenido": resultado.tipo_contenido,
+                    "error": resultado.error,
+                    "verificada_en": datetime.now(),
+                })
+                if len(lote) >= IMAGE_SCAN_BATCH_SIZE:
+                    await self._guardar(lote)
+                    lote = []
+            if lote:
+                await self._guardar(lote)
+            print(f"Escaneo de imágenes terminado: {self.verificadas} verificadas, {self.rotas} rotas")
+        except Exception as e:
+            self.error = str(e)
+            print(f"Error en el escaneo de imágenes: {e}")
+        finally:
+            await verificador.cerrar()
+            self.terminado_en = datetime.now()
+
+    async def _cada(self, segundos: int):
+        while True:
+            self.iniciar(antiguedad_minutos=max(1, segundos // 60))
+            await asyncio.sleep(segundos)
+
+    def programar(self, segundos: int):
+        """Escanear periódicamente las imágenes no verificadas en el último intervalo"""
+        self.periodica = asyncio.create_task(self._cada(segundos))
+
+    async def detener(self):
+        for tarea in (self.periodica, self.tarea):
+            if tarea is not None and not tarea.done():
+                tarea.cancel()
+                try:
+                    await tarea
+                except asyncio.CancelledError:
+                    pass
+
+escaneo = EscaneoImagenes()
+
+@router.post("/imagenes/escanear", status_code=202)
+async def escanear_imagenes(
+    antiguedad_minutos: Optional[int] = Query(
+        None, ge=0, description="Verificar solo las imágenes no verificadas en este lapso o que cambiaron de URL"
+    ),
+):
+    """Iniciar en segundo plano la verificación de las imágenes de los productos"""
+    if not escaneo.iniciar(antiguedad_minutos):
+        raise HTTPException(status_code=409, detail="Ya hay un escaneo en curso")
+    return escaneo.resumen()
+
+@router.get("/imagenes/escaneo")
+def estado_escaneo():
+    """Progreso del escaneo en curso o resultado del último"""
+    return escaneo.resumen()
+
+@router.get("/imagenes/rotas")
+async def get_imagenes_rotas(db: AsyncSession = Depends(get_db)):
+    """Productos cuya imagen actual falló en la última verificación.
+
+    `inexistente` distingue las imágenes que el servidor confirma que no existen
+    (404/410, URL vacía o inválida) de los fallos que pueden ser transitorios
+    (timeouts, errores 5xx).
+    """
+    try:
+        filas = await db.execute(
+            select(
+                ProductoDB.id, ProductoDB.nombre, ProductoDB.imagen_url, ProductoDB.activo,
+                ImagenEstadoDB.status, ImagenEstadoDB.error, ImagenEstadoDB.bytes, ImagenEstadoDB.verificada_en,
+            )
+            .join(ImagenEstadoDB, ImagenEstadoDB.producto_id == ProductoDB.id)
+            .where(ImagenEstadoDB.ok == False, ImagenEstadoDB.url.is_not_distinct_from(ProductoDB.imagen_url))
+            .order_by(ProductoDB.id)
+        )
+        return [
+            {
+                "producto_id": fila.id,
+                "nombre": fila.nombre,
+                "imagen_url": fila.imagen_url,
+                "activo": fila.activo,
+                "status": fila.status,
+                "error": fila.error,
+                "bytes": fila.bytes,
+                "verificada_en": fila.verificada_en.isoformat(),
+                "inexistente": fila.status in (404, 410) or fila.error in ("Sin imagen", "URL inválida"),
+            }
+            for fila in filas
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener imágenes rotas: {str(e)}")
+
+@router.get("/productos", response_model=List[Producto])
+async def get_productos(
+    request: Request,
+    categoria: Optional[str] = None,
+    activo: bool = True,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    todos: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Obtener productos con filtros opcionales.
+
+    La respuesta se pagina por cursor: si hay más resultados, el header
+    X-Next-Cursor trae el valor a enviar como `cursor` para la página siguiente.
+    Con `todos=true` se devuelve el listado completo sin paginar.
+    """
+    clave = ("productos", categoria or None, activo, None if todos else limit, None if todos else cursor)
+    cacheado = catalogo_cache.get(clave)
+    if cacheado is not None:
+        return respuesta_catalogo(request, *cacheado)
+
     try:
-        # Query base
-        query = db.query(ProductoDB).filter(ProductoDB.activo == activo)
+        generacion = catalogo_cache.generacion()
+
+        # Query base: solo las columnas de la respuesta, como tuplas
+        query = select(*COLUMNAS_PRODUCTO).where(ProductoDB.activo == activo)
         
         # Filtro por categoría
         if categoria:
-            query = query.filter(ProductoDB.categoria == categoria)
+            query = query.where(ProductoDB.categoria == categoria)
+        
+        # Búsqueda por clave (keyset): continuar después del último id de la página anterior
+        if cursor and not todos:
+            query = query.where(ProductoDB.id < entero_de_cursor(decode_cursor(cursor, ("id",))["id"]))
         
         query = query.order_by(ProductoDB.id.desc())
         
-        productos_db = query.all()
-        
-        productos = []
-        for producto_db in productos_db:
-            productos.append(Producto(
-                id=producto_db.id,
-                nombre=producto_db.nombre,
-                precio=producto_db.precio,
-                descripcion=producto_db.descripcion,
-                imagen_url=producto_db.imagen_url,
-                categoria=producto_db.categoria,
-                stock=producto_db.stock,
-                precio_mayorista=producto_db.precio_mayorista,
-                minimo_mayorista=producto_db.minimo_mayorista or 1,
-                activo=producto_db.activo
-            ))
+        if not todos:
+            query = query.limit(limit + 1)
+        filas = (await db.execute(query)).all()
         
-        return productos
+        headers = {}
+        if not todos and len(filas) > limit:
+            filas = filas[:limit]
+            headers["X-Next-Cursor"] = encode_cursor({"id": filas[-1].id})
         
+        # Las filas se serializan directamente: la respuesta no vuelve a pasar por response_model
+        contenido = encode_json([producto_a_dict(fila) for fila in filas])
+        headers = cabeceras_catalogo(contenido, headers)
+        catalogo_cache.set(clave, (contenido, headers), generacion)
+        return respuesta_catalogo(request, contenido, headers)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener productos: {str(e)}")
 
-@app.get("/productos/{producto_id}", response_model=Producto)
-def get_producto(producto_id: int, db: Session = Depends(get_db)):
+@router.get("/productos/buscar")
+async def buscar_productos(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Buscar productos activos por nombre y descripción, ordenados por relevancia.
+
+    No distingue acentos ni mayúsculas, y cada palabra coincide también como prefijo
+    ("marron gorr" encuentra "Gorro Marrón Tierra"). `next_cursor` es el valor a enviar
+    como `cursor` para la página siguiente, o null en la última página.
+    """
+    terminos = terminos_busqueda(q)
+    clave = ("buscar", " ".join(terminos), limit, cursor)
+    cacheado = catalogo_cache.get(clave)
+    if cacheado is not None:
+        return respuesta_catalogo(request, *cacheado)
+
+    try:
+        generacion = catalogo_cache.generacion()
+        offset = entero_de_cursor(decode_cursor(cursor, ("offset",))["offset"]) if cursor else 0
+        if offset < 0:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+
+        filas = await consultar_busqueda(db, terminos, limit + 1, offset) if terminos else []
+
+        next_cursor = None
+        if len(filas) > limit:
+            filas = filas[:limit]
+            next_cursor = encode_cursor({"offset": offset + limit})
+
+        contenido = encode_json({"productos": [producto_a_dict(fila) for fila in filas], "next_cursor": next_cursor})
+        headers = cabeceras_catalogo(contenido, {})
+        catalogo_cache.set(clave, (contenido, headers), generacion)
+        return respuesta_catalogo(request, contenido, headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al buscar productos: {str(e)}")
+
+def elegir_conservado(productos: List[dict]) -> dict:
+    """Producto que sobrevive en un grupo de duplicados: el activo más antiguo, o el más antiguo si no hay activos"""
+    return min(productos, key=lambda producto: (not producto["activo"], producto["id"]))
+
+async def grupos_duplicados(db: AsyncSession, claves: Optional[List[str]] = None) -> Dict[str, List[dict]]:
+    """Productos cuyo nombre normalizado se repite, agrupados por ese nombre.
+
+    Una sola consulta: count() OVER (PARTITION BY nombre_normalizado) marca los
+    grupos con más de un producto sin traer el resto del catálogo.
+    """
+    repeticiones = func.count().over(partition_by=ProductoDB.nombre_normalizado).label("repeticiones")
+    subconsulta = select(*COLUMNAS_PRODUCTO, ProductoDB.nombre_normalizado, repeticiones)
+    if claves is not None:
+        subconsulta = subconsulta.where(ProductoDB.nombre_normalizado.in_(claves))
+    subconsulta = subconsulta.subquery()
+    consulta = (
+        select(*(subconsulta.c[columna.key] for columna in COLUMNAS_PRODUCTO), subconsulta.c.nombre_normalizado)
+        .where(subconsulta.c.repeticiones > 1)
+        .order_by(subconsulta.c.nombre_normalizado, subconsulta.c.id)
+    )
+    grupos = {}
+    for fila in (await db.execute(consulta)).all():
+        grupos.setdefault(fila[-1], []).append(producto_a_dict(fila[:-1]))
+    return grupos
+
+@router.get("/productos/duplicados")
+async def get_duplicados(db: AsyncSession = Depends(get_db)):
+    """Grupos de productos con el mismo nombre normalizado y cuál se conservaría al fusionarlos"""
+    try:
+        grupos = await grupos_duplicados(db)
+        return {
+            "total_grupos": len(grupos),
+            "sobrantes": sum(len(productos) - 1 for productos in grupos.values()),
+            "grupos": [
+                {"nombre_normalizado": clave, "conservar": elegir_conservado(productos)["id"], "productos": productos}
+                for clave, productos in grupos.items()
+            ],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al buscar duplicados: {str(e)}")
+
+@router.post("/productos/duplicados/fusionar")
+async def fusionar_duplicados(
+    fusion: FusionDuplicados = Body(FusionDuplicados()),
+    dry_run: bool = Query(False, description="Solo calcular el plan, sin aplicar cambios"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Fusionar cada grupo de duplicados en su producto conservado, en una sola transacción.
+
+    El conservado completa sus campos vacíos con los de los sobrantes, los pedidos
+    y las líneas de pedido de los sobrantes pasan a apuntar a él, igual que sus
+    resúmenes diarios de pedidos, y los sobrantes se eliminan (o se dan de baja con
+    eliminar=false).
+    """
+    try:
+        grupos = await grupos_duplicados(db, fusion.grupos)
+        por_id = {producto["id"]: producto for productos in grupos.values() for producto in productos}
+        plan = []
+        completar = {}  # id conservado -> campos
+        sobrantes = {}  # id sobrante -> id conservado
+        for clave, productos in grupos.items():
+            conservado = elegir_conservado(productos)
+            otros = [producto for producto in productos if producto["id"] != conservado["id"]]
+            campos = {}
+            for campo in CAMPOS_COMPLETABLES:
+                if conservado[campo] in (None, ""):
+                    valor = next((producto[campo] for producto in otros if producto[campo] not in (None, "")), None)
+                    if valor is not None:
+                        campos[campo] = valor
+            if campos:
+                completar[conservado["id"]] = campos
+            sobrantes.update((producto["id"], conservado["id"]) for producto in otros)
+            plan.append({
+                "nombre_normalizado": clave,
+                "conservar": conservado["id"],
+                "sobrantes": [producto["id"] for producto in otros],
+                "completar": campos,
+            })
+
+        respuesta = {"aplicado": False, "grupos": len(plan), "sobrantes": len(sobrantes), "eliminar": fusion.eliminar, "plan": plan}
+        if dry_run or not sobrantes:
+            return respuesta
+
+        reasignaciones = [{"b_sobrante": sobrante, "b_conservado": conservado} for sobrante, conservado in sobrantes.items()]
+        # Pedidos (columna producto_id original) y sus líneas: no hay FK que los actualice
+        for tabla in (PedidoDB.__table__, PedidoItemDB.__table__):
+            await db.execute(
+                tabla.update()
+                .where(tabla.c.producto_id == bindparam("b_sobrante"))
+                .values(producto_id=bindparam("b_conservado")),
+                reasignaciones,
+            )
+        await traspasar_resumen_productos(db, sobrantes, {
+            conservado: {"producto_nombre": por_id[conservado]["nombre"], "categoria": por_id[conservado]["categoria"]}
+            for conservado in set(sobrantes.values())
+        })
+        if completar:
+            await actualizar_en_lote(db, completar)
+
+        afectados = [(producto_id, por_id[producto_id]["categoria"], por_id[producto_id]["activo"]) for producto_id in completar]
+        if fusion.eliminar:
+            afectados.extend((await eliminar_en_lote(db, list(sobrantes))).values())
+        else:
+            await actualizar_en_lote(db, {producto_id: {"activo": False} for producto_id in sobrantes})
+            for producto_id in sobrantes:
+                producto = por_id[producto_id]
+                afectados.append((producto_id, producto["categoria"], producto["activo"]))
+                afectados.append((producto_id, producto["categoria"], False))
+
+        await refrescar_resumen_categorias(db, [categoria for _, categoria, _ in afectados])
+        await db.commit()
+        invalidar_catalogo_lote(afectados)
+
+        respuesta["aplicado"] = True
+        return respuesta
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al fusionar duplicados: {str(e)}")
+
+@router.get("/productos/{producto_id}", response_model=Producto)
+async def get_producto(producto_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Obtener un producto específico"""
+    clave = ("producto", producto_id)
+    cacheado = catalogo_cache.get(clave)
+    if cacheado is not None:
+        return respuesta_catalogo(request, *cacheado)
+
     try:
-        producto_db = db.query(ProductoDB).filter(ProductoDB.id == producto_id).first()
+        generacion = catalogo_cache.generacion()
+        fila = (await db.execute(select(*COLUMNAS_PRODUCTO).where(ProductoDB.id == producto_id))).first()
         
-        if not producto_db:
+        if not fila:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
         
-        producto = Producto(
-            id=producto_db.id,
-            nombre=producto_db.nombre,
-            precio=producto_db.precio,
-            descripcion=producto_db.descripcion,
-            imagen_url=producto_db.imagen_url,
-            categoria=producto_db.categoria,
-            stock=producto_db.stock,
-            precio_mayorista=producto_db.precio_mayorista,
-            minimo_mayorista=producto_db.minimo_mayorista or 1,
-            activo=producto_db.activo
-        )
-        
-        return producto
+        contenido = encode_json(producto_a_dict(fila))
+        headers = cabeceras_catalogo(contenido, {})
+        catalogo_cache.set(clave, (contenido, headers), generacion)
+        return respuesta_catalogo(request, contenido, headers)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener producto: {str(e)}")
 
-@app.post("/productos", response_model=Producto)
-def crear_producto(producto: ProductoCreate, db: Session = Depends(get_db)):
-    """Crear nuevo producto"""
+def conflicto_duplicado(producto_id: Optional[int] = None) -> HTTPException:
+    detalle = {"mensaje": "Ya existe un producto activo con ese nombre"}
+    if producto_id is not None:
+        detalle["id"] = producto_id
+    return HTTPException(status_code=409, detail=detalle)
+
+async def buscar_activo_por_nombre(db: AsyncSession, nombre: str):
+    """Producto activo con el mismo nombre normalizado (índice único parcial), o None"""
+    return (await db.execute(
+        select(ProductoDB.id, ProductoDB.categoria, ProductoDB.activo)
+        .where(ProductoDB.nombre_normalizado == normalizar_nombre(nombre), ProductoDB.activo == True)
+    )).first()
+
+@router.post("/productos", response_model=Producto)
+async def crear_producto(
+    producto: ProductoCreate,
+    upsert: bool = Query(False, description="Si ya existe un producto activo con el mismo nombre, actualizarlo en lugar de responder 409"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Crear nuevo producto.
+
+    Solo puede haber un producto activo por nombre normalizado: si ya existe se
+    responde 409 con su id, o con upsert=true se actualiza ese producto.
+    """
     try:
-        producto_db = ProductoDB(
-            nombre=producto.nombre,
-            precio=producto.precio,
-            descripcion=producto.descripcion,
-            imagen_url=producto.imagen_url,
-            categoria=producto.categoria,
-            stock=producto.stock,
-            precio_mayorista=producto.precio_mayorista,
-            minimo_mayorista=producto.minimo_mayorista,
-            activo=producto.activo
-        )
-        
-        db.add(producto_db)
-        db.commit()
-        db.refresh(producto_db)
+        existente = await buscar_activo_por_nombre(db, producto.nombre) if producto.activo else None
+        if existente and not upsert:
+            raise conflicto_duplicado(existente.id)
+
+        tabla = ProductoDB.__table__
+        valores = producto.model_dump()
+        if upsert and producto.activo:
+            # ON CONFLICT sobre el índice único parcial: resuelve también el caso de que
+            # otro request cree o dé de baja el producto entre la consulta y el INSERT
+            consulta = (
+                insert_upsert(tabla)
+                .values(**valores, nombre_normalizado=normalizar_nombre(producto.nombre))
+                .on_conflict_do_update(
+                    index_elements=[tabla.c.nombre_normalizado],
+                    index_where=tabla.c.activo == True,
+                    set_=valores,
+                )
+                .returning(tabla.c.id)
+            )
+        else:
+            consulta = tabla.insert().values(**valores).returning(tabla.c.id)
+        producto_id = (await db.execute(consulta)).scalar_one()
+
+        afectados = [(producto_id, producto.categoria, producto.activo)]
+        if existente:
+            afectados.append(tuple(existente))
+        await refrescar_resumen_categorias(db, [categoria for _, categoria, _ in afectados])
+        await db.commit()
+        invalidar_catalogo_lote(afectados)
         
         # Retornar el producto creado
         return Producto(
-            id=producto_db.id,
-            **producto.dict()
+            id=producto_id,
+            **valores
         )
         
+    except HTTPException:
+        raise
+    except sa_exc.IntegrityError:
+        # Otro request creó un producto activo con el mismo nombre entre la consulta y el INSERT
+        raise conflicto_duplicado()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al crear producto: {str(e)}")
 
-@app.get("/categorias")
-def get_categorias(db: Session = Depends(get_db)):
-    """Obtener todas las categorías disponibles"""
+def verificar_tamanio_lote(items: list):
+    if not items:
+        raise HTTPException(status_code=400, detail="La lista está vacía")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {BULK_MAX_ITEMS} ítems por solicitud")
+
+def rechazar_si_hay_errores(resultados: list, atomico: bool):
+    """En modo atómico, cualquier ítem inválido cancela la operación completa"""
+    if atomico and any(not resultado["ok"] for resultado in resultados):
+        raise HTTPException(status_code=422, detail={
+            "mensaje": "Hay ítems inválidos; no se aplicó ningún cambio",
+            "resultados": resultados,
+        })
+
+async def activos_por_nombre(db: AsyncSession, claves) -> Dict[str, int]:
+    """{nombre normalizado: id} de los productos activos que tienen alguno de esos nombres normalizados"""
+    claves = list(claves)
+    existentes = {}
+    for inicio in range(0, len(claves), BULK_CHUNK_SIZE):
+        filas = await db.execute(
+            select(ProductoDB.nombre_normalizado, ProductoDB.id)
+            .where(ProductoDB.activo == True, ProductoDB.nombre_normalizado.in_(claves[inicio:inicio + BULK_CHUNK_SIZE]))
+        )
+        existentes.update(filas.tuples().all())
+    return existentes
+
+async def insertar_en_lote(db: AsyncSession, filas: List[dict]) -> List[int]:
+    """INSERT ... RETURNING de varios productos; devuelve los ids en el orden de `filas`"""
+    tabla = ProductoDB.__table__
+    # SQLAlchemy agrupa las filas en INSERT de varios VALUES; el orden de los ids
+    # devueltos corresponde al de los parámetros
+    return (await db.execute(
+        tabla.insert().returning(tabla.c.id, sort_by_parameter_order=True),
+        filas,
+    )).scalars().all()
+
+async def actualizar_en_lote(db: AsyncSession, cambios: Dict[int, dict]):
+    """UPDATE por id de varios productos ({id: campos}).
+
+    Los productos con el mismo conjunto de campos se aplican juntos con un UPDATE
+    ejecutado en lote.
+    """
+    tabla = ProductoDB.__table__
+    grupos = {}
+    for producto_id, campos in cambios.items():
+        if "nombre" in campos:
+            campos = {**campos, "nombre_normalizado": normalizar_nombre(campos["nombre"])}
+        grupos.setdefault(tuple(sorted(campos)), []).append({"b_id": producto_id, **campos})
+    for columnas, parametros in grupos.items():
+        await db.execute(
+            tabla.update()
+            .where(tabla.c.id == bindparam("b_id"))
+            .values({columna: bindparam(columna) for columna in columnas}),
+            parametros,
+        )
+
+async def eliminar_en_lote(db: AsyncSession, ids: List[int]) -> dict:
+    """DELETE por id en lotes de BULK_CHUNK_SIZE; devuelve {id: (id, categoria, activo)} de los eliminados"""
+    tabla = ProductoDB.__table__
+    eliminados = {}
+    for inicio in range(0, len(ids), BULK_CHUNK_SIZE):
+        filas = await db.execute(
+            tabla.delete()
+            .where(tabla.c.id.in_(ids[inicio:inicio + BULK_CHUNK_SIZE]))
+            .returning(tabla.c.id, tabla.c.categoria, tabla.c.activo)
+        )
+        eliminados.update((fila.id, tuple(fila)) for fila in filas)
+    return eliminados
+
+@router.post("/productos/bulk")
+async def crear_productos_bulk(
+    productos: List[Any] = Body(...),
+    atomico: bool = Query(False, description="Si algún ítem es inválido, no crear ninguno"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Crear muchos productos en una sola transacción.
+
+    Cada ítem se valida por separado: los inválidos y los activos que repiten el
+    nombre de otro producto activo (de la base o de la misma solicitud) se informan
+    en `resultados` (con su índice) y el resto se inserta con un único
+    INSERT ... RETURNING por lotes.
+    """
+    verificar_tamanio_lote(productos)
+
+    resultados = []
+    filas = []
+    claves = {}  # nombre normalizado -> (indice, posición en filas) de los activos
+    for indice, item in enumerate(productos):
+        try:
+            producto = ProductoCreate.model_validate(item)
+        except ValidationError as e:
+            resultados.append({"indice": indice, "ok": False, "error": errores_validacion(e)})
+            continue
+        if producto.activo:
+            clave = normalizar_nombre(producto.nombre)
+            if clave in claves:
+                resultados.append({"indice": indice, "ok": False, "error": f"Nombre repetido (ítem {claves[clave][0]})"})
+                continue
+            claves[clave] = (indice, len(filas))
+        resultados.append({"indice": indice, "ok": True, "id": None})
+        filas.append((indice, producto.model_dump()))
+
+    try:
+        existentes = await activos_por_nombre(db, claves)
+        if existentes:
+            for clave, producto_id in existentes.items():
+                indice, posicion = claves[clave]
+                resultados[indice].update(ok=False, error=f"Ya existe un producto activo con ese nombre (ID {producto_id})")
+                resultados[indice].pop("id")
+                filas[posicion] = None
+            filas = [fila for fila in filas if fila is not None]
+        rechazar_si_hay_errores(resultados, atomico)
+
+        if filas:
+            ids = await insertar_en_lote(db, [valores for _, valores in filas])
+            for (indice, _), producto_id in zip(filas, ids):
+                resultados[indice]["id"] = producto_id
+
+            await refrescar_resumen_categorias(db, [valores["categoria"] for _, valores in filas])
+            await db.commit()
+            invalidar_catalogo_lote([
+                (resultados[indice]["id"], valores["categoria"], valores["activo"]) for indice, valores in filas
+            ])
+
+        return {"creados": len(filas), "errores": len(productos) - len(filas), "resultados": resultados}
+
+    except HTTPException:
+        raise
+    except sa_exc.IntegrityError:
+        raise conflicto_duplicado()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al crear productos: {str(e)}")
+
+@router.patch("/productos/bulk")
+async def actualizar_productos_bulk(
+    productos: List[Any] = Body(...),
+    atomico: bool = Query(False, description="Si algún ítem es inválido o no existe, no actualizar ninguno"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Actualizar campos de muchos productos en una sola transacción.
+
+    Cada ítem lleva el `id` y solo los campos a modificar. Los ítems con el mismo
+    conjunto de campos se aplican juntos con un UPDATE ejecutado en lote.
+    """
+    verificar_tamanio_lote(productos)
+
+    resultados = []
+    cambios = {}  # id -> (indice, campos)
+    for indice, item in enumerate(productos):
+        try:
+            cambio = ProductoBulkUpdate.model_validate(item)
+        except ValidationError as e:
+            resultados.append({"indice": indice, "ok": False, "error": errores_validacion(e)})
+            continue
+        campos = cambio.model_dump(exclude_unset=True, exclude={"id"})
+        nulos = [campo for campo in CAMPOS_OBLIGATORIOS if campo in campos and campos[campo] is None]
+        if nulos:
+            error = f"No se puede dejar en null: {', '.join(nulos)}"
+        elif not campos:
+            error = "No hay campos para actualizar"
+        elif cambio.id in cambios:
+            error = f"Producto {cambio.id} repetido en la solicitud"
+        else:
+            error = None
+        if error:
+            resultados.append({"indice": indice, "ok": False, "id": cambio.id, "error": error})
+            continue
+        resultados.append({"indice": indice, "ok": True, "id": cambio.id})
+        cambios[cambio.id] = (indice, campos)
+
+    try:
+        tabla = ProductoDB.__table__
+        # Estado previo de los productos, para el resumen de categorías y el cache
+        anteriores = {}
+        ids = sorted(cambios)
+        for inicio in range(0, len(ids), BULK_CHUNK_SIZE):
+            filas = await db.execute(
+                select(tabla.c.id, tabla.c.categoria, tabla.c.activo)
+                .where(tabla.c.id.in_(ids[inicio:inicio + BULK_CHUNK_SIZE]))
+            )
+            anteriores.update((fila.id, fila) for fila in filas)
+
+        for producto_id in ids:
+            if producto_id not in anteriores:
+                indice, _ = cambios.pop(producto_id)
+                resultados[indice].update(ok=False, error="Producto no encontrado")
+        rechazar_si_hay_errores(resultados, atomico)
+
+        await actualizar_en_lote(db, {producto_id: campos for producto_id, (_, campos) in cambios.items()})
+
+        afectados = []
+        for producto_id, (_, campos) in cambios.items():
+            anterior = anteriores[producto_id]
+            afectados.append((producto_id, anterior.categoria, anterior.activo))
+            afectados.append((producto_id, campos.get("categoria", anterior.categoria), campos.get("activo", anterior.activo)))
+
+        if cambios:
+            await refrescar_resumen_categorias(db, [categoria for _, categoria, _ in afectados])
+            await db.commit()
+            invalidar_catalogo_lote(afectados)
+
+        return {"actualizados": len(cambios), "errores": len(productos) - len(cambios), "resultados": resultados}
+
+    except HTTPException:
+        raise
+    except sa_exc.IntegrityError:
+        # Un cambio de nombre o una reactivación dejaría dos productos activos con el mismo nombre
+        raise conflicto_duplicado()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al actualizar productos: {str(e)}")
+
+@router.delete("/productos/bulk")
+async def eliminar_productos_bulk(
+    ids: List[int] = Body(..., embed=True),
+    db: AsyncSession = Depends(get_db),
+):
+    """Eliminar muchos productos por ID en una sola transacción (debe declararse antes de /productos/{producto_id})"""
+    verificar_tamanio_lote(ids)
+
+    try:
+        unicos = list(dict.fromkeys(ids))
+        eliminados = await eliminar_en_lote(db, unicos)
+
+        if eliminados:
+            await refrescar_resumen_categorias(db, [categoria for _, categoria, _ in eliminados.values()])
+            await db.commit()
+            invalidar_catalogo_lote(list(eliminados.values()))
+
+        resultados = [
+            {"id": producto_id, "ok": True} if producto_id in eliminados
+            else {"id": producto_id, "ok": False, "error": "Producto no encontrado"}
+            for producto_id in unicos
+        ]
+        return {"eliminados": len(eliminados), "errores": len(unicos) - len(eliminados), "resultados": resultados}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al eliminar productos: {str(e)}")
+
+@router.post("/productos/sync")
+async def sincronizar_catalogo(
+    catalogo: CatalogoSync,
+    dry_run: bool = Query(False, description="Solo calcular el plan, sin aplicar cambios"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Llevar el catálogo al estado descrito en `productos` con el mínimo de cambios.
+
+    Los productos se emparejan por nombre normalizado: se crean los que faltan, se
+    actualizan los campos indicados que difieren y, si `eliminar` es true, se eliminan
+    los que no figuran (o están repetidos en la base). Todo se aplica en una sola
+    transacción; con dry_run se devuelve el plan sin modificar nada.
+    """
+    verificar_tamanio_lote(catalogo.productos)
+    alcance = set(catalogo.categorias) if catalogo.categorias is not None else None
+
+    resultados = []
+    deseados = {}  # clave -> (indice, valores)
+    for indice, item in enumerate(catalogo.productos):
+        try:
+            producto = ProductoCreate.model_validate(item)
+        except ValidationError as e:
+            resultados.append({"indice": indice, "ok": False, "error": errores_validacion(e)})
+            continue
+        clave = normalizar_nombre(producto.nombre)
+        if clave in deseados:
+            error = f"Nombre repetido (ítem {deseados[clave][0]})"
+        elif alcance is not None and producto.categoria not in alcance:
+            error = f"La categoría {producto.categoria} no está entre las sincronizadas"
+        else:
+            error = None
+        if error:
+            resultados.append({"indice": indice, "ok": False, "error": error})
+            continue
+        resultados.append({"indice": indice, "ok": True})
+        deseados[clave] = (indice, producto)
+    rechazar_si_hay_errores(resultados, atomico=True)
+
+    try:
+        # Estado actual en una sola consulta; si hay varios productos con la misma clave
+        # se conserva el activo más antiguo y los demás quedan como sobrantes
+        consulta = select(*COLUMNAS_PRODUCTO).order_by(ProductoDB.activo.desc(), ProductoDB.id)
+        if alcance is not None:
+            consulta = consulta.where(ProductoDB.categoria.in_(sorted(alcance)))
+        actuales = {}
+        sobrantes = []
+        for fila in (await db.execute(consulta)).all():
+            producto = producto_a_dict(fila)
+            clave = normalizar_nombre(producto["nombre"])
+            if clave in deseados and clave not in actuales:
+                actuales[clave] = producto
+            else:
+                sobrantes.append(producto)
+
+        crear = []  # (indice, valores)
+        cambios = {}  # id -> campos
+        plan_actualizar = []
+        for clave, (indice, producto) in deseados.items():
+            actual = actuales.get(clave)
+            if actual is None:
+                crear.append((indice, producto.model_dump()))
+                continue
+            # Solo se comparan los campos presentes en el ítem: los omitidos no se tocan
+            campos = {
+                campo: valor for campo, valor in producto.model_dump(exclude_unset=True).items()
+                if actual[campo] != valor
+            }
+            if campos:
+                cambios[actual["id"]] = campos
+                plan_actualizar.append({
+                    "indice": indice,
+                    "id": actual["id"],
+                    "nombre": actual["nombre"],
+                    "cambios": {campo: {"antes": actual[campo], "despues": valor} for campo, valor in campos.items()},
+                })
+        eliminar = sobrantes if catalogo.eliminar else []
+
+        if alcance is not None:
+            # Un producto nuevo no puede repetir el nombre de uno activo de otra categoría
+            nuevos = {normalizar_nombre(valores["nombre"]): indice for indice, valores in crear if valores["activo"]}
+            for clave, producto_id in (await activos_por_nombre(db, nuevos)).items():
+                resultados[nuevos[clave]].update(
+                    ok=False, error=f"Ya existe un producto activo con ese nombre fuera de las categorías sincronizadas (ID {producto_id})"
+                )
+            rechazar_si_hay_errores(resultados, atomico=True)
+
+        plan = {
+            "crear": [{"indice": indice, "nombre": valores["nombre"], "id": None} for indice, valores in crear],
+            "actualizar": plan_actualizar,
+            "eliminar": [{"id": producto["id"], "nombre": producto["nombre"]} for producto in eliminar],
+        }
+        respuesta = {
+            "aplicado": False,
+            "creados": len(crear),
+            "actualizados": len(cambios),
+            "eliminados": len(eliminar),
+            "sin_cambios": len(actuales) - len(cambios),
+            "plan": plan,
+        }
+        if dry_run or not (crear or cambios or eliminar):
+            return respuesta
+
+        # Primero las bajas y después las actualizaciones y altas, para que el índice único
+        # de nombres activos no vea dos versiones del mismo producto a la vez
+        afectados = []
+        if eliminar:
+            eliminados = await eliminar_en_lote(db, [producto["id"] for producto in eliminar])
+            afectados.extend(eliminados.values())
+            respuesta["eliminados"] = len(eliminados)
+        if cambios:
+            await actualizar_en_lote(db, cambios)
+            actuales_por_id = {producto["id"]: producto for producto in actuales.values()}
+            for producto_id, campos in cambios.items():
+                anterior = actuales_por_id[producto_id]
+                afectados.append((producto_id, anterior["categoria"], anterior["activo"]))
+                afectados.append((producto_id, campos.get("categoria", anterior["categoria"]), campos.get("activo", anterior["activo"])))
+        if crear:
+            ids = await insertar_en_lote(db, [valores for _, valores in crear])
+            for entrada, (_, valores), producto_id in zip(plan["crear"], crear, ids):
+                entrada["id"] = producto_id
+                afectados.append((producto_id, valores["categoria"], valores["activo"]))
+
+        await refrescar_resumen_categorias(db, [categoria for _, categoria, _ in afectados])
+        await db.commit()
+        invalidar_catalogo_lote(afectados)
+
+        respuesta["aplicado"] = True
+        return respuesta
+
+    except HTTPException:
+        raise
+    except sa_exc.IntegrityError:
+        raise conflicto_duplicado()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al sincronizar el catálogo: {str(e)}")
+
+@router.get("/categorias")
+async def get_categorias(request: Request, db: AsyncSession = Depends(get_db)):
+    """Obtener las categorías disponibles, con cantidad de productos y rango de precios"""
+    clave = ("categorias",)
+    cacheado = catalogo_cache.get(clave)
+    if cacheado is not None:
+        return respuesta_catalogo(request, *cacheado)
+
     try:
-        categorias_result = db.query(ProductoDB.categoria).filter(ProductoDB.activo == True).distinct().order_by(ProductoDB.categoria).all()
-        categorias = [categoria[0] for categoria in categorias_result if categoria[0]]
+        generacion = catalogo_cache.generacion()
+        # Se lee el resumen mantenido en cada escritura, no la tabla de productos
+        filas = (await db.execute(
+            select(
+                CategoriaResumenDB.categoria,
+                CategoriaResumenDB.productos_activos,
+                CategoriaResumenDB.precio_min,
+                CategoriaResumenDB.precio_max,
+                CategoriaResumenDB.precio_mayorista_min,
+            ).where(CategoriaResumenDB.productos_activos > 0).order_by(CategoriaResumenDB.categoria)
+        )).all()
+        categorias = [fila.categoria for fila in filas]
+        resumen = [
+            {
+                "categoria": fila.categoria,
+                "productos": fila.productos_activos,
+                "precio_min": fila.precio_min,
+                "precio_max": fila.precio_max,
+                "precio_mayorista_min": fila.precio_mayorista_min,
+            }
+            for fila in filas
+        ]
         
-        return {"categorias": categorias}
+        contenido = encode_json({"categorias": categorias, "resumen": resumen})
+        headers = cabeceras_catalogo(contenido, {})
+        catalogo_cache.set(clave, (contenido, headers), generacion)
+        return respuesta_catalogo(request, contenido, headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener categorías: {str(e)}")
 
-@app.post("/pedidos", response_model=PedidoResponse)
-async def crear_pedido(pedido: PedidoRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Crear un nuevo pedido y enviar notificación por email"""
-    try:
-        pedido_db = PedidoDB(
-            nombre=pedido.nombre,
-            email=pedido.email,
-            telefono=pedido.telefono,
-            producto_id=pedido.producto_id,
-            producto_nombre=pedido.producto_nombre,
-            cantidad=pedido.cantidad,
-            comentarios=pedido.comentarios
-        )
+class ClavesIdempotencia:
+    """Respuestas ya dadas por clave de idempotencia: LRU acotado con TTL.
+
+    `reservar(clave, huella)` serializa las solicitudes con la misma clave: una
+    repetición concurrente espera a que termine la primera y recibe su respuesta.
+    Solo se guardan las respuestas exitosas; si la primera falla, la siguiente
+    en espera procesa el pedido. La huella (hash del cuerpo) detecta el reuso de
+    una clave con otro pedido.
+    """
+
+    def __init__(self, max_entradas: int, ttl: float):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # clave -> (expira, huella, respuesta)
+        self._en_curso = {}  # clave -> [asyncio.Lock, solicitudes que la usan]
+
+    def _obtener(self, clave: str, huella: str):
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        expira, huella_guardada, respuesta = entrada
+        if expira < time.monotonic():
+            del self._entradas[clave]
+            return None
+        if huella_guardada != huella:
+            raise HTTPException(status_code=422, detail="La Idempotency-Key ya se usó con otro pedido")
+        self._entradas.move_to_end(clave)
+        return respuesta
+
+    def guardar(self, clave: str, huella: str, respuesta):
+        if self.max_entradas <= 0:
+            return
+        self._entradas[clave] = (time.monotonic() + self.ttl, huella, respuesta)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    @asynccontextmanager
+    async def reservar(self, clave: str, huella: str):
+        """Esperar el turno de la clave; entrega la respuesta guardada o None"""
+        en_curso = self._en_curso.setdefault(clave, [asyncio.Lock(), 0])
+        en_curso[1] += 1
+        try:
+            async with en_curso[0]:
+                yield self._obtener(clave, huella)
+        finally:
+            en_curso[1] -= 1
+            if not en_curso[1]:
+                del self._en_curso[clave]
+
+claves_idempotencia = ClavesIdempotencia(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL)
+
+@router.post("/pedidos", response_model=PedidoResponse)
+async def crear_pedido(
+    pedido: PedidoRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+    db: AsyncSession = Depends(get_db),
+):
+    """Crear un nuevo pedido y dejar su notificación por email en la bandeja de salida.
+
+    Con el header `Idempotency-Key`, los reintentos con la misma clave devuelven la
+    respuesta original sin registrar otro pedido ni enviar otro email.
+    """
+    if not idempotency_key:
+        return await registrar_pedido(pedido, db)
+    huella = hashlib.sha256(encode_json(pedido.model_dump())).hexdigest()
+    async with claves_idempotencia.reservar(idempotency_key, huella) as anterior:
+        if anterior is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return anterior
+        respuesta = await registrar_pedido(pedido, db)
+        claves_idempotencia.guardar(idempotency_key, huella, respuesta)
+        return respuesta
+
+def lineas_pedido(pedido: PedidoRequest) -> List[Tuple[int, int]]:
+    """(producto_id, cantidad) del pedido, sumando las repetidas y ordenadas por id"""
+    if pedido.items is not None:
+        if pedido.producto_id is not None:
+            raise HTTPException(status_code=422, detail="Enviar items o producto_id, no ambos")
+        items = [(item.producto_id, item.cantidad) for item in pedido.items]
+    elif pedido.producto_id is not None and pedido.cantidad is not None:
+        items = [(pedido.producto_id, pedido.cantidad)]
+    else:
+        raise HTTPException(status_code=422, detail="El pedido debe tener items o producto_id y cantidad")
+    if not items:
+        raise HTTPException(status_code=422, detail="El pedido no tiene items")
+    if len(items) > PEDIDO_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {PEDIDO_MAX_ITEMS} items por pedido")
+    cantidades = {}
+    for producto_id, cantidad in items:
+        if cantidad <= 0:
+            raise HTTPException(status_code=422, detail=f"Cantidad inválida para el producto {producto_id}")
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return sorted(cantidades.items())
+
+async def error_de_reserva(db: AsyncSession, producto_id: int, cantidad: int) -> HTTPException:
+    tabla = ProductoDB.__table__
+    disponible = (await db.execute(
+        select(tabla.c.stock).where(tabla.c.id == producto_id, tabla.c.activo == True)
+    )).first()
+    if disponible is None:
+        return HTTPException(status_code=404, detail={
+            "mensaje": "Producto no encontrado o inactivo",
+            "producto_id": producto_id,
+        })
+    return HTTPException(status_code=409, detail={
+        "mensaje": "Stock insuficiente",
+        "producto_id": producto_id,
+        "solicitado": cantidad,
+        "disponible": disponible.stock,
+    })
+
+async def reservar_stock_lote(db: AsyncSession, lineas_por_pedido: List[List[Tuple[int, int]]]) -> list:
+    """Descontar el stock de las líneas de varios pedidos con un UPDATE condicional por línea.
+
+    El UPDATE solo afecta al producto si está activo y le alcanza el stock (NULL es
+    sin límite), así que dos pedidos concurrentes nunca venden más de lo que hay.
+    Las líneas de todos los pedidos se recorren en orden de producto_id: las
+    transacciones concurrentes toman los bloqueos de fila en el mismo orden y no
+    pueden bloquearse entre sí. Cada pedido es todo o nada: si una de sus líneas no
+    se puede reservar, se devuelve el stock de las anteriores (filas que esta
+    transacción ya tiene bloqueadas) y se saltean las siguientes.
+
+    Devuelve, por pedido, la lista de líneas reservadas o la HTTPException (404/409)
+    que explica por qué no se pudo reservar.
+    """
+    tabla = ProductoDB.__table__
+    reservadas = [{} for _ in lineas_por_pedido]
+    errores = {}
+    pendientes = sorted(
+        (producto_id, indice, cantidad)
+        for indice, lineas in enumerate(lineas_por_pedido)
+        for producto_id, cantidad in lineas
+    )
+    for producto_id, indice, cantidad in pendientes:
+        if indice in errores:
+            continue
+        fila = (await db.execute(
+            tabla.update()
+            .where(
+                tabla.c.id == producto_id,
+                tabla.c.activo == True,
+                or_(tabla.c.stock == None, tabla.c.stock >= cantidad),
+            )
+            .values(stock=tabla.c.stock - cantidad)
+            .returning(tabla.c.nombre, tabla.c.precio, tabla.c.precio_mayorista, tabla.c.minimo_mayorista, tabla.c.categoria)
+        )).first()
+        if fila is None:
+            errores[indice] = await error_de_reserva(db, producto_id, cantidad)
+            if reservadas[indice]:
+                await db.execute(
+                    tabla.update().where(tabla.c.id == bindparam("b_id")).values(stock=tabla.c.stock + bindparam("b_cantidad")),
+                    [{"b_id": item["producto_id"], "b_cantidad": item["cantidad"]} for item in reservadas[indice].values()],
+                )
+            continue
+        mayorista = fila.precio_mayorista is not None and cantidad >= (fila.minimo_mayorista or 1)
+        reservadas[indice][producto_id] = {
+            "producto_id": producto_id,
+            "producto_nombre": fila.nombre,
+            "cantidad": cantidad,
+            "precio_unitario": fila.precio_mayorista if mayorista else fila.precio,
+            "categoria": fila.categoria,
+        }
+    return [errores.get(indice) or list(reservadas[indice].values()) for indice in range(len(lineas_por_pedido))]
+
+def sumar_al_resumen(por_dia: dict, por_producto: dict, dia: date, estado: str, unidades: int, items: List[dict], signo: int = 1):
+    """Acumular en los deltas de los resúmenes el aporte de un pedido (signo -1 para quitarlo)"""
+    total = por_dia.setdefault((dia, estado), {"pedidos": 0, "unidades": 0, "importe": 0.0})
+    total["pedidos"] += signo
+    total["unidades"] += signo * (unidades or 0)
+    for item in items:
+        importe = signo * item["cantidad"] * (item["precio_unitario"] or 0)
+        total["importe"] += importe
+        fila = por_producto.setdefault((dia, item["producto_id"], estado), {
+            "producto_nombre": item["producto_nombre"],
+            "categoria": item["categoria"],
+            "pedidos": 0,
+            "unidades": 0,
+            "importe": 0.0,
+        })
+        fila["pedidos"] += signo
+        fila["unidades"] += signo * item["cantidad"]
+        fila["importe"] += importe
+
+async def registrar_deltas_resumen(db: AsyncSession, por_dia: dict, por_producto: dict):
+    """INSERT de los deltas de los resúmenes diarios (sin commit); los traspasa ConsolidacionResumen"""
+    filas = [
+        {"dia": dia, "producto_id": None, "estado": estado, "producto_nombre": None, "categoria": None, **valores}
+        for (dia, estado), valores in por_dia.items()
+    ]
+    filas += [
+        {"dia": dia, "producto_id": producto_id, "estado": estado, **valores}
+        for (dia, producto_id, estado), valores in por_producto.items()
+    ]
+    if filas:
+        await db.execute(ResumenPedidosDeltaDB.__table__.insert(), filas)
+
+async def actualizar_resumen_pedidos(db: AsyncSession, por_dia: dict, por_producto: dict):
+    """Aplicar deltas a los resúmenes diarios con INSERT ... ON CONFLICT DO UPDATE (sin commit).
+
+    Las filas se actualizan en orden de clave para que dos transacciones
+    concurrentes no se bloqueen mutuamente. Las que quedan en cero (todos sus
+    pedidos pasaron a otro estado) se borran.
+    """
+    for tabla, deltas, claves in (
+        (ResumenPedidosDiaDB.__table__, por_dia, ("dia", "estado")),
+        (ResumenProductosDiaDB.__table__, por_producto, ("dia", "producto_id", "estado")),
+    ):
+        if not deltas:
+            continue
+        consulta = insert_upsert(tabla)
+        acumular = {campo: tabla.c[campo] + consulta.excluded[campo] for campo in ("pedidos", "unidades", "importe")}
+        acumular.update({campo: consulta.excluded[campo] for campo in ("producto_nombre", "categoria") if campo in tabla.c})
+        filas = [{**dict(zip(claves, clave)), **valores} for clave, valores in sorted(deltas.items())]
+        await db.execute(consulta.on_conflict_do_update(index_elements=list(claves), set_=acumular), filas)
+        vacias = [fila for fila in filas if fila["pedidos"] <= 0]
+        if vacias:
+            await db.execute(
+                tabla.delete().where(*[tabla.c[campo] == bindparam(f"b_{campo}") for campo in claves], tabla.c.pedidos <= 0),
+                [{f"b_{campo}": fila[campo] for campo in claves} for fila in vacias],
+            )
+
+async def traspasar_resumen_productos(db: AsyncSession, sobrantes: Dict[int, int], conservados: Dict[int, dict]):
+    """Pasar a cada producto conservado los resúmenes diarios de los que se fusionan en él (sin commit).
+
+    `sobrantes` va de id sobrante a id conservado; `conservados` tiene el
+    producto_nombre y la categoria con que quedan las filas de cada conservado.
+    """
+    deltas = ResumenPedidosDeltaDB.__table__
+    # Primero los deltas pendientes: si un traspaso en curso los tiene bloqueados, se espera
+    # a que termine, y lo que sumó a las filas del sobrante se mueve abajo con el resto
+    await db.execute(
+        deltas.update()
+        .where(deltas.c.producto_id == bindparam("b_sobrante"))
+        .values(producto_id=bindparam("b_conservado"), producto_nombre=bindparam("b_nombre"), categoria=bindparam("b_categoria")),
+        [
+            {"b_sobrante": sobrante, "b_conservado": conservado, "b_nombre": conservados[conservado]["producto_nombre"],
+             "b_categoria": conservados[conservado]["categoria"]}
+            for sobrante, conservado in sobrantes.items()
+        ],
+    )
+    tabla = ResumenProductosDiaDB.__table__
+    filas = (await db.execute(tabla.delete().where(tabla.c.producto_id.in_(list(sobrantes))).returning(*tabla.c))).all()
+    por_producto = {}
+    for fila in filas:
+        conservado = sobrantes[fila.producto_id]
+        total = por_producto.setdefault((fila.dia, conservado, fila.estado), {**conservados[conservado], "pedidos": 0, "unidades": 0, "importe": 0.0})
+        total["pedidos"] += fila.pedidos
+        total["unidades"] += fila.unidades
+        total["importe"] += fila.importe
+    await actualizar_resumen_pedidos(db, {}, por_producto)
+
+class ConsolidacionResumen:
+    """Traspaso en segundo plano de resumen_pedidos_deltas a los resúmenes diarios (una tarea por proceso).
+
+    Los pedidos no actualizan los resúmenes en su propia transacción: la fila del
+    día es la misma para todos los pedidos nuevos y su bloqueo serializaría los
+    commits. Cada pedido inserta sus deltas y esta tarea los suma cada
+    ROLLUP_FOLD_INTERVAL segundos. Los deltas se borran y se suman en la misma
+    transacción, así que ninguno se pierde ni se cuenta dos veces. /pedidos/analytics
+    agrega los deltas pendientes, por lo que sus números no dependen de la tarea.
+    """
+
+    def __init__(self):
+        self.tarea: Optional[asyncio.Task] = None
+        self.activa = False
+        self.aviso = asyncio.Event()
+
+    async def consolidar(self) -> int:
+        """Traspasar hasta ROLLUP_FOLD_BATCH deltas; devuelve cuántos se traspasaron"""
+        tabla = ResumenPedidosDeltaDB.__table__
+        lote = select(tabla.c.id).order_by(tabla.c.id).limit(ROLLUP_FOLD_BATCH).with_for_update(skip_locked=True)
+        consulta = tabla.delete().where(tabla.c.id.in_(lote.scalar_subquery())).returning(*tabla.c)
+        async with AsyncSessionLocal() as db:
+            filas = (await db.execute(consulta)).all()
+            if not filas:
+                return 0
+            por_dia, por_producto = {}, {}
+            # En orden de id: el nombre y la categoría del producto quedan con los valores más recientes
+            for fila in sorted(filas, key=lambda fila: fila.id):
+                if fila.producto_id is None:
+                    total = por_dia.setdefault((fila.dia, fila.estado), {"pedidos": 0, "unidades": 0, "importe": 0.0})
+                else:
+                    total = por_producto.setdefault((fila.dia, fila.producto_id, fila.estado), {"pedidos": 0, "unidades": 0, "importe": 0.0})
+                    total["producto_nombre"] = fila.producto_nombre
+                    total["categoria"] = fila.categoria
+                total["pedidos"] += fila.pedidos
+                total["unidades"] += fila.unidades
+                total["importe"] += fila.importe
+            await actualizar_resumen_pedidos(db, por_dia, por_producto)
+            await db.commit()
+        return len(filas)
+
+    async def _ciclo(self):
+        while self.activa:
+            try:
+                # Un lote completo indica que quedan más deltas: seguir sin esperar
+                if await self.consolidar() >= ROLLUP_FOLD_BATCH:
+                    continue
+            except Exception as e:
+                print(f"Error al consolidar los resúmenes de pedidos: {e}")
+            try:
+                await asyncio.wait_for(self.aviso.wait(), timeout=ROLLUP_FOLD_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def iniciar(self):
+        self.activa = True
+        self.aviso.clear()
+        self.tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self):
+        """Terminar el traspaso en curso; los deltas que queden se traspasan en el próximo inicio"""
+        self.activa = False
+        self.aviso.set()
+        if self.tarea is not None and not self.tarea.done():
+            try:
+                await asyncio.wait_for(self.tarea, timeout=30)
+            except asyncio.TimeoutError:
+                print("El traspaso de los resúmenes de pedidos no terminó a tiempo")
+
+consolidacion = ConsolidacionResumen()
+
+async def guardar_pedidos(db: AsyncSession, pedidos: List[Tuple[PedidoRequest, List[dict]]]) -> Tuple[List[int], List[bool]]:
+    """INSERT de pedidos con el stock ya reservado, sus líneas y sus emails (sin commit).
+
+    Los pedidos van en un solo INSERT de varias filas con RETURNING. Devuelve los ids
+    en el orden de `pedidos` y, para cada uno, si su email quedó en la bandeja de salida.
+
+    Corre después de reservar_stock_lote, porque las líneas guardan el nombre y el
+    precio que devolvió el UPDATE de la reserva. Por eso las filas de los productos
+    reservados quedan bloqueadas desde la reserva hasta el commit. Para que ese tramo
+    sea corto, acá solo hay INSERTs de varias filas (pedidos, líneas, bandeja de
+    salida y deltas de los resúmenes): ninguna lectura ni fila compartida que esperar.
+    """
+    tabla = PedidoDB.__table__
+    filas = []
+    for pedido, items in pedidos:
+        filas.append({
+            "nombre": pedido.nombre,
+            "email": pedido.email,
+            "telefono": pedido.telefono,
+            "producto_id": items[0]["producto_id"] if len(items) == 1 else None,
+            "producto_nombre": items[0]["producto_nombre"] if len(items) == 1 else (
+                f"{items[0]['producto_nombre']} y {len(items) - 1} productos más"
+            ),
+            "cantidad": sum(item["cantidad"] for item in items),
+            "comentarios": pedido.comentarios,
+        })
+    creados = (await db.execute(
+        tabla.insert().returning(tabla.c.id, tabla.c.fecha_pedido, sort_by_parameter_order=True), filas
+    )).all()
+    ids = [creado.id for creado in creados]
+    
+    await db.execute(PedidoItemDB.__table__.insert(), [
+        {"pedido_id": pedido_id, **{campo: item[campo] for campo in ItemPedidoResponse.model_fields}}
+        for pedido_id, (_, items) in zip(ids, pedidos)
+        for item in items
+    ])
+    
+    # El email queda en la bandeja de salida en la misma transacción que el pedido
+    emails = [None] * len(ids)
+    if MAIL_ENABLED:
+        emails = [email_pendiente(pedido, pedido_id, items) for pedido_id, (pedido, items) in zip(ids, pedidos)]
+        if any(emails):
+            await db.execute(EmailOutboxDB.__table__.insert(), [email for email in emails if email is not None])
+    
+    por_dia, por_producto = {}, {}
+    for creado, fila, (_, items) in zip(creados, filas, pedidos):
+        sumar_al_resumen(por_dia, por_producto, creado.fecha_pedido.date(), ESTADOS_PEDIDO[0], fila["cantidad"], items)
+    await registrar_deltas_resumen(db, por_dia, por_producto)
+    return ids, [email is not None for email in emails]
+
+def pedidos_confirmados(items: List[dict], hay_emails: bool):
+    """Después del commit: el stock figura en el catálogo y la bandeja tiene emails nuevos"""
+    invalidar_catalogo_lote([(item["producto_id"], item["categoria"], True) for item in items], cambia_categorias=False)
+    if hay_emails:
+        bandeja.avisar()
+
+def respuesta_pedido(pedido_id: int, items: List[dict], email_en_bandeja: bool) -> PedidoResponse:
+    if email_en_bandeja:
+        aviso = "La notificación por email se enviará en breve."
+    elif not MAIL_ENABLED:
+        aviso = "Las notificaciones por email están desactivadas."
+    else:
+        aviso = "No hay destinatario configurado para la notificación por email."
+    return PedidoResponse(
+        id=pedido_id,
+        mensaje=f"Pedido #{pedido_id} registrado correctamente. {aviso}",
+        items=[ItemPedidoResponse(**item) for item in items],
+    )
+
+class IngestaPedidos:
+    """Group commit de POST /pedidos (PEDIDOS_GROUP_COMMIT=true).
+
+    Cada solicitud encola su pedido y espera. Una sola tarea junta los que llegan
+    durante PEDIDOS_GROUP_COMMIT_MS (hasta PEDIDOS_GROUP_COMMIT_MAX), reserva el
+    stock de todos, los inserta con un INSERT de varias filas y confirma el lote
+    con un solo commit. Cada solicitud recibe su id recién después del commit: la
+    durabilidad es la misma que con un commit por pedido. Un pedido sin stock se
+    rechaza sin afectar a los demás; un error de la base rechaza el lote entero.
+    """
+
+    def __init__(self):
+        self.cola: Optional[asyncio.Queue] = None
+        self.tarea: Optional[asyncio.Task] = None
+
+    async def registrar(self, pedido: PedidoRequest, lineas: List[Tuple[int, int]]) -> PedidoResponse:
+        if self.tarea is None or self.tarea.done():
+            self.cola = asyncio.Queue()
+            self.tarea = asyncio.create_task(self._ciclo())
+        futuro = asyncio.get_running_loop().create_future()
+        self.cola.put_nowait((pedido, lineas, futuro))
+        return await futuro
+
+    async def _ciclo(self):
+        while True:
+            lote = [await self.cola.get()]
+            # Ventana para juntar más pedidos, salvo que ya haya un lote completo esperando
+            if PEDIDOS_GROUP_COMMIT_MS > 0 and self.cola.qsize() < PEDIDOS_GROUP_COMMIT_MAX - 1:
+                await asyncio.sleep(PEDIDOS_GROUP_COMMIT_MS / 1000)
+            while len(lote) < PEDIDOS_GROUP_COMMIT_MAX and not self.cola.empty():
+                lote.append(self.cola.get_nowait())
+            await self._procesar(lote)
+
+    async def _procesar(self, lote: list):
+        def responder(futuro, resultado):
+            # La solicitud pudo haberse cancelado (cliente desconectado) mientras esperaba
+            if futuro.done():
+                return
+            if isinstance(resultado, Exception):
+                futuro.set_exception(resultado)
+            else:
+                futuro.set_result(resultado)
         
-        db.add(pedido_db)
-        db.commit()
-        db.refresh(pedido_db)
+        aceptados = []
+        try:
+            async with AsyncSessionLocal() as db:
+                reservas = await reservar_stock_lote(db, [lineas for _, lineas, _ in lote])
+                for (pedido, _, futuro), reserva in zip(lote, reservas):
+                    if isinstance(reserva, HTTPException):
+                        responder(futuro, reserva)
+                    else:
+                        aceptados.append((pedido, reserva, futuro))
+                if not aceptados:
+                    return
+                ids, en_bandeja = await guardar_pedidos(db, [(pedido, items) for pedido, items, _ in aceptados])
+                await db.commit()
+        except Exception as e:
+            print(f"Error al registrar un lote de {len(lote)} pedidos: {e}")
+            for _, _, futuro in lote:
+                responder(futuro, HTTPException(status_code=500, detail=f"Error al crear pedido: {str(e)}"))
+            return
         
-        # Enviar email en background solo si está configurado
-        if MAIL_USERNAME:
-            background_tasks.add_task(send_order_email, pedido, pedido_db.id)
+        pedidos_confirmados([item for _, items, _ in aceptados for item in items], any(en_bandeja))
+        for (_, items, futuro), pedido_id, email_en_bandeja in zip(aceptados, ids, en_bandeja):
+            responder(futuro, respuesta_pedido(pedido_id, items, email_en_bandeja))
+
+    async def detener(self):
+        # Al apagar, uvicorn ya esperó a las solicitudes en curso: la cola está vacía
+        if self.tarea is not None and not self.tarea.done():
+            self.tarea.cancel()
+            try:
+                await self.tarea
+            except asyncio.CancelledError:
+                pass
+
+ingesta_pedidos = IngestaPedidos()
+
+async def registrar_pedido(pedido: PedidoRequest, db: AsyncSession) -> PedidoResponse:
+    lineas = lineas_pedido(pedido)
+    if PEDIDOS_GROUP_COMMIT:
+        return await ingesta_pedidos.registrar(pedido, lineas)
+    try:
+        (reserva,) = await reservar_stock_lote(db, [lineas])
+        if isinstance(reserva, HTTPException):
+            raise reserva
+        (pedido_id,), (email_en_bandeja,) = await guardar_pedidos(db, [(pedido, reserva)])
+        await db.commit()
+        pedidos_confirmados(reserva, email_en_bandeja)
+        return respuesta_pedido(pedido_id, reserva, email_en_bandeja)
         
-        return PedidoResponse(
-            id=pedido_db.id,
-            mensaje=f"Pedido #{pedido_db.id} registrado correctamente. Se ha enviado una notificación por email."
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error al crear pedido: {str(e)}")
+
+COLUMNAS_EXPORT_PEDIDO = (
+    "id", "nombre", "email", "telefono", "producto_id", "producto_nombre",
+    "cantidad", "comentarios", "fecha_pedido", "estado",
+)
+COLUMNAS_EXPORT_ITEM = ("producto_id", "producto_nombre", "cantidad", "precio_unitario")
+
+def fecha_de_filtro(valor: str, parametro: str, fin: bool = False) -> datetime:
+    """Fecha de desde/hasta en ISO 8601; un `hasta` sin hora incluye todo ese día"""
+    try:
+        fecha = datetime.fromisoformat(valor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida en '{parametro}' (usar AAAA-MM-DD o ISO 8601)")
+    if fecha.tzinfo is not None:
+        # fecha_pedido se guarda en hora local del servidor, sin zona
+        fecha = fecha.astimezone().replace(tzinfo=None)
+    if fin and len(valor) == 10:
+        fecha += timedelta(days=1)
+    return fecha
+
+async def pedidos_exportados(desde: Optional[datetime], hasta: Optional[datetime]):
+    """Pedidos con sus líneas, del más antiguo al más reciente, en lotes de hasta EXPORT_BATCH_SIZE filas.
+
+    Un solo SELECT con LEFT JOIN a pedido_items, leído con un cursor del servidor
+    (yield_per): en memoria solo hay un lote a la vez, sin importar cuántos pedidos
+    haya. La sesión se abre acá y no en la dependencia, porque la respuesta se sigue
+    generando después de que termina el endpoint.
+    """
+    pedidos = PedidoDB.__table__
+    lineas = PedidoItemDB.__table__
+    consulta = (
+        select(
+            *[pedidos.c[columna] for columna in COLUMNAS_EXPORT_PEDIDO],
+            *[lineas.c[columna].label(f"item_{columna}") for columna in COLUMNAS_EXPORT_ITEM],
         )
+        .select_from(pedidos.outerjoin(lineas, lineas.c.pedido_id == pedidos.c.id))
+        .order_by(pedidos.c.fecha_pedido, pedidos.c.id, lineas.c.id)
+    )
+    if desde is not None:
+        consulta = consulta.where(pedidos.c.fecha_pedido >= desde)
+    if hasta is not None:
+        consulta = consulta.where(pedidos.c.fecha_pedido < hasta)
+    
+    cantidad_columnas = len(COLUMNAS_EXPORT_PEDIDO)
+    async with AsyncSessionLocal() as db:
+        resultado = await db.stream(consulta.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        actual = None
+        async for filas in resultado.partitions():
+            completos = []
+            # Las líneas de un pedido llegan seguidas; el pedido se entrega al empezar el siguiente
+            for fila in filas:
+                if actual is None or actual["id"] != fila.id:
+                    if actual is not None:
+                        completos.append(actual)
+                    actual = dict(zip(COLUMNAS_EXPORT_PEDIDO, fila[:cantidad_columnas]))
+                    if actual["fecha_pedido"] is not None:
+                        actual["fecha_pedido"] = actual["fecha_pedido"].isoformat()
+                    actual["items"] = []
+                if fila.item_producto_id is not None:
+                    actual["items"].append(dict(zip(COLUMNAS_EXPORT_ITEM, fila[cantidad_columnas:])))
+            if completos:
+                yield completos
+        if actual is not None:
+            yield [actual]
+
+async def exportar_ndjson(desde: Optional[datetime], hasta: Optional[datetime]):
+    async for pedidos in pedidos_exportados(desde, hasta):
+        yield b"".join(encode_json(pedido) + b"\n" for pedido in pedidos)
+
+async def exportar_csv(desde: Optional[datetime], hasta: Optional[datetime]):
+    """Una fila por línea de pedido; los pedidos sin líneas (anteriores a pedido_items) ocupan una"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM: Excel abre el archivo como UTF-8 (acentos)
+    buffer.write("\ufeff")
+    escritor.writerow([*COLUMNAS_EXPORT_PEDIDO, *[f"item_{columna}" for columna in COLUMNAS_EXPORT_ITEM]])
+    async for pedidos in pedidos_exportados(desde, hasta):
+        for pedido in pedidos:
+            datos = [pedido[columna] for columna in COLUMNAS_EXPORT_PEDIDO]
+            for item in pedido["items"] or [dict.fromkeys(COLUMNAS_EXPORT_ITEM)]:
+                escritor.writerow([*datos, *[item[columna] for columna in COLUMNAS_EXPORT_ITEM]])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+@router.get("/pedidos/export")
+async def exportar_pedidos(
+    formato: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    desde: Optional[str] = Query(None, description="Fecha inicial (incluida), AAAA-MM-DD o ISO 8601"),
+    hasta: Optional[str] = Query(None, description="Fecha final (excluida; si es solo fecha, se incluye ese día)"),
+):
+    """Exportar los pedidos con sus líneas en NDJSON (un pedido por línea) o CSV.
+
+    La respuesta se genera a medida que se leen los pedidos, con memoria constante
+    sin importar el tamaño de la exportación.
+    """
+    inicio = fecha_de_filtro(desde, "desde") if desde else None
+    fin = fecha_de_filtro(hasta, "hasta", fin=True) if hasta else None
+    nombre = f"pedidos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    headers = {"Content-Disposition": f'attachment; filename="{nombre}"'}
+    if formato == "csv":
+        return StreamingResponse(exportar_csv(inicio, fin), media_type="text/csv; charset=utf-8", headers=headers)
+    return StreamingResponse(exportar_ndjson(inicio, fin), media_type="application/x-ndjson", headers=headers)
+
+def dia_de_filtro(valor: Optional[str], parametro: str, defecto: date) -> date:
+    if not valor:
+        return defecto
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida en '{parametro}' (usar AAAA-MM-DD)")
+
+@router.get("/pedidos/analytics")
+async def analytics_pedidos(
+    desde: Optional[str] = Query(None, description="Primer día (incluido), AAAA-MM-DD; por defecto hace 30 días"),
+    hasta: Optional[str] = Query(None, description="Último día (incluido), AAAA-MM-DD; por defecto hoy"),
+    limite: int = Query(10, ge=1, le=100, description="Cantidad de productos en top_productos"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Métricas de pedidos por día de creación, leídas de los resúmenes diarios.
+
+    - `por_estado` y `volumen_diario`: pedidos, unidades e importe.
+    - `top_productos`: productos con más unidades pedidas, sin contar pedidos cancelados.
+    - `conversion_por_categoria`: pedidos con productos de la categoría y cuántos
+      llegaron a un estado convertido (confirmado, enviado o entregado). Un pedido
+      con dos productos de la misma categoría cuenta dos veces.
+
+    No se recorre la tabla de pedidos: se suman los resúmenes del rango y los
+    deltas que aún no se traspasaron, así que el costo depende de la cantidad de
+    días y productos, no de la cantidad de pedidos.
+    """
+    hoy = date.today()
+    inicio = dia_de_filtro(desde, "desde", hoy - timedelta(days=ANALYTICS_DIAS - 1))
+    fin = dia_de_filtro(hasta, "hasta", hoy)
+    if inicio > fin:
+        raise HTTPException(status_code=400, detail="'desde' no puede ser posterior a 'hasta'")
+    
+    resumen_dia = ResumenPedidosDiaDB.__table__
+    resumen_producto = ResumenProductosDiaDB.__table__
+    deltas = ResumenPedidosDeltaDB.__table__
+    campos_dia = ("dia", "estado", "pedidos", "unidades", "importe")
+    campos_producto = ("dia", "producto_id", "estado", "producto_nombre", "categoria", "pedidos", "unidades", "importe")
+    por_dia = union_all(
+        select(*[resumen_dia.c[campo] for campo in campos_dia]).where(resumen_dia.c.dia.between(inicio, fin)),
+        select(*[deltas.c[campo] for campo in campos_dia]).where(deltas.c.producto_id == None, deltas.c.dia.between(inicio, fin)),
+    ).subquery()
+    por_producto = union_all(
+        select(*[resumen_producto.c[campo] for campo in campos_producto]).where(resumen_producto.c.dia.between(inicio, fin)),
+        select(*[deltas.c[campo] for campo in campos_producto]).where(deltas.c.producto_id != None, deltas.c.dia.between(inicio, fin)),
+    ).subquery()
+    try:
+        por_estado = (await db.execute(
+            select(por_dia.c.estado, func.sum(por_dia.c.pedidos), func.sum(por_dia.c.unidades), func.sum(por_dia.c.importe))
+            .group_by(por_dia.c.estado)
+            .having(func.sum(por_dia.c.pedidos) > 0)
+            .order_by(por_dia.c.estado)
+        )).all()
+        volumen = (await db.execute(
+            select(por_dia.c.dia, func.sum(por_dia.c.pedidos), func.sum(por_dia.c.unidades), func.sum(por_dia.c.importe))
+            .group_by(por_dia.c.dia)
+            .order_by(por_dia.c.dia)
+        )).all()
+        # Una sola pasada por las filas de productos del rango; top y conversión se arman en Python
+        por_producto_estado = (await db.execute(
+            select(
+                por_producto.c.producto_id,
+                por_producto.c.categoria,
+                por_producto.c.estado,
+                func.sum(por_producto.c.pedidos),
+                func.sum(por_producto.c.unidades),
+                func.sum(por_producto.c.importe),
+            )
+            .group_by(por_producto.c.producto_id, por_producto.c.categoria, por_producto.c.estado)
+        )).all()
+        
+        productos = {}
+        categorias = {}
+        for producto_id, categoria, estado, pedidos, cantidad, importe in por_producto_estado:
+            conversion = categorias.setdefault(categoria, {"pedidos": 0, "convertidos": 0})
+            conversion["pedidos"] += pedidos
+            if estado in ESTADOS_CONVERTIDOS:
+                conversion["convertidos"] += pedidos
+            if estado != "cancelado":
+                total = productos.setdefault(producto_id, {"categoria": categoria, "pedidos": 0, "unidades": 0, "importe": 0.0})
+                total["pedidos"] += pedidos
+                total["unidades"] += cantidad
+                total["importe"] += importe
+        top = sorted(
+            (item for item in productos.items() if item[1]["unidades"] > 0),
+            key=lambda item: (-item[1]["unidades"], item[0]),
+        )[:limite]
         
+        # Nombres actuales de los productos del top; los borrados conservan el de los resúmenes
+        ids = [producto_id for producto_id, _ in top]
+        nombres = dict((await db.execute(select(ProductoDB.id, ProductoDB.nombre).where(ProductoDB.id.in_(ids)))).all())
+        borrados = [producto_id for producto_id in ids if producto_id not in nombres]
+        if borrados:
+            nombres.update((await db.execute(
+                select(por_producto.c.producto_id, func.max(por_producto.c.producto_nombre))
+                .where(por_producto.c.producto_id.in_(borrados))
+                .group_by(por_producto.c.producto_id)
+            )).all())
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al crear pedido: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error al calcular analytics: {str(e)}")
+    
+    def totales(pedidos, unidades, importe) -> dict:
+        return {"pedidos": int(pedidos or 0), "unidades": int(unidades or 0), "importe": round(float(importe or 0), 2)}
+    
+    return {
+        "desde": inicio.isoformat(),
+        "hasta": fin.isoformat(),
+        "por_estado": [{"estado": estado, **totales(*valores)} for estado, *valores in por_estado],
+        "volumen_diario": [{"dia": str(dia), **totales(*valores)} for dia, *valores in volumen],
+        "top_productos": [
+            {
+                "producto_id": producto_id,
+                "producto_nombre": nombres.get(producto_id),
+                "categoria": total["categoria"],
+                **totales(total["pedidos"], total["unidades"], total["importe"]),
+            }
+            for producto_id, total in top
+        ],
+        "conversion_por_categoria": [
+            {
+                "categoria": categoria,
+                "pedidos": int(conversion["pedidos"]),
+                "convertidos": int(conversion["convertidos"]),
+                "tasa": round(conversion["convertidos"] / conversion["pedidos"], 4),
+            }
+            for categoria, conversion in sorted(categorias.items(), key=lambda item: item[0] or "")
+            if conversion["pedidos"] > 0
+        ],
+    }
+
+@router.get("/pedidos")
+async def get_pedidos(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    todos: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Obtener pedidos paginados por cursor, del más reciente al más antiguo (para uso interno).
 
-@app.get("/pedidos")
-def get_pedidos(db: Session = Depends(get_db)):
-    """Obtener todos los pedidos (para uso interno)"""
+    `next_cursor` es el valor a enviar como `cursor` para la página siguiente, o null
+    en la última página. Con `todos=true` se devuelven todos los pedidos sin paginar.
+    """
     try:
-        pedidos_db = db.query(PedidoDB).order_by(PedidoDB.fecha_pedido.desc()).all()
+        query = select(PedidoDB)
+        
+        # Búsqueda por clave (keyset) sobre (fecha_pedido, id)
+        if cursor and not todos:
+            posicion = decode_cursor(cursor, ("fecha_pedido", "id"))
+            try:
+                fecha = datetime.fromisoformat(posicion["fecha_pedido"])
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Cursor inválido")
+            query = query.where(or_(
+                PedidoDB.fecha_pedido < fecha,
+                and_(PedidoDB.fecha_pedido == fecha, PedidoDB.id < entero_de_cursor(posicion["id"]))
+            ))
+        
+        query = query.order_by(PedidoDB.fecha_pedido.desc(), PedidoDB.id.desc())
+        
+        if not todos:
+            query = query.limit(limit + 1)
+        pedidos_db = (await db.execute(query)).scalars().all()
+        
+        next_cursor = None
+        if not todos and len(pedidos_db) > limit:
+            pedidos_db = pedidos_db[:limit]
+            ultimo = pedidos_db[-1]
+            next_cursor = encode_cursor({"fecha_pedido": ultimo.fecha_pedido.isoformat(), "id": ultimo.id})
+        
+        # Líneas de los pedidos de la página, de a BULK_CHUNK_SIZE ids por consulta
+        lineas = {}
+        ids = [pedido_db.id for pedido_db in pedidos_db]
+        tabla = PedidoItemDB.__table__
+        for inicio in range(0, len(ids), BULK_CHUNK_SIZE):
+            consulta = (
+                select(tabla.c.pedido_id, tabla.c.producto_id, tabla.c.producto_nombre, tabla.c.cantidad, tabla.c.precio_unitario)
+                .where(tabla.c.pedido_id.in_(ids[inicio:inicio + BULK_CHUNK_SIZE]))
+                .order_by(tabla.c.pedido_id, tabla.c.id)
+            )
+            for pedido_id, *linea in (await db.execute(consulta)).all():
+                lineas.setdefault(pedido_id, []).append(dict(zip(ItemPedidoResponse.model_fields, linea)))
         
         pedidos = []
         for pedido_db in pedidos_db:
@@ -497,27 +2959,105 @@ def get_pedidos(db: Session = Depends(get_db)):
                 "telefono": pedido_db.telefono,
                 "producto_nombre": pedido_db.producto_nombre,
                 "cantidad": pedido_db.cantidad,
+                "items": lineas.get(pedido_db.id, []),  # Vacío en los pedidos anteriores a las líneas
                 "comentarios": pedido_db.comentarios,
                 "fecha_pedido": pedido_db.fecha_pedido.isoformat() if pedido_db.fecha_pedido else None,
                 "estado": pedido_db.estado
             })
         
-        return {"pedidos": pedidos}
+        return {"pedidos": pedidos, "next_cursor": next_cursor}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener pedidos: {str(e)}")
 
-@app.post("/actualizar-imagen-producto")
-def actualizar_imagen_producto(producto_id: int, imagen_url: str, db: Session = Depends(get_db)):
+async def lineas_para_resumen(db: AsyncSession, pedido) -> List[dict]:
+    """Líneas de un pedido con el nombre y la categoría actuales de cada producto, como las usa sumar_al_resumen"""
+    lineas = PedidoItemDB.__table__
+    productos = ProductoDB.__table__
+    filas = (await db.execute(
+        select(
+            lineas.c.producto_id,
+            func.coalesce(productos.c.nombre, lineas.c.producto_nombre).label("producto_nombre"),
+            lineas.c.cantidad,
+            lineas.c.precio_unitario,
+            productos.c.categoria,
+        )
+        .select_from(lineas.outerjoin(productos, productos.c.id == lineas.c.producto_id))
+        .where(lineas.c.pedido_id == pedido.id)
+    )).mappings().all()
+    if filas:
+        return [dict(fila) for fila in filas]
+    # Pedido anterior a pedido_items: el producto y la cantidad están en la fila del pedido
+    if pedido.producto_id is None or not pedido.cantidad:
+        return []
+    producto = (await db.execute(
+        select(productos.c.nombre, productos.c.categoria).where(productos.c.id == pedido.producto_id)
+    )).first()
+    return [{
+        "producto_id": pedido.producto_id,
+        "producto_nombre": producto.nombre if producto else pedido.producto_nombre,
+        "cantidad": pedido.cantidad,
+        "precio_unitario": None,
+        "categoria": producto.categoria if producto else None,
+    }]
+
+@router.patch("/pedidos/{pedido_id}")
+async def cambiar_estado_pedido(pedido_id: int, cambio: EstadoPedidoUpdate, db: AsyncSession = Depends(get_db)):
+    """Cambiar el estado de un pedido y mover su aporte en los resúmenes diarios (para uso interno)"""
+    if cambio.estado not in ESTADOS_PEDIDO:
+        raise HTTPException(status_code=422, detail=f"Estado inválido; debe ser uno de: {', '.join(ESTADOS_PEDIDO)}")
+    tabla = PedidoDB.__table__
+    try:
+        pedido = (await db.execute(
+            select(tabla.c.id, tabla.c.estado, tabla.c.fecha_pedido, tabla.c.producto_id, tabla.c.producto_nombre, tabla.c.cantidad)
+            .where(tabla.c.id == pedido_id)
+            .with_for_update()
+        )).first()
+        if pedido is None:
+            raise HTTPException(status_code=404, detail="Pedido no encontrado")
+        anterior = pedido.estado or ESTADOS_PEDIDO[0]
+        if anterior == cambio.estado:
+            return {"id": pedido_id, "estado": cambio.estado, "estado_anterior": anterior}
+        
+        # Condicionado al estado leído: en SQLite no hay FOR UPDATE y otro cambio pudo confirmarse antes
+        actualizado = await db.execute(
+            tabla.update()
+            .where(tabla.c.id == pedido_id, func.coalesce(tabla.c.estado, ESTADOS_PEDIDO[0]) == anterior)
+            .values(estado=cambio.estado)
+        )
+        if actualizado.rowcount == 0:
+            raise HTTPException(status_code=409, detail="El estado del pedido cambió durante la actualización, reintentar")
+        if pedido.fecha_pedido is not None:
+            items = await lineas_para_resumen(db, pedido)
+            por_dia, por_producto = {}, {}
+            dia = pedido.fecha_pedido.date()
+            sumar_al_resumen(por_dia, por_producto, dia, anterior, pedido.cantidad, items, signo=-1)
+            sumar_al_resumen(por_dia, por_producto, dia, cambio.estado, pedido.cantidad, items)
+            await registrar_deltas_resumen(db, por_dia, por_producto)
+        await db.commit()
+        return {"id": pedido_id, "estado": cambio.estado, "estado_anterior": anterior}
+    
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error al actualizar pedido: {str(e)}")
+
+@router.post("/actualizar-imagen-producto")
+async def actualizar_imagen_producto(producto_id: int, imagen_url: str, db: AsyncSession = Depends(get_db)):
     """Actualizar la URL de imagen de un producto (para uso interno)"""
     try:
-        producto_db = db.query(ProductoDB).filter(ProductoDB.id == producto_id).first()
+        producto_db = await db.get(ProductoDB, producto_id)
         
         if not producto_db:
             raise HTTPException(status_code=404, detail=f"Producto con ID {producto_id} no encontrado")
         
         producto_db.imagen_url = imagen_url
-        db.commit()
+        await db.commit()
+        invalidar_catalogo(producto_db.id, producto_db.categoria, producto_db.activo, cambia_categorias=False)
         
         return {"message": f"Imagen del producto {producto_id} actualizada exitosamente", "nueva_url": imagen_url}
         
@@ -526,19 +3066,23 @@ def actualizar_imagen_producto(producto_id: int, imagen_url: str, db: Session =
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al actualizar imagen: {str(e)}")
 
-@app.delete("/productos/{producto_id}")
-def eliminar_producto(producto_id: int, db: Session = Depends(get_db)):
+@router.delete("/productos/{producto_id}")
+async def eliminar_producto(producto_id: int, db: AsyncSession = Depends(get_db)):
     """Eliminar un producto por ID"""
     try:
         # Verificar si el producto existe
-        producto_db = db.query(ProductoDB).filter(ProductoDB.id == producto_id).first()
+        producto_db = await db.get(ProductoDB, producto_id)
         
         if not producto_db:
             raise HTTPException(status_code=404, detail=f"Producto con ID {producto_id} no encontrado")
         
         # Eliminar el producto
-        db.delete(producto_db)
-        db.commit()
+        categoria, activo = producto_db.categoria, producto_db.activo
+        await db.delete(producto_db)
+        await db.flush()
+        await refrescar_resumen_categorias(db, [categoria])
+        await db.commit()
+        invalidar_catalogo(producto_id, categoria, activo)
         
         return {"message": f"Producto {producto_id} eliminado exitosamente"}
         
@@ -547,6 +3091,59 @@ def eliminar_producto(producto_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al eliminar producto: {str(e)}")
 
+def mostrar_configuracion():
+    """Diagnóstico de la configuración en el log de arranque"""
+    if not DATABASE_URL_CONFIGURADA:
+        print("Warning: DATABASE_URL not found, using SQLite fallback")
+    else:
+        print("DATABASE_URL configured: True")
+        print(f"DATABASE_URL starts with: {DATABASE_URL[:20]}...")
+    if not MAIL_ENABLED:
+        print("Warning: Email not configured, email notifications will be disabled")
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    """Arranque y cierre de la aplicación.
+
+    Importar main no toca la base ni los servicios externos: el diagnóstico, el
+    almacenamiento, las migraciones y las tareas en segundo plano se inician acá,
+    antes de aceptar solicitudes. Los productos de ejemplo se cargan aparte con
+    `python manage.py seed`.
+    """
+    mostrar_configuracion()
+    obtener_storage()
+    if DB_MIGRATE_ON_STARTUP:
+        # Crear o actualizar tablas e índices (ver migrations.py); el engine síncrono corre en un hilo
+        await anyio.to_thread.run_sync(aplicar_migraciones, engine, Base.metadata)
+    if MAIL_ENABLED:
+        bandeja.iniciar()
+    if IMAGE_SCAN_INTERVAL > 0:
+        escaneo.programar(IMAGE_SCAN_INTERVAL)
+    if ROLLUP_FOLD_INTERVAL > 0:
+        consolidacion.iniciar()
+    try:
+        yield
+    finally:
+        await cerrar_conexiones()
+
+def crear_app() -> FastAPI:
+    """Aplicación con las rutas del router, CORS y el ciclo de vida de arriba"""
+    app = FastAPI(title="E-commerce Mayorista API", version="3.0.0", lifespan=ciclo_de_vida)
+    # Configurar CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=os.getenv("ALLOWED_ORIGINS", "").split(",") if os.getenv("ALLOWED_ORIGINS") else ["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Idempotent-Replayed"],
+    )
+    app.include_router(router)
+    return app
+
+# Instancia que usan uvicorn (main:app), startup.py y los benchmarks
+app = crear_app()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8080"))
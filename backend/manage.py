@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Comandos de mantenimiento del backend.
+
+Uso (desde backend/):
+    python manage.py migrate           Aplicar las migraciones pendientes
+    python manage.py status            Listar las migraciones y si están aplicadas
+    python manage.py check-indexes     Verificar con EXPLAIN que las consultas frecuentes usan sus índices
+    python manage.py backfill-rollups  Recalcular los resúmenes diarios de pedidos desde pedidos y sus líneas
+    python manage.py seed              Cargar los productos de ejemplo si la base no tiene productos
+"""
+
+import argparse
+import sys
+
+import migrations
+
+def cmd_migrate(main):
+    aplicadas = migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+    if not aplicadas:
+        print("✅ El esquema está al día")
+
+def cmd_status(main):
+    aplicadas = migrations.versiones_aplicadas(main.engine)
+    for m in migrations.MIGRACIONES:
+        print(f"{'✅' if m.version in aplicadas else '⏳'} {m.version:>3} {m.descripcion}")
+
+def cmd_check_indexes(main):
+    if not migrations.verificar_indices(main.engine, main.Base.metadata):
+        sys.exit(1)
+
+def cmd_backfill_rollups(main):
+    with main.engine.begin() as conexion:
+        filas_dia, filas_producto = migrations.reconstruir_resumen_pedidos(conexion, main.Base.metadata)
+    print(f"✅ Resúmenes de pedidos recalculados: {filas_dia} filas por día y estado, {filas_producto} por producto")
+
+def cmd_seed(main):
+    migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+    creados = main.init_sample_products()
+    if creados:
+        print(f"✅ Productos de ejemplo creados: {creados}")
+    else:
+        print("✅ La base ya tiene productos; no se cargaron los de ejemplo")
+
+COMANDOS = {
+    "migrate": cmd_migrate,
+    "status": cmd_status,
+    "check-indexes": cmd_check_indexes,
+    "backfill-rollups": cmd_backfill_rollups,
+    "seed": cmd_seed,
+}
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("comando", choices=sorted(COMANDOS))
+    args = parser.parse_args()
+
+    import main
+    COMANDOS[args.comando](main)
+
+if __name__ == "__main__":
+    run()
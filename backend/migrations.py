@@ -0,0 +1,458 @@
+"""
+Migraciones versionadas del esquema de la base de datos.
+
+Cada migración es una función registrada con @migracion(version, descripcion).
+Las versiones aplicadas se guardan en la tabla schema_migrations, de modo que
+cada una corre una sola vez y en orden. Las migraciones que crean índices en
+Postgres corren fuera de una transacción para poder usar CREATE INDEX
+CONCURRENTLY y no bloquear las tablas durante un deploy.
+"""
+
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, bindparam, exists, func, inspect, literal_column, select, text,
+    union_all,
+)
+from sqlalchemy.engine import Connection, Engine
+
+# Clave arbitraria para pg_advisory_lock: evita que dos procesos migren a la vez
+ADVISORY_LOCK_ID = 72_410_301
+
+schema_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    schema_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("descripcion", String, nullable=False),
+    Column("aplicada_en", DateTime, nullable=False),
+)
+
+@dataclass
+class Migracion:
+    version: int
+    descripcion: str
+    funcion: Callable[[Connection, MetaData], None]
+    transaccional: bool = True
+
+MIGRACIONES: List[Migracion] = []
+
+def migracion(version: int, descripcion: str, transaccional: bool = True):
+    """Registrar una migración. Las no transaccionales corren en modo AUTOCOMMIT"""
+    def registrar(funcion):
+        if any(m.version == version for m in MIGRACIONES):
+            raise ValueError(f"Versión de migración duplicada: {version}")
+        MIGRACIONES.append(Migracion(version, descripcion, funcion, transaccional))
+        MIGRACIONES.sort(key=lambda m: m.version)
+        return funcion
+    return registrar
+
+def normalizar_texto(texto: str) -> str:
+    """Pasar a minúsculas y quitar acentos ("Marrón" -> "marron")"""
+    texto = texto.lower()
+    if texto.isascii():
+        return texto
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+def normalizar_nombre(nombre: str) -> str:
+    """Valor de productos.nombre_normalizado: sin mayúsculas, acentos ni espacios de más.
+
+    Dos productos con el mismo nombre normalizado son duplicados.
+    """
+    return " ".join(normalizar_texto(nombre).split())
+
+def crear_indice(
+    conexion: Connection,
+    nombre: str,
+    definicion: str,
+    where_postgres: str = None,
+    where_sqlite: str = None,
+    unico: bool = False,
+):
+    """Crear un índice si no existe; en Postgres sin bloquear escrituras (CONCURRENTLY).
+
+    `definicion` es "tabla (columnas)". Para índices parciales la condición se da por
+    dialecto, porque SQLite solo usa el índice si la condición coincide textualmente
+    con la de la consulta.
+    """
+    tipo = "UNIQUE INDEX" if unico else "INDEX"
+    if conexion.dialect.name == "postgresql":
+        # Un CREATE INDEX CONCURRENTLY interrumpido deja un índice inválido con ese nombre
+        invalido = conexion.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :nombre AND NOT i.indisvalid"
+        ), {"nombre": nombre}).first()
+        if invalido:
+            conexion.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}"))
+        where = f" WHERE {where_postgres}" if where_postgres else ""
+        conexion.execute(text(f"CREATE {tipo} CONCURRENTLY IF NOT EXISTS {nombre} ON {definicion}{where}"))
+    else:
+        where = f" WHERE {where_sqlite}" if where_sqlite else ""
+        conexion.execute(text(f"CREATE {tipo} IF NOT EXISTS {nombre} ON {definicion}{where}"))
+
+@migracion(1, "Tablas iniciales productos y pedidos")
+def _tablas_iniciales(conexion: Connection, metadata: MetaData):
+    # Equivale al create_all que se hacía al importar main; no toca bases ya existentes
+    metadata.create_all(conexion, tables=[metadata.tables["productos"], metadata.tables["pedidos"]])
+
+@migracion(2, "Índices de listados de productos, categorías y pedidos", transaccional=False)
+def _indices_consultas_frecuentes(conexion: Connection, metadata: MetaData):
+    # GET /productos?categoria=...: filtro por activo y categoría, orden por id
+    crear_indice(conexion, "ix_productos_activo_categoria_id", "productos (activo, categoria, id DESC)")
+    # GET /productos sin categoría: filtro por activo, orden por id
+    crear_indice(conexion, "ix_productos_activo_id", "productos (activo, id DESC)")
+    # GET /categorias: DISTINCT categoria de los productos activos, índice parcial
+    # sin los productos dados de baja
+    crear_indice(
+        conexion,
+        "ix_productos_categoria_activos",
+        "productos (categoria)",
+        where_postgres="activo",
+        where_sqlite="activo = 1",
+    )
+    # GET /pedidos: orden y cursor sobre (fecha_pedido, id)
+    crear_indice(conexion, "ix_pedidos_fecha_pedido_id", "pedidos (fecha_pedido DESC, id DESC)")
+
+def reconstruir_resumen_categorias(conexion: Connection, metadata: MetaData):
+    """Recalcular desde cero el resumen por categoría a partir de la tabla de productos"""
+    resumen = metadata.tables["categorias_resumen"]
+    productos = metadata.tables["productos"]
+    conexion.execute(resumen.delete())
+    conexion.execute(resumen.insert().from_select(
+        ["categoria", "productos_activos", "precio_min", "precio_max", "precio_mayorista_min"],
+        select(
+            productos.c.categoria,
+            func.count(productos.c.id),
+            func.min(productos.c.precio),
+            func.max(productos.c.precio),
+            func.min(productos.c.precio_mayorista),
+        )
+        .where(productos.c.activo == True, productos.c.categoria != None, productos.c.categoria != "")
+        .group_by(productos.c.categoria)
+    ))
+
+@migracion(3, "Resumen de productos y precios por categoría")
+def _resumen_categorias(conexion: Connection, metadata: MetaData):
+    metadata.tables["categorias_resumen"].create(conexion, checkfirst=True)
+    reconstruir_resumen_categorias(conexion, metadata)
+
+# Acentos que se quitan en la columna de búsqueda de Postgres. translate() es inmutable,
+# a diferencia de unaccent(), y puede usarse en una columna generada sin extensiones
+ACENTOS = "áàâäãéèêëíìîïóòôöõúùûüñçÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÑÇ"
+SIN_ACENTOS = "aaaaaeeeeiiiiooooouuuuncAAAAAEEEEIIIIOOOOOUUUUNC"
+
+@migracion(4, "Búsqueda de texto completo en nombre y descripción")
+def _busqueda_productos(conexion: Connection, metadata: MetaData):
+    if conexion.dialect.name == "postgresql":
+        def documento(columna, peso):
+            return (
+                f"setweight(to_tsvector('spanish', translate(coalesce({columna}, ''), '{ACENTOS}', '{SIN_ACENTOS}')), '{peso}')"
+            )
+        conexion.execute(text(
+            "ALTER TABLE productos ADD COLUMN IF NOT EXISTS busqueda tsvector "
+            f"GENERATED ALWAYS AS ({documento('nombre', 'A')} || {documento('descripcion', 'B')}) STORED"
+        ))
+    else:
+        # FTS5 con contenido externo: el índice guarda solo los términos y lo mantienen los triggers
+        conexion.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5("
+            "nombre, descripcion, content='productos', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conexion.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS productos_fts_insert AFTER INSERT ON productos BEGIN "
+            "INSERT INTO productos_fts(rowid, nombre, descripcion) VALUES (new.id, new.nombre, new.descripcion); "
+            "END"
+        ))
+        conexion.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS productos_fts_delete AFTER DELETE ON productos BEGIN "
+            "INSERT INTO productos_fts(productos_fts, rowid, nombre, descripcion) "
+            "VALUES ('delete', old.id, old.nombre, old.descripcion); "
+            "END"
+        ))
+        conexion.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS productos_fts_update AFTER UPDATE OF nombre, descripcion ON productos BEGIN "
+            "INSERT INTO productos_fts(productos_fts, rowid, nombre, descripcion) "
+            "VALUES ('delete', old.id, old.nombre, old.descripcion); "
+            "INSERT INTO productos_fts(rowid, nombre, descripcion) VALUES (new.id, new.nombre, new.descripcion); "
+            "END"
+        ))
+        conexion.execute(text("INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')"))
+
+@migracion(5, "Índice GIN de búsqueda de productos", transaccional=False)
+def _indice_busqueda_productos(conexion: Connection, metadata: MetaData):
+    # En SQLite el índice es la propia tabla FTS5 de la migración 4
+    if conexion.dialect.name == "postgresql":
+        crear_indice(conexion, "ix_productos_busqueda", "productos USING GIN (busqueda)")
+
+@migracion(6, "Índice de imágenes subidas por hash de contenido")
+def _imagenes_por_hash(conexion: Connection, metadata: MetaData):
+    metadata.tables["imagenes"].create(conexion, checkfirst=True)
+
+@migracion(7, "Nombre normalizado de productos y baja de duplicados activos")
+def _nombre_normalizado(conexion: Connection, metadata: MetaData):
+    productos = metadata.tables["productos"]
+    # En una base nueva la migración 1 ya crea la columna
+    if "nombre_normalizado" not in {columna["name"] for columna in inspect(conexion).get_columns("productos")}:
+        conexion.execute(text("ALTER TABLE productos ADD COLUMN nombre_normalizado VARCHAR"))
+
+    # La normalización quita acentos de cualquier alfabeto, así que se calcula en Python
+    filas = conexion.execute(
+        select(productos.c.id, productos.c.nombre, productos.c.activo).order_by(productos.c.id)
+    ).all()
+    actualizacion = (
+        productos.update()
+        .where(productos.c.id == bindparam("b_id"))
+        .values(nombre_normalizado=bindparam("b_nombre"))
+    )
+    parametros = [{"b_id": fila.id, "b_nombre": normalizar_nombre(fila.nombre)} for fila in filas]
+    for inicio in range(0, len(parametros), 1000):
+        conexion.execute(actualizacion, parametros[inicio:inicio + 1000])
+
+    # El índice único de la migración 8 solo admite un producto activo por nombre: se
+    # conserva el más antiguo de cada grupo y se dan de baja los demás (no se borran,
+    # para poder revisarlos y fusionarlos con POST /productos/duplicados/fusionar)
+    vistos = set()
+    duplicados = []
+    for fila, valores in zip(filas, parametros):
+        if not fila.activo:
+            continue
+        if valores["b_nombre"] in vistos:
+            duplicados.append(fila.id)
+        vistos.add(valores["b_nombre"])
+    for inicio in range(0, len(duplicados), 1000):
+        conexion.execute(
+            productos.update().where(productos.c.id.in_(duplicados[inicio:inicio + 1000])).values(activo=False)
+        )
+    if duplicados:
+        print(f"Productos duplicados dados de baja: {len(duplicados)}")
+        reconstruir_resumen_categorias(conexion, metadata)
+
+@migracion(8, "Índice único de nombre normalizado en productos activos", transaccional=False)
+def _indice_nombre_normalizado(conexion: Connection, metadata: MetaData):
+    crear_indice(
+        conexion,
+        "ux_productos_nombre_normalizado_activos",
+        "productos (nombre_normalizado)",
+        where_postgres="activo",
+        where_sqlite="activo = 1",
+        unico=True,
+    )
+
+@migracion(9, "Estado de verificación de las imágenes de productos")
+def _estado_imagenes(conexion: Connection, metadata: MetaData):
+    metadata.tables["imagenes_estado"].create(conexion, checkfirst=True)
+
+@migracion(10, "Bandeja de salida de emails", transaccional=False)
+def _bandeja_emails(conexion: Connection, metadata: MetaData):
+    metadata.tables["email_outbox"].create(conexion, checkfirst=True)
+    # Vuelta del envío: pendientes cuyo próximo intento ya venció; los enviados no ocupan el índice
+    crear_indice(
+        conexion,
+        "ix_email_outbox_pendientes",
+        "email_outbox (proximo_intento)",
+        where_postgres="estado = 'pendiente'",
+        where_sqlite="estado = 'pendiente'",
+    )
+
+@migracion(11, "Líneas de pedidos", transaccional=False)
+def _lineas_pedidos(conexion: Connection, metadata: MetaData):
+    metadata.tables["pedido_items"].create(conexion, checkfirst=True)
+    # Líneas de una página de GET /pedidos: WHERE pedido_id IN (...)
+    crear_indice(conexion, "ix_pedido_items_pedido_id", "pedido_items (pedido_id, id)")
+
+def reconstruir_resumen_pedidos(conexion: Connection, metadata: MetaData):
+    """Recalcular desde cero los resúmenes diarios de pedidos a partir de pedidos y pedido_items.
+
+    Los pedidos anteriores a pedido_items cuentan con el producto y la cantidad de
+    su propia fila, sin importe (no guardaban el precio). Los deltas pendientes de
+    traspaso se descartan: ya están contados. Devuelve la cantidad de filas de cada
+    resumen.
+    """
+    deltas = metadata.tables["resumen_pedidos_deltas"]
+    por_dia = metadata.tables["resumen_pedidos_dia"]
+    por_producto = metadata.tables["resumen_productos_dia"]
+    pedidos = metadata.tables["pedidos"]
+    lineas = metadata.tables["pedido_items"]
+    productos = metadata.tables["productos"]
+    if conexion.dialect.name == "postgresql":
+        # Los pedidos que se confirmen durante la reconstrucción esperan para escribir sus
+        # deltas, que se traspasan después. Los deltas primero: el traspaso en curso los
+        # bloquea antes que a los resúmenes, y así se espera a que termine sin deadlock
+        conexion.execute(text(
+            "LOCK TABLE resumen_pedidos_deltas, resumen_pedidos_dia, resumen_productos_dia IN EXCLUSIVE MODE"
+        ))
+    conexion.execute(deltas.delete())
+    conexion.execute(por_dia.delete())
+    conexion.execute(por_producto.delete())
+
+    dia = func.date(pedidos.c.fecha_pedido).label("dia")
+    # Literal y no parámetro: Postgres compara el GROUP BY con la expresión del SELECT
+    estado = func.coalesce(pedidos.c.estado, literal_column("'pendiente'")).label("estado")
+    importe_linea = lineas.c.cantidad * func.coalesce(lineas.c.precio_unitario, 0)
+    importes = (
+        select(lineas.c.pedido_id, func.sum(importe_linea).label("importe"))
+        .group_by(lineas.c.pedido_id)
+        .subquery()
+    )
+    filas_dia = conexion.execute(por_dia.insert().from_select(
+        ["dia", "estado", "pedidos", "unidades", "importe"],
+        select(
+            dia,
+            estado,
+            func.count(pedidos.c.id),
+            func.coalesce(func.sum(pedidos.c.cantidad), 0),
+            func.coalesce(func.sum(importes.c.importe), 0),
+        )
+        .select_from(pedidos.outerjoin(importes, importes.c.pedido_id == pedidos.c.id))
+        .where(pedidos.c.fecha_pedido != None)
+        .group_by(dia, estado)
+    )).rowcount
+
+    todas = union_all(
+        select(dia, lineas.c.producto_id, estado, lineas.c.producto_nombre, lineas.c.cantidad, importe_linea.label("importe"))
+        .select_from(lineas.join(pedidos, pedidos.c.id == lineas.c.pedido_id))
+        .where(pedidos.c.fecha_pedido != None),
+        select(dia, pedidos.c.producto_id, estado, pedidos.c.producto_nombre, pedidos.c.cantidad, literal_column("0.0"))
+        .where(
+            pedidos.c.fecha_pedido != None,
+            pedidos.c.producto_id != None,
+            pedidos.c.cantidad != None,
+            ~exists().where(lineas.c.pedido_id == pedidos.c.id),
+        ),
+    ).subquery()
+    filas_producto = conexion.execute(por_producto.insert().from_select(
+        ["dia", "producto_id", "estado", "producto_nombre", "categoria", "pedidos", "unidades", "importe"],
+        select(
+            todas.c.dia,
+            todas.c.producto_id,
+            todas.c.estado,
+            func.coalesce(productos.c.nombre, func.max(todas.c.producto_nombre)),
+            productos.c.categoria,
+            func.count(),
+            func.sum(todas.c.cantidad),
+            func.sum(todas.c.importe),
+        )
+        .select_from(todas.outerjoin(productos, productos.c.id == todas.c.producto_id))
+        .group_by(todas.c.dia, todas.c.producto_id, todas.c.estado, productos.c.nombre, productos.c.categoria)
+    )).rowcount
+    return filas_dia, filas_producto
+
+@migracion(12, "Resúmenes diarios de pedidos por estado y por producto")
+def _resumen_pedidos(conexion: Connection, metadata: MetaData):
+    metadata.tables["resumen_pedidos_deltas"].create(conexion, checkfirst=True)
+    metadata.tables["resumen_pedidos_dia"].create(conexion, checkfirst=True)
+    metadata.tables["resumen_productos_dia"].create(conexion, checkfirst=True)
+    reconstruir_resumen_pedidos(conexion, metadata)
+
+def versiones_aplicadas(engine: Engine) -> set:
+    schema_metadata.create_all(engine)
+    with engine.connect() as conexion:
+        return set(conexion.execute(select(schema_migrations.c.version)).scalars())
+
+def _aplicar(engine: Engine, metadata: MetaData, m: Migracion):
+    if m.transaccional:
+        with engine.begin() as conexion:
+            m.funcion(conexion, metadata)
+            conexion.execute(schema_migrations.insert().values(
+                version=m.version, descripcion=m.descripcion, aplicada_en=datetime.now()
+            ))
+    else:
+        with engine.connect() as conexion:
+            conexion = conexion.execution_options(isolation_level="AUTOCOMMIT")
+            m.funcion(conexion, metadata)
+            conexion.execute(schema_migrations.insert().values(
+                version=m.version, descripcion=m.descripcion, aplicada_en=datetime.now()
+            ))
+
+def aplicar_migraciones(engine: Engine, metadata: MetaData) -> List[int]:
+    """Aplicar en orden las migraciones pendientes. Devuelve las versiones aplicadas"""
+    aplicadas = []
+    with engine.connect() as bloqueo:
+        if engine.dialect.name == "postgresql":
+            bloqueo.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+            bloqueo.commit()
+        try:
+            ya_aplicadas = versiones_aplicadas(engine)
+            for m in MIGRACIONES:
+                if m.version in ya_aplicadas:
+                    continue
+                _aplicar(engine, metadata, m)
+                aplicadas.append(m.version)
+                print(f"Migración {m.version} aplicada: {m.descripcion}")
+        finally:
+            if engine.dialect.name == "postgresql":
+                bloqueo.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+                bloqueo.commit()
+    return aplicadas
+
+def consultas_frecuentes(metadata: MetaData):
+    """Consultas de los endpoints más usados y los índices que pueden resolverlas"""
+    productos = metadata.tables["productos"]
+    pedidos = metadata.tables["pedidos"]
+    return [
+        (
+            "GET /productos?categoria=...",
+            ("ix_productos_activo_categoria_id",),
+            select(productos).where(productos.c.activo == True, productos.c.categoria == "Gorros")
+            .order_by(productos.c.id.desc()).limit(101),
+        ),
+        (
+            "GET /productos",
+            ("ix_productos_activo_id",),
+            select(productos).where(productos.c.activo == True).order_by(productos.c.id.desc()).limit(101),
+        ),
+        (
+            "GET /productos?activo=false&categoria=...",
+            ("ix_productos_activo_categoria_id",),
+            select(productos).where(productos.c.activo == False, productos.c.categoria == "Gorros")
+            .order_by(productos.c.id.desc()).limit(101),
+        ),
+        (
+            "Recalcular resumen de una categoría",
+            # El compuesto también la resuelve; el planner elige según estadísticas
+            ("ix_productos_categoria_activos", "ix_productos_activo_categoria_id"),
+            select(func.count(productos.c.id), func.min(productos.c.precio), func.max(productos.c.precio))
+            .where(productos.c.activo == True, productos.c.categoria == "Gorros"),
+        ),
+        (
+            "Producto activo con el mismo nombre (POST /productos)",
+            ("ux_productos_nombre_normalizado_activos",),
+            select(productos.c.id).where(productos.c.nombre_normalizado == "gorro verde", productos.c.activo == True),
+        ),
+        (
+            "GET /pedidos",
+            ("ix_pedidos_fecha_pedido_id",),
+            select(pedidos).order_by(pedidos.c.fecha_pedido.desc(), pedidos.c.id.desc()).limit(101),
+        ),
+    ]
+
+def plan_de_consulta(conexion: Connection, consulta) -> str:
+    sql = str(consulta.compile(dialect=conexion.dialect, compile_kwargs={"literal_binds": True}))
+    if conexion.dialect.name == "postgresql":
+        return "\n".join(conexion.execute(text(f"EXPLAIN {sql}")).scalars())
+    return "\n".join(fila[-1] for fila in conexion.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+def verificar_indices(engine: Engine, metadata: MetaData) -> bool:
+    """Verificar con EXPLAIN que cada consulta frecuente usa alguno de sus índices"""
+    ok = True
+    with engine.connect() as conexion:
+        if engine.dialect.name == "postgresql":
+            # Con tablas chicas el planner prefiere recorrer la tabla aunque el índice exista;
+            # lo que se verifica es que el índice sea utilizable para la consulta
+            conexion.execute(text("SET LOCAL enable_seqscan = off"))
+            conexion.execute(text("SET LOCAL enable_bitmapscan = off"))
+        for nombre, indices, consulta in consultas_frecuentes(metadata):
+            plan = plan_de_consulta(conexion, consulta)
+            usados = [indice for indice in indices if indice in plan]
+            ok = ok and bool(usados)
+            print(f"{'✅' if usados else '❌'} {nombre} -> {usados[0] if usados else ' | '.join(indices)}")
+            if not usados:
+                print("   " + plan.replace("\n", "\n   "))
+        conexion.rollback()
+    return ok
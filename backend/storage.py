@@ -0,0 +1,186 @@
+"""
+Almacenamiento de imágenes de productos.
+
+StorageBackend define la interfaz: `subir(ruta, public_id)` recibe un archivo ya
+escrito en disco y devuelve su public_id y URL pública. Hay dos implementaciones:
+
+- CloudinaryStorage: sube en partes al CDN de Cloudinary (por defecto).
+- LocalStorage: copia el archivo a un directorio local que la API sirve en
+  /media, con soporte de Range, cache de larga duración y envío sin copia
+  cuando el servidor ASGI lo permite. Sirve como alternativa autoalojada y
+  para correr y probar las subidas sin credenciales.
+
+Se elige con STORAGE_BACKEND=cloudinary|local. Las subidas son bloqueantes y
+corren en el executor de subidas de main.py.
+"""
+
+import mimetypes
+import os
+import shutil
+import tempfile
+from typing import Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import cloudinary
+    import cloudinary.uploader
+except ImportError:
+    cloudinary = None
+
+# Carpeta (Cloudinary) o subdirectorio (local) de las imágenes de productos
+CARPETA = "gorros"
+
+# Tipos que mimetypes no conoce en todas las versiones de Python
+TIPOS_IMAGEN = {".webp": "image/webp", ".avif": "image/avif"}
+
+class StorageBackend:
+    """Destino de las imágenes subidas"""
+
+    nombre = ""
+
+    def configurado(self) -> bool:
+        return True
+
+    def subir(self, ruta: str, public_id: str) -> dict:
+        """Guardar el archivo en `ruta` bajo `public_id`; devuelve {"public_id", "url"}"""
+        raise NotImplementedError
+
+class CloudinaryStorage(StorageBackend):
+    nombre = "Cloudinary"
+
+    def __init__(self, cloud_name: Optional[str], api_key: Optional[str], api_secret: Optional[str], chunk_size: int):
+        self.cloud_name = cloud_name if cloudinary is not None else None
+        self.chunk_size = chunk_size
+        if self.cloud_name:
+            cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret)
+
+    def configurado(self) -> bool:
+        return bool(self.cloud_name)
+
+    def subir(self, ruta: str, public_id: str) -> dict:
+        # upload_large envía el archivo en partes de chunk_size: nunca se carga entero en memoria
+        resultado = cloudinary.uploader.upload_large(
+            ruta,
+            folder=CARPETA,
+            public_id=public_id,
+            overwrite=True,
+            resource_type="image",
+            chunk_size=self.chunk_size,
+        )
+        return {"public_id": resultado["public_id"], "url": resultado["secure_url"]}
+
+class LocalStorage(StorageBackend):
+    nombre = "almacenamiento local"
+
+    def __init__(self, directorio: str, url_base: str):
+        self.directorio = os.path.realpath(directorio)
+        self.url_base = url_base.rstrip("/")
+        os.makedirs(os.path.join(self.directorio, CARPETA), exist_ok=True)
+
+    def subir(self, ruta: str, public_id: str) -> dict:
+        nombre = f"{CARPETA}/{public_id}{os.path.splitext(ruta)[1].lower()}"
+        destino = os.path.join(self.directorio, nombre)
+        # Copia a un temporal del mismo directorio y rename atómico: nunca se sirve un archivo a medias
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), prefix=".subida_")
+        try:
+            with os.fdopen(descriptor, "wb") as salida, open(ruta, "rb") as entrada:
+                shutil.copyfileobj(entrada, salida, 1024 * 1024)
+            os.chmod(temporal, 0o644)
+            os.replace(temporal, destino)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+        return {"public_id": f"{CARPETA}/{public_id}", "url": f"{self.url_base}/{nombre}"}
+
+    def resolver(self, ruta: str) -> Optional[str]:
+        """Ruta absoluta de un archivo servible, o None si no existe o sale del directorio"""
+        absoluta = os.path.realpath(os.path.join(self.directorio, ruta))
+        if not absoluta.startswith(self.directorio + os.sep) or os.path.basename(absoluta).startswith("."):
+            return None
+        return absoluta if os.path.isfile(absoluta) else None
+
+def tipo_de_contenido(ruta: str) -> str:
+    extension = os.path.splitext(ruta)[1].lower()
+    return TIPOS_IMAGEN.get(extension) or mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+
+def rango_solicitado(cabecera: Optional[str], tamanio: int) -> Optional[Tuple[int, int]]:
+    """Interpretar un header Range de un solo rango; devuelve (inicio, fin inclusivo).
+
+    None significa servir el archivo completo (sin Range, sintaxis no soportada o
+    varios rangos, que el RFC 9110 permite ignorar). Lanza ValueError si el rango es
+    válido pero no se puede satisfacer.
+    """
+    if not cabecera or not cabecera.startswith("bytes=") or "," in cabecera:
+        return None
+    texto_inicio, separador, texto_fin = cabecera[len("bytes="):].strip().partition("-")
+    if not separador or not (texto_inicio or texto_fin):
+        return None
+    if not all(texto.isdigit() for texto in (texto_inicio, texto_fin) if texto):
+        return None
+
+    if not texto_inicio:
+        # bytes=-N: los últimos N bytes
+        sufijo = int(texto_fin)
+        if sufijo == 0 or tamanio == 0:
+            raise ValueError("Rango vacío")
+        return max(0, tamanio - sufijo), tamanio - 1
+
+    inicio = int(texto_inicio)
+    if inicio >= tamanio:
+        raise ValueError("Rango fuera del archivo")
+    fin = int(texto_fin) if texto_fin else tamanio - 1
+    if fin < inicio:
+        return None
+    return inicio, min(fin, tamanio - 1)
+
+class ArchivoResponse(Response):
+    """Cuerpo tomado de un tramo de un archivo local.
+
+    Si el servidor ASGI implementa la extensión http.response.zerocopysend, el
+    archivo se entrega con sendfile sin pasar por Python; si no, se lee por
+    bloques en un hilo.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, ruta: str, inicio: int, longitud: int, status_code: int, headers: dict, solo_cabeceras: bool = False):
+        super().__init__(content=None, status_code=status_code, headers=headers)
+        self.ruta = ruta
+        self.inicio = inicio
+        self.longitud = longitud
+        self.solo_cabeceras = solo_cabeceras
+        # Response agrega content-length: 0 cuando no hay cuerpo; se reemplaza por el real
+        self.raw_headers = [(k, v) for k, v in self.raw_headers if k != b"content-length"]
+        self.raw_headers.append((b"content-length", str(longitud).encode("latin-1")))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.solo_cabeceras or self.longitud == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.ruta, "rb") as archivo:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": archivo,
+                    "offset": self.inicio,
+                    "count": self.longitud,
+                    "more_body": False,
+                })
+        else:
+            async with await anyio.open_file(self.ruta, "rb") as archivo:
+                await archivo.seek(self.inicio)
+                restante = self.longitud
+                while restante > 0:
+                    bloque = await archivo.read(min(self.chunk_size, restante))
+                    if not bloque:
+                        break
+                    restante -= len(bloque)
+                    await send({"type": "http.response.body", "body": bloque, "more_body": restante > 0})
+                if restante > 0:
+                    # El archivo se achicó mientras se enviaba
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
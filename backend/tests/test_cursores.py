@@ -0,0 +1,60 @@
+"""
+Cursores de paginación con valores de otro tipo: deben responder 400, no otra página ni 500.
+
+Uso (desde backend/):
+    python -m pytest tests
+"""
+
+import asyncio
+import base64
+import json
+import os
+import sys
+import tempfile
+
+# Base de datos temporal: debe configurarse antes de importar main
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/tests.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import pytest
+
+import main
+import migrations
+
+migrations.aplicar_migraciones(main.engine, main.Base.metadata)
+
+def cursor(valores: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip("=")
+
+def get(ruta: str, params: dict) -> httpx.Response:
+    async def pedir():
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://tests") as http:
+            respuesta = await http.get(ruta, params=params)
+        # Cada asyncio.run usa un event loop nuevo: las conexiones del pool no pueden reutilizarse
+        await main.async_engine.dispose()
+        return respuesta
+    return asyncio.run(pedir())
+
+@pytest.mark.parametrize("valor", ["abc", "5", True, 1.5, None, [1]])
+def test_cursor_de_productos_con_id_no_entero(valor):
+    respuesta = get("/productos", {"cursor": cursor({"id": valor})})
+    assert respuesta.status_code == 400
+    assert respuesta.json()["detail"] == "Cursor inválido"
+
+@pytest.mark.parametrize("valor", ["abc", True, 1.5, None])
+def test_cursor_de_pedidos_con_id_no_entero(valor):
+    respuesta = get("/pedidos", {"cursor": cursor({"fecha_pedido": "2024-01-01T00:00:00", "id": valor})})
+    assert respuesta.status_code == 400
+    assert respuesta.json()["detail"] == "Cursor inválido"
+
+@pytest.mark.parametrize("valor", ["10", True, -1])
+def test_cursor_de_busqueda_con_offset_invalido(valor):
+    respuesta = get("/productos/buscar", {"q": "gorro", "cursor": cursor({"offset": valor})})
+    assert respuesta.status_code == 400
+
+def test_cursores_validos():
+    assert get("/productos", {"cursor": cursor({"id": 10})}).status_code == 200
+    assert get("/pedidos", {"cursor": cursor({"fecha_pedido": "2024-01-01T00:00:00", "id": 10})}).status_code == 200
+    assert get("/productos/buscar", {"q": "gorro", "cursor": cursor({"offset": 20})}).status_code == 200
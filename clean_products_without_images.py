@@ -1,48 +1,59 @@
 #!/usr/bin/env python3
 """
-Script para eliminar productos que no tienen imágenes válidas de Cloudinary
+Script para eliminar productos que no tienen imágenes válidas
+
+La validez la decide el backend verificando cada imagen_url (POST /imagenes/escanear).
+Solo se eliminan los productos cuya imagen el servidor confirma que no existe
+(404/410, URL vacía o inválida); los fallos que pueden ser transitorios
+(timeouts, errores 5xx) se informan pero no se eliminan.
+
+Uso:
+    python clean_products_without_images.py [--dry-run]
 """
 
+import argparse
+import time
+
 import requests
 
 # Configuración
 API_URL = "https://nextjs-ecommerce-template-main-production.up.railway.app"
 
-def get_current_products():
-    """Obtener productos actuales"""
-    try:
-        response = requests.get(f"{API_URL}/productos")
+def run_scan():
+    """Lanzar el escaneo de imágenes en el backend y esperar a que termine"""
+    response = requests.post(f"{API_URL}/imagenes/escanear")
+    if response.status_code != 409:  # 409: ya hay uno en curso, se espera ese
         response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error obteniendo productos: {e}")
-        return []
+    while True:
+        status = requests.get(f"{API_URL}/imagenes/escaneo").json()
+        print(f"   {status['verificadas']}/{status['total']} verificadas, {status['rotas']} rotas", end="\r")
+        if not status['en_curso']:
+            print()
+            return status
+        time.sleep(1)
+
+def get_broken_images():
+    """Productos cuya imagen falló en el último escaneo"""
+    response = requests.get(f"{API_URL}/imagenes/rotas")
+    response.raise_for_status()
+    return response.json()
 
-def delete_product(product_id):
-    """Eliminar un producto"""
+def delete_products(product_ids):
+    """Eliminar varios productos en una sola solicitud; devuelve los IDs eliminados"""
     try:
-        response = requests.delete(f"{API_URL}/productos/{product_id}")
-        return response.status_code == 200
+        response = requests.delete(f"{API_URL}/productos/bulk", json={"ids": product_ids})
+        response.raise_for_status()
+        return {r['id'] for r in response.json()['resultados'] if r['ok']}
     except Exception as e:
-        print(f"Error eliminando producto {product_id}: {e}")
-        return False
-
-def is_valid_cloudinary_image(image_url):
-    """Verificar si la URL de imagen es válida de Cloudinary"""
-    if not image_url:
-        return False
-    
-    # URLs válidas de Cloudinary deben tener un timestamp/versión específico
-    valid_patterns = [
-        '/v1751293',  # URLs con timestamp específico generadas por el upload
-        '/v1/gorros/producto_'  # URLs generadas recientemente
-    ]
-    
-    return any(pattern in image_url for pattern in valid_patterns)
+        print(f"Error eliminando productos: {e}")
+        return set()
 
 def main():
     """Función principal"""
-    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Mostrar qué se eliminaría sin eliminar nada")
+    args = parser.parse_args()
+
     # Verificar conexión
     try:
         response = requests.get(f"{API_URL}/health")
@@ -51,60 +62,49 @@ def main():
     except:
         print("❌ No se puede conectar al backend de Railway")
         return
-    
-    # Obtener productos actuales
-    print("\n📋 Analizando productos...")
-    products = get_current_products()
-    print(f"Total de productos: {len(products)}")
-    
-    # Clasificar productos
-    valid_products = []
-    invalid_products = []
-    
-    for product in products:
-        image_url = product.get('imagen_url', '')
-        if is_valid_cloudinary_image(image_url):
-            valid_products.append(product)
-        else:
-            invalid_products.append(product)
-    
+
+    # Verificar las imágenes en el servidor
+    print("\n🔎 Verificando imágenes de productos...")
+    try:
+        status = run_scan()
+        broken = get_broken_images()
+    except Exception as e:
+        print(f"Error verificando imágenes: {e}")
+        return
+    if status['error']:
+        print(f"❌ El escaneo terminó con error: {status['error']}")
+        return
+
+    missing = [p for p in broken if p['inexistente']]
+    failing = [p for p in broken if not p['inexistente']]
+
     print(f"\n📊 Análisis:")
-    print(f"✅ Productos con imágenes válidas: {len(valid_products)}")
-    print(f"❌ Productos sin imágenes válidas: {len(invalid_products)}")
-    
-    # Mostrar productos que se van a eliminar
-    if invalid_products:
-        print(f"\n🗑️  Productos que se eliminarán:")
-        for product in invalid_products:
-            print(f"- ID {product['id']}: {product['nombre']}")
-            print(f"  Imagen: {product.get('imagen_url', 'Sin imagen')}")
-    
-    # Confirmar eliminación
-    if invalid_products:
-        print(f"\n⚠️  Se eliminarán {len(invalid_products)} productos sin imágenes válidas.")
-        
-        # Eliminar productos sin imágenes válidas
-        deleted_count = 0
-        for product in invalid_products:
-            if delete_product(product['id']):
-                print(f"✅ Eliminado: {product['nombre']} (ID: {product['id']})")
-                deleted_count += 1
-            else:
-                print(f"❌ Error eliminando: {product['nombre']} (ID: {product['id']})")
-        
-        print(f"\n🎉 Limpieza completada!")
-        print(f"🗑️  Productos eliminados: {deleted_count}")
-        print(f"✅ Productos conservados: {len(valid_products)}")
-    else:
-        print("\n✅ Todos los productos tienen imágenes válidas. No hay nada que limpiar.")
-    
-    # Mostrar productos finales
-    print("\n📋 Productos finales:")
-    final_products = get_current_products()
-    print(f"Total: {len(final_products)} productos")
-    
-    for i, product in enumerate(final_products, 1):
-        print(f"{i}. {product['nombre']} - ${product['precio']}")
+    print(f"✅ Productos con imágenes válidas: {status['total'] - len(broken)}")
+    print(f"❌ Productos con imágenes inexistentes: {len(missing)}")
+    print(f"⚠️  Productos con errores que pueden ser transitorios: {len(failing)}")
+
+    if failing:
+        print(f"\n⚠️  No se eliminan (volver a verificar más tarde):")
+        for product in failing:
+            print(f"- ID {product['producto_id']}: {product['nombre']} - {product['error']}")
+            print(f"  Imagen: {product['imagen_url']}")
+
+    if not missing:
+        print("\n✅ Ningún producto tiene imágenes inexistentes. No hay nada que limpiar.")
+        return
+
+    print(f"\n🗑️  Productos que se eliminarán:")
+    for product in missing:
+        print(f"- ID {product['producto_id']}: {product['nombre']} - {product['error']}")
+        print(f"  Imagen: {product['imagen_url'] or 'Sin imagen'}")
+
+    if args.dry_run:
+        print("\nℹ️  Modo --dry-run: no se eliminó ningún producto")
+        return
+
+    deleted_ids = delete_products([p['producto_id'] for p in missing])
+    print(f"\n🎉 Limpieza completada!")
+    print(f"🗑️  Productos eliminados: {len(deleted_ids)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
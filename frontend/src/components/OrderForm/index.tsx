@@ -1,5 +1,5 @@
 "use client";
-import React, { useState } from "react";
+import React, { useRef, useState } from "react";
 import { PedidoRequest } from "@/types/product";
 import { orderAPI } from "@/lib/api";
 import emailjs from '@emailjs/browser';
@@ -16,7 +16,8 @@ interface OrderFormProps {
 }
 
 const OrderForm: React.FC<OrderFormProps> = ({ product, onClose, onSuccess }) => {
-  const [formData, setFormData] = useState<PedidoRequest>({
+  // El formulario es siempre de un solo producto
+  const [formData, setFormData] = useState<PedidoRequest & Required<Pick<PedidoRequest, "producto_id" | "producto_nombre" | "cantidad">>>({
     nombre: "",
     email: "",
     telefono: "",
@@ -28,6 +29,8 @@ const OrderForm: React.FC<OrderFormProps> = ({ product, onClose, onSuccess }) =>
   
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  // Una clave por pedido: los reintentos del mismo formulario no duplican el pedido
+  const idempotencyKey = useRef(crypto.randomUUID());
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -65,7 +68,7 @@ const OrderForm: React.FC<OrderFormProps> = ({ product, onClose, onSuccess }) =>
           ...formData,
           email_destino: "santinogiampietro7@gmail.com"
         };
-        await orderAPI.createOrder(orderData);
+        await orderAPI.createOrder(orderData, idempotencyKey.current);
       } catch (backendError) {
         console.log('Backend storage failed, but email was sent successfully');
       }
@@ -82,6 +85,7 @@ const OrderForm: React.FC<OrderFormProps> = ({ product, onClose, onSuccess }) =>
 
   const handleInputChange = (e: React.ChangeEvent<HTMLInputElement | HTMLTextAreaElement | HTMLSelectElement>) => {
     const { name, value } = e.target;
+    idempotencyKey.current = crypto.randomUUID();
     setFormData(prev => ({
       ...prev,
       [name]: name === 'cantidad' ? parseInt(value) || 1 : value
@@ -1,4 +1,4 @@
-import { Product, ProductCreate, PedidoRequest, PedidoResponse, ImageUploadResponse } from '@/types/product';
+import { Product, ProductCreate, PedidoRequest, PedidoResponse, ImageUploadResponse, CategoriasResponse } from '@/types/product';
 
 let API_URL = process.env.NEXT_PUBLIC_API_URL_PRODUCTION || process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
@@ -43,6 +43,7 @@ export const productAPI = {
     const params = new URLSearchParams();
     if (categoria) params.append('categoria', categoria);
     params.append('activo', activo.toString());
+    params.append('todos', 'true');
     
     const response = await fetch(`${API_URL}/productos?${params.toString()}`);
     const products = await handleResponse<Product[]>(response);
@@ -69,20 +70,21 @@ export const productAPI = {
   },
 
   // Obtener categorías
-  getCategories: async (): Promise<{ categorias: string[] }> => {
+  getCategories: async (): Promise<CategoriasResponse> => {
     const response = await fetch(`${API_URL}/categorias`);
-    return handleResponse<{ categorias: string[] }>(response);
+    return handleResponse<CategoriasResponse>(response);
   },
 };
 
 // API de Pedidos
 export const orderAPI = {
-  // Crear pedido
-  createOrder: async (pedido: PedidoRequest): Promise<PedidoResponse> => {
+  // Crear pedido. Reenviar con la misma idempotencyKey no registra un pedido duplicado
+  createOrder: async (pedido: PedidoRequest, idempotencyKey?: string): Promise<PedidoResponse> => {
     const response = await fetch(`${API_URL}/pedidos`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}),
       },
       body: JSON.stringify(pedido),
     });
@@ -91,7 +93,7 @@ export const orderAPI = {
 
   // Obtener pedidos (para uso interno)
   getOrders: async () => {
-    const response = await fetch(`${API_URL}/pedidos`);
+    const response = await fetch(`${API_URL}/pedidos?todos=true`);
     return handleResponse(response);
   },
 };
@@ -23,19 +23,45 @@ export type ProductCreate = {
   activo: boolean;
 };
 
+export type CategoriaResumen = {
+  categoria: string;
+  productos: number;
+  precio_min: number;
+  precio_max: number;
+  precio_mayorista_min?: number;
+};
+
+export type CategoriasResponse = {
+  categorias: string[];
+  resumen: CategoriaResumen[];
+};
+
+export type ItemPedido = {
+  producto_id: number;
+  cantidad: number;
+};
+
+export type ItemPedidoResponse = ItemPedido & {
+  producto_nombre: string;
+  precio_unitario?: number | null;
+};
+
+// Un solo producto (producto_id y cantidad) o un carrito (items)
 export type PedidoRequest = {
   nombre: string;
   email: string;
   telefono: string;
-  producto_id: number;
-  producto_nombre: string;
-  cantidad: number;
+  producto_id?: number;
+  producto_nombre?: string;
+  cantidad?: number;
+  items?: ItemPedido[];
   comentarios?: string;
 };
 
 export type PedidoResponse = {
   id: number;
   mensaje: string;
+  items: ItemPedidoResponse[];
 };
 
 export type ImageUploadResponse = {
@@ -52,6 +78,7 @@ export type Order = {
   producto_id: number;
   producto_nombre: string;
   cantidad: number;
+  items?: ItemPedidoResponse[];
   comentarios?: string;
   fecha_pedido?: string;
   estado: string;
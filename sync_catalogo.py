@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Sincroniza el catálogo con un archivo que describe el estado deseado.
+
+El archivo (YAML, JSON o CSV) lista los productos como deberían quedar. El
+backend compara contra la base en una sola pasada (POST /productos/sync),
+emparejando por nombre, y aplica en una sola transacción solo lo que cambia:
+crea los que faltan, actualiza los campos distintos y elimina los que sobran
+(incluidos los duplicados). Reemplaza a los scripts de limpieza puntuales.
+
+Uso:
+    python sync_catalogo.py catalogo.yaml --dry-run        # Ver el plan sin aplicar nada
+    python sync_catalogo.py catalogo.yaml                  # Aplicar
+    python sync_catalogo.py gorros.csv --categoria Gorros  # Solo tocar la categoría Gorros
+    python sync_catalogo.py catalogo.json --sin-eliminar   # No eliminar los que falten en el archivo
+
+Formato: una lista de productos con los campos de POST /productos (nombre, precio,
+descripcion, imagen_url, categoria, stock, precio_mayorista, minimo_mayorista,
+activo). En YAML y JSON la lista puede estar en la raíz o bajo la clave
+"productos". En CSV, una fila por producto con esos nombres de columna. Los
+campos opcionales omitidos (o con la celda vacía) no se modifican en los
+productos existentes y toman el valor por defecto en los nuevos.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+import requests
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Configuración
+API_URL = os.getenv("API_URL", "https://nextjs-ecommerce-template-main-production.up.railway.app")  # URL de Railway en producción
+
+# Conversión de las columnas no textuales del CSV
+COLUMNAS_CSV = {
+    "precio": float,
+    "precio_mayorista": float,
+    "stock": int,
+    "minimo_mayorista": int,
+    "activo": lambda valor: valor.strip().lower() in ("1", "true", "si", "sí", "yes"),
+}
+
+def read_csv(path):
+    products = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            product = {}
+            for column, value in row.items():
+                if column is None or value is None or value.strip() == "":
+                    continue
+                column, value = column.strip(), value.strip()
+                try:
+                    product[column] = COLUMNAS_CSV[column](value) if column in COLUMNAS_CSV else value
+                except ValueError:
+                    # Se envía tal cual: el backend lo informa como error del ítem
+                    product[column] = value
+            products.append(product)
+    return products
+
+def read_catalog(path):
+    """Leer la lista de productos del archivo según su extensión"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return read_csv(path)
+    with open(path, encoding="utf-8") as f:
+        if extension in (".yaml", ".yml"):
+            if yaml is None:
+                sys.exit("❌ Para leer YAML hace falta PyYAML: pip install pyyaml")
+            data = yaml.safe_load(f)
+        elif extension == ".json":
+            data = json.load(f)
+        else:
+            sys.exit(f"❌ Formato no soportado: {extension} (usar .yaml, .yml, .json o .csv)")
+    if isinstance(data, dict):
+        data = data.get("productos")
+    if not isinstance(data, list):
+        sys.exit("❌ El archivo debe contener una lista de productos (en la raíz o bajo 'productos')")
+    return data
+
+def print_plan(result, dry_run):
+    plan = result['plan']
+    for product in plan['crear']:
+        suffix = f" (ID: {product['id']})" if product['id'] else ""
+        print(f"➕ Crear: {product['nombre']}{suffix}")
+    for product in plan['actualizar']:
+        print(f"✏️  Actualizar: {product['nombre']} (ID: {product['id']})")
+        for field, change in product['cambios'].items():
+            print(f"     {field}: {change['antes']!r} → {change['despues']!r}")
+    for product in plan['eliminar']:
+        print(f"🗑️  Eliminar: {product['nombre']} (ID: {product['id']})")
+
+    verb = "a crear" if dry_run else "creados"
+    print(f"\n📊 {result['creados']} {verb}, {result['actualizados']} actualizados, "
+          f"{result['eliminados']} eliminados, {result['sin_cambios']} sin cambios")
+    if dry_run:
+        print("ℹ️  Modo --dry-run: no se aplicó ningún cambio")
+    elif result['aplicado']:
+        print("✅ Cambios aplicados")
+    else:
+        print("✅ El catálogo ya estaba sincronizado")
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archivo", help="Catálogo deseado (.yaml, .yml, .json o .csv)")
+    parser.add_argument("--dry-run", action="store_true", help="Mostrar el plan sin aplicar cambios")
+    parser.add_argument("--sin-eliminar", action="store_true", help="No eliminar los productos que no estén en el archivo")
+    parser.add_argument("--categoria", action="append", help="Sincronizar solo esta categoría (se puede repetir)")
+    args = parser.parse_args()
+
+    products = read_catalog(args.archivo)
+    print(f"📋 {len(products)} productos en {args.archivo}")
+
+    payload = {"productos": products, "eliminar": not args.sin_eliminar}
+    if args.categoria:
+        payload["categorias"] = args.categoria
+    try:
+        response = requests.post(
+            f"{API_URL}/productos/sync",
+            params={"dry_run": "true" if args.dry_run else "false"},
+            json=payload,
+        )
+    except requests.RequestException as e:
+        sys.exit(f"❌ No se puede conectar al backend ({API_URL}): {e}")
+
+    if response.status_code == 422:
+        detail = response.json()['detail']
+        print(f"❌ {detail['mensaje'] if isinstance(detail, dict) else detail}")
+        for result in detail.get('resultados', []) if isinstance(detail, dict) else []:
+            if not result['ok']:
+                print(f"   Ítem {result['indice']}: {result['error']}")
+        sys.exit(1)
+    if not response.ok:
+        sys.exit(f"❌ Error {response.status_code}: {response.text}")
+
+    print_plan(response.json(), args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -50,31 +50,34 @@ GORROS_REALES = [
 def get_current_products():
     """Obtener productos actuales"""
     try:
-        response = requests.get(f"{API_URL}/productos")
+        response = requests.get(f"{API_URL}/productos", params={"todos": "true"})
         response.raise_for_status()
         return response.json()
     except Exception as e:
         print(f"Error obteniendo productos: {e}")
         return []
 
-def delete_product(product_id):
-    """Eliminar un producto"""
+def delete_products(product_ids):
+    """Eliminar varios productos en una sola solicitud; devuelve los IDs eliminados"""
+    if not product_ids:
+        return set()
     try:
-        response = requests.delete(f"{API_URL}/productos/{product_id}")
-        return response.status_code == 200
+        response = requests.delete(f"{API_URL}/productos/bulk", json={"ids": product_ids})
+        response.raise_for_status()
+        return {r['id'] for r in response.json()['resultados'] if r['ok']}
     except Exception as e:
-        print(f"Error eliminando producto {product_id}: {e}")
-        return False
+        print(f"Error eliminando productos: {e}")
+        return set()
 
-def create_product(product_data):
-    """Crear un nuevo producto"""
+def create_products(products_data):
+    """Crear varios productos en una sola solicitud; devuelve un resultado por producto"""
     try:
-        response = requests.post(f"{API_URL}/productos", json=product_data)
+        response = requests.post(f"{API_URL}/productos/bulk", json=products_data)
         response.raise_for_status()
-        return response.json()
+        return response.json()['resultados']
     except Exception as e:
-        print(f"Error creando producto: {e}")
-        return None
+        print(f"Error creando productos: {e}")
+        return [{"ok": False, "error": str(e)} for _ in products_data]
 
 def main():
     """Función principal"""
@@ -95,16 +98,17 @@ def main():
     
     # Eliminar productos de ejemplo existentes
     print("\n🧹 Eliminando productos de ejemplo...")
-    for product in current_products:
-        if 'sample_gorros' in product.get('imagen_url', ''):
-            if delete_product(product['id']):
-                print(f"✅ Eliminado: {product['nombre']}")
-            else:
-                print(f"❌ Error eliminando: {product['nombre']}")
+    samples = [p for p in current_products if 'sample_gorros' in p.get('imagen_url', '')]
+    deleted_ids = delete_products([p['id'] for p in samples])
+    for product in samples:
+        if product['id'] in deleted_ids:
+            print(f"✅ Eliminado: {product['nombre']}")
+        else:
+            print(f"❌ Error eliminando: {product['nombre']}")
     
     # Crear productos con gorros reales
     print("\n🎨 Creando productos con gorros reales...")
-    created_count = 0
+    products_data = []
     
     for gorro in GORROS_REALES:
         # Construir URL de Cloudinary
@@ -121,13 +125,15 @@ def main():
             "minimo_mayorista": 5,
             "activo": True
         }
-        
-        result = create_product(product_data)
-        if result:
+        products_data.append(product_data)
+    
+    created_count = 0
+    for gorro, result in zip(GORROS_REALES, create_products(products_data)):
+        if result['ok']:
             print(f"✅ Creado: {gorro['nombre']} (ID: {result['id']})")
             created_count += 1
         else:
-            print(f"❌ Error creando: {gorro['nombre']}")
+            print(f"❌ Error creando: {gorro['nombre']} - {result['error']}")
     
     print(f"\n🎉 Proceso completado!")
     print(f"📊 Productos creados: {created_count}")
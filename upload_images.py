@@ -1,37 +1,41 @@
 #!/usr/bin/env python3
 """
-Script para subir imágenes de gorros a Cloudinary via backend y actualizar PostgreSQL.
-Ejecutar este script después de colocar las imágenes de gorros en la carpeta 'gorros_images/'
+Importador de imágenes de gorros: sube una carpeta de fotos via backend y crea un
+producto por imagen.
+
+- Recorre el directorio (incluidas subcarpetas) y sube varias imágenes a la vez
+  con un cliente HTTP asíncrono que reutiliza conexiones.
+- Guarda el progreso en un manifiesto JSON dentro del directorio: si la
+  ejecución se corta, al volver a correrla retoma donde quedó sin subir ni
+  crear productos repetidos.
+- Crea los productos en lotes con POST /productos/bulk.
+- Al final muestra estadísticas de velocidad.
+
+Uso:
+    python upload_images.py [gorros_images] [--concurrencia 8] [--lote 200] [--eliminar-ejemplos]
 """
 
+import argparse
+import asyncio
+import json
+import mimetypes
 import os
-import requests
-from pathlib import Path
+import time
+import unicodedata
+
+import httpx
 
 # Configuración
-API_URL = "https://nextjs-ecommerce-template-main-production.up.railway.app"  # URL de Railway en producción
+API_URL = os.getenv("API_URL", "https://nextjs-ecommerce-template-main-production.up.railway.app")  # URL de Railway en producción
 IMAGES_DIR = "gorros_images"  # Directorio con las imágenes de gorros
+MANIFEST_NAME = ".import_manifest.json"
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+MAX_RETRIES = 3
 
-# Primero eliminar productos de ejemplo
-def delete_sample_products():
-    try:
-        response = requests.get(f"{API_URL}/productos")
-        products = response.json()
-        for product in products:
-            if 'sample_gorros' in product['imagen_url']:
-                print(f"Eliminando producto de ejemplo: {product['nombre']}")
-                delete_response = requests.delete(f"{API_URL}/productos/{product['id']}")
-                if delete_response.status_code == 200:
-                    print(f"✅ Eliminado producto ID {product['id']}")
-                else:
-                    print(f"❌ Error eliminando producto ID {product['id']}")
-    except Exception as e:
-        print(f"Error eliminando productos de ejemplo: {e}")
-
-# Lista de nombres descriptivos para los gorros
+# Nombres descriptivos que se asignan, en orden, a las imágenes nuevas; después se usa el nombre del archivo
 GORROS_NOMBRES = [
     "Gorro Verde Premium",
-    "Gorro Azul Especial", 
+    "Gorro Azul Especial",
     "Gorro Rojo Clásico",
     "Gorro Negro Elegante",
     "Gorro Blanco Invernal",
@@ -53,119 +57,263 @@ GORROS_NOMBRES = [
     "Gorro Salmón Suave"
 ]
 
-def upload_image(file_path):
-    """Subir imagen al backend usando el endpoint /upload-image"""
-    try:
-        filename = os.path.basename(file_path)
-        with open(file_path, 'rb') as file:
-            files = {'file': (filename, file, 'image/jpeg')}
-            response = requests.post(f"{API_URL}/upload-image", files=files, timeout=30)
-            response.raise_for_status()
-            return response.json()
-    except Exception as e:
-        print(f"Error subiendo {file_path}: {e}")
-        return None
+class Manifest:
+    """Progreso de la importación: por archivo, su URL subida y el ID del producto creado"""
 
-def create_product_with_image(nombre, image_url):
-    """Crear un nuevo producto con imagen en PostgreSQL via API"""
-    try:
-        product_data = {
-            "nombre": nombre,
-            "precio": 2500.0,  # Precio base
-            "descripcion": f"{nombre} de alta calidad. Material premium, muy cómodo y perfecto para el invierno.",
-            "imagen_url": image_url,
-            "categoria": "Gorros",
-            "stock": 50,
-            "precio_mayorista": 2000.0,
-            "minimo_mayorista": 5,
-            "activo": True
-        }
-        
-        response = requests.post(f"{API_URL}/productos", json=product_data, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error creando producto {nombre}: {e}")
-        return None
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get("archivos", {})
 
-def main():
-    """Función principal para subir todas las imágenes"""
-    
-    # Verificar que existe el directorio de imágenes
-    if not os.path.exists(IMAGES_DIR):
-        print(f"Creando directorio {IMAGES_DIR}/")
-        os.makedirs(IMAGES_DIR)
-        print(f"Por favor, coloca las 21 imágenes de gorros en {IMAGES_DIR}/ y ejecuta el script nuevamente.")
+    def save(self):
+        # Escritura atómica: un corte a mitad de escritura no pierde el progreso anterior
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"api_url": API_URL, "archivos": self.files}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+class Stats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.uploaded = 0
+        self.reused = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.created = 0
+        self.errors = 0
+
+    def report(self, skipped):
+        elapsed = time.perf_counter() - self.start
+        print(f"\n🎉 Importación completada en {elapsed:.1f} s")
+        print(f"🖼️  Imágenes subidas: {self.uploaded} ({self.reused} ya estaban en el servidor)")
+        print(f"⏭️  Ya importadas en ejecuciones anteriores: {skipped}")
+        print(f"📦 Productos creados: {self.created}")
+        print(f"❌ Errores: {self.errors}")
+        if elapsed > 0 and self.uploaded:
+            print(f"⚡ {self.uploaded / elapsed:.1f} imágenes/s, {self.bytes_sent / elapsed / 1024 / 1024:.2f} MB/s enviados")
+        if self.bytes_saved:
+            print(f"💾 Ahorro por optimización en el servidor: {self.bytes_saved / 1024 / 1024:.1f} MB")
+
+def find_images(directory):
+    """Rutas relativas de todas las imágenes del directorio, en orden estable"""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.lower().endswith(EXTENSIONS) and not name.startswith('.'):
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return found
+
+def name_from_file(rel_path):
+    stem = os.path.splitext(os.path.basename(rel_path))[0]
+    return " ".join(stem.replace("_", " ").replace("-", " ").split()).capitalize()
+
+def name_key(nombre):
+    """Clave con la que el backend detecta nombres repetidos: sin mayúsculas, acentos ni espacios de más"""
+    texto = unicodedata.normalize("NFKD", nombre.lower())
+    return " ".join("".join(c for c in texto if not unicodedata.combining(c)).split())
+
+def unique_name(base, used):
+    """`base`, o `base 2`, `base 3`... si ya está en uso; lo marca como usado"""
+    nombre, numero = base, 2
+    while name_key(nombre) in used:
+        nombre = f"{base} {numero}"
+        numero += 1
+    used.add(name_key(nombre))
+    return nombre
+
+def product_with_image(nombre, image_url, args):
+    """Datos de un producto nuevo con imagen"""
+    return {
+        "nombre": nombre,
+        "precio": args.precio,
+        "descripcion": f"{nombre} de alta calidad. Material premium, muy cómodo y perfecto para el invierno.",
+        "imagen_url": image_url,
+        "categoria": args.categoria,
+        "stock": args.stock,
+        "precio_mayorista": args.precio_mayorista,
+        "minimo_mayorista": 5,
+        "activo": True
+    }
+
+async def delete_sample_products(client):
+    response = await client.get("/productos", params={"todos": "true"})
+    response.raise_for_status()
+    samples = [p for p in response.json() if 'sample_gorros' in p['imagen_url']]
+    if not samples:
+        return
+    response = await client.request("DELETE", "/productos/bulk", json={"ids": [p['id'] for p in samples]})
+    response.raise_for_status()
+    print(f"✅ Eliminados {response.json()['eliminados']} productos de ejemplo")
+
+async def upload_image(client, directory, rel_path):
+    """Subir una imagen al backend usando el endpoint /upload-image"""
+    path = os.path.join(directory, rel_path)
+    content_type = mimetypes.guess_type(path)[0] or 'image/jpeg'
+    # Se reabre en cada intento: httpx consume el archivo al enviarlo
+    for attempt in range(MAX_RETRIES):
+        try:
+            with open(path, 'rb') as file:
+                response = await client.post(
+                    "/upload-image", files={'file': (os.path.basename(path), file, content_type)}
+                )
+            if response.status_code < 500:
+                break
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+        if attempt < MAX_RETRIES - 1:
+            await asyncio.sleep(2 ** attempt)
+    response.raise_for_status()
+    return response.json()
+
+async def create_products(client, manifest, batch, args, stats):
+    """Crear en una sola solicitud los productos de un lote de archivos ya subidos"""
+    products_data = [product_with_image(manifest.files[rel]["nombre"], manifest.files[rel]["url"], args) for rel in batch]
+    # Sin reintentos: si la respuesta se pierde, el lote pudo haberse creado igual. La próxima
+    # ejecución lo reconoce por las URLs de imagen en lugar de duplicarlo
+    response = await client.post("/productos/bulk", json=products_data)
+    response.raise_for_status()
+    for rel, result in zip(batch, response.json()['resultados']):
+        if result['ok']:
+            manifest.files[rel]["producto_id"] = result['id']
+            stats.created += 1
+        else:
+            print(f"❌ Error creando producto para {rel}: {result['error']}")
+            stats.errors += 1
+    # Guardar enseguida: un producto creado que no queda en el manifiesto se duplicaría al reanudar
+    manifest.save()
+    print(f"📦 Lote de {len(batch)} productos creado")
+
+async def run(args):
+    directory = args.directorio
+    if not os.path.isdir(directory):
+        print(f"Creando directorio {directory}/")
+        os.makedirs(directory)
+        print(f"Por favor, coloca las imágenes de gorros en {directory}/ y ejecuta el script nuevamente.")
         return
-    
-    # Obtener lista de imágenes
-    image_files = [f for f in os.listdir(IMAGES_DIR) 
-                   if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]
-    
-    if not image_files:
-        print(f"No se encontraron imágenes en {IMAGES_DIR}/")
-        print("Formatos soportados: .png, .jpg, .jpeg, .webp")
+
+    images = find_images(directory)
+    if not images:
+        print(f"No se encontraron imágenes en {directory}/")
+        print(f"Formatos soportados: {', '.join(EXTENSIONS)}")
         return
-    
-    print(f"Encontradas {len(image_files)} imágenes")
-    
-    # Verificar conexión con el backend
-    try:
-        response = requests.get(f"{API_URL}/health")
+
+    manifest = Manifest(args.manifiesto or os.path.join(directory, MANIFEST_NAME))
+
+    limits = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    timeout = httpx.Timeout(120.0, connect=10.0)
+    async with httpx.AsyncClient(base_url=API_URL, limits=limits, timeout=timeout) as client:
+        # Verificar conexión con el backend
+        try:
+            response = await client.get("/health")
+            response.raise_for_status()
+            print(f"✅ Conexión con backend establecida - {response.json()}")
+        except httpx.HTTPError:
+            print("❌ No se puede conectar al backend. Asegúrate de que esté ejecutándose.")
+            print(f"URL configurada: {API_URL}")
+            return
+
+        if args.eliminar_ejemplos:
+            print("\n🧹 Eliminando productos de ejemplo...")
+            await delete_sample_products(client)
+
+        # Productos existentes por URL de imagen. Reconoce un lote creado cuyo ID no llegó al
+        # manifiesto (corte justo después de crearlo) y las imágenes que el servidor ya tenía
+        # con un producto asociado
+        response = await client.get("/productos", params={"todos": "true"})
         response.raise_for_status()
-        backend_info = response.json()
-        print(f"✅ Conexión con backend establecida - {backend_info}")
-    except:
-        print("❌ No se puede conectar al backend. Asegúrate de que esté ejecutándose.")
-        print(f"URL configurada: {API_URL}")
-        return
-    
-    # Eliminar productos de ejemplo
-    print("\n🧹 Eliminando productos de ejemplo...")
-    delete_sample_products()
-    
-    # Subir imágenes y crear productos
-    created_count = 0
-    
-    for i, image_file in enumerate(image_files[:21]):  # Máximo 21 imágenes
-        file_path = os.path.join(IMAGES_DIR, image_file)
-        print(f"\n[{i+1}/{len(image_files[:21])}] Subiendo {image_file}...")
-        
-        # Subir imagen a Cloudinary
-        upload_result = upload_image(file_path)
-        if upload_result:
-            image_url = upload_result['url']  # Cloudinary ya devuelve la URL completa
-            print(f"✅ Imagen subida a Cloudinary: {image_url}")
-            
-            # Crear producto con imagen
-            if i < len(GORROS_NOMBRES):
-                nombre_gorro = GORROS_NOMBRES[i]
-                product_result = create_product_with_image(nombre_gorro, image_url)
-                if product_result:
-                    print(f"✅ Producto '{nombre_gorro}' creado con ID: {product_result['id']}")
-                    created_count += 1
-                else:
-                    print(f"❌ Error creando producto '{nombre_gorro}'")
+        products = response.json()
+        existing = {p['imagen_url']: p['id'] for p in products}
+        for entry in manifest.files.values():
+            if entry.get("url") in existing and "producto_id" not in entry:
+                entry["producto_id"] = existing[entry["url"]]
+
+        # Asignar nombre a las imágenes sin producto; las ya importadas conservan el suyo. El
+        # backend rechaza (409) un nombre que ya usa otro producto activo, así que los nombres
+        # repetidos, en el catálogo o entre archivos, se numeran. También se corrigen los de
+        # ejecuciones anteriores que chocaron: de otro modo fallarían en cada reintento
+        used_names = {name_key(p['nombre']) for p in products if p['activo']}
+        used_names.update(name_key(entry["nombre"]) for entry in manifest.files.values() if "producto_id" in entry)
+        free_names = [n for n in GORROS_NOMBRES if name_key(n) not in used_names]
+        for rel in images:
+            entry = manifest.files.setdefault(rel, {})
+            if "producto_id" in entry:
+                continue
+            if "nombre" not in entry:
+                entry["nombre"] = free_names.pop(0) if free_names else name_from_file(rel)
+            entry["nombre"] = unique_name(entry["nombre"], used_names)
+        manifest.save()
+
+        done = [rel for rel in images if "producto_id" in manifest.files[rel]]
+        to_upload = [rel for rel in images if "url" not in manifest.files[rel]]
+        ready = [rel for rel in images if "url" in manifest.files[rel] and "producto_id" not in manifest.files[rel]]
+        print(f"\n📋 {len(images)} imágenes: {len(done)} ya importadas, {len(ready)} subidas sin producto, {len(to_upload)} por subir")
+
+        stats = Stats()
+        semaphore = asyncio.Semaphore(args.concurrencia)
+        batch_lock = asyncio.Lock()
+        last_save = time.monotonic()
+
+        async def flush(force=False):
+            nonlocal ready
+            async with batch_lock:
+                while ready and (force or len(ready) >= args.lote):
+                    batch, ready = ready[:args.lote], ready[args.lote:]
+                    await create_products(client, manifest, batch, args, stats)
+
+        async def upload(rel):
+            nonlocal last_save
+            async with semaphore:
+                try:
+                    result = await upload_image(client, directory, rel)
+                except Exception as e:
+                    print(f"❌ Error subiendo {rel}: {e}")
+                    stats.errors += 1
+                    return
+            manifest.files[rel]["url"] = result['url']
+            stats.uploaded += 1
+            stats.bytes_sent += os.path.getsize(os.path.join(directory, rel))
+            stats.reused += bool(result.get('reused'))
+            stats.bytes_saved += result.get('saved_bytes') or 0
+            print(f"✅ [{stats.uploaded}/{len(to_upload)}] {rel} → {result['url']}")
+            if result['url'] in existing:
+                manifest.files[rel]["producto_id"] = existing[result['url']]
             else:
-                print(f"⚠️  Imagen subida pero sin nombre asignado (índice {i})")
-        else:
-            print(f"❌ Error subiendo {image_file}")
-    
-    print(f"\n🎉 Proceso completado!")
-    print(f"📊 Productos creados: {created_count}")
-    print(f"🖼️  Imágenes procesadas: {len(image_files[:21])}")
-    
-    # Mostrar productos creados
-    print("\n📋 Productos con imágenes de Cloudinary:")
+                ready.append(rel)
+            # Guardar el progreso cada tanto y no en cada imagen: con miles de archivos sería cuadrático
+            if time.monotonic() - last_save > 2:
+                manifest.save()
+                last_save = time.monotonic()
+            await flush()
+
+        try:
+            await flush()
+            await asyncio.gather(*(upload(rel) for rel in to_upload))
+            await flush(force=True)
+        finally:
+            manifest.save()
+
+    stats.report(skipped=len(done))
+
+def main():
+    """Función principal para importar todas las imágenes"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directorio", nargs="?", default=IMAGES_DIR)
+    parser.add_argument("--concurrencia", type=int, default=8, help="Subidas simultáneas")
+    parser.add_argument("--lote", type=int, default=200, help="Productos por solicitud a /productos/bulk")
+    parser.add_argument("--manifiesto", help=f"Ruta del manifiesto (por defecto <directorio>/{MANIFEST_NAME})")
+    parser.add_argument("--categoria", default="Gorros")
+    parser.add_argument("--precio", type=float, default=2500.0)  # Precio base
+    parser.add_argument("--precio-mayorista", type=float, default=2000.0)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--eliminar-ejemplos", action="store_true", help="Eliminar antes los productos de ejemplo")
     try:
-        response = requests.get(f"{API_URL}/productos")
-        response.raise_for_status()
-        products = response.json()
-        for product in products:
-            if 'cloudinary' in product['imagen_url']:
-                print(f"- {product['nombre']}: {product['imagen_url']}")
-    except Exception as e:
-        print(f"Error obteniendo productos: {e}")
+        asyncio.run(run(parser.parse_args()))
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrumpido. El progreso quedó en el manifiesto: ejecuta el script de nuevo para continuar")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()